@@ -0,0 +1,227 @@
+# Dojima, a markets client.
+# Copyright (C) 2012-2013 Emery Hemingway
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Market data collection without the GUI, for dojima --daemon.
+
+The exchanges and markets configured through the commodity mappings are
+polled by the same request scheduler as the GUI, and updates are
+written to clients of a local socket as lines of JSON, one message per
+line:
+
+  {"exchange": "btce", "market": "btc_usd", "stream": "ticker",
+   "last": "101.5"}
+  {"exchange": "btce", "market": "btc_usd", "stream": "depth",
+   "seq": 12, "side": "asks", "levels": [[101.6, 0.5], [101.9, 0]]}
+  {"exchange": "btce", "market": "btc_usd", "stream": "trades",
+   "trades": [[1370000000, 101.5, 0.25, 1234567]]}
+
+Trades are (epoch, price, amount, id), oldest first, and each is sent
+once. Depth levels at an amount of zero were removed from the book. A
+client is sent the last ticker values and a depth snapshot, with
+"snapshot" true, of each market when it connects, and depth sequence
+numbers follow on from the snapshot.
+
+The data is only kept on disk, in the tick stores, when recording is
+asked for with --record-ticks.
+"""
+
+import json
+import logging
+
+from PyQt4 import QtCore, QtNetwork
+
+import dojima.data.market
+import dojima.exchanges
+import dojima.markets
+#This next import registers the exchanges into dojima.exchanges
+import dojima.exchange_modules
+
+
+logger = logging.getLogger(__name__)
+
+STREAMS = ('ticker', 'depth', 'trades')
+# Clients that fall this many bytes behind are disconnected rather than
+# buffered for without limit
+MAXIMUM_BACKLOG = 4 * 1024 * 1024
+
+
+def start(server_name, streams=STREAMS, record=False, parent=None):
+    """Collect streams of every configured market and publish them to
+    clients of the local socket server_name, and if record is True keep
+    them in the tick stores as well."""
+    publisher = Publisher(server_name, parent)
+    collector = Collector(publisher, streams, record, parent)
+    collector.collect()
+    return collector
+
+
+class Publisher(QtCore.QObject):
+    """Writes messages to every client of a local socket."""
+
+    # a QLocalSocket that connected
+    connected = QtCore.pyqtSignal(object)
+
+    def __init__(self, server_name, parent=None):
+        super(Publisher, self).__init__(parent)
+        self.clients = list()
+        self.server = QtNetwork.QLocalServer(self)
+        self.server.newConnection.connect(self._accept)
+        # a daemon that did not exit cleanly leaves its socket behind
+        QtNetwork.QLocalServer.removeServer(server_name)
+        if not self.server.listen(server_name):
+            raise RuntimeError("could not listen on {}: {}".format(
+                server_name, self.server.errorString()))
+        logger.info("publishing to %s", self.server.fullServerName())
+
+    def _accept(self):
+        while self.server.hasPendingConnections():
+            socket = self.server.nextPendingConnection()
+            socket.disconnected.connect(
+                lambda socket=socket: self._drop(socket))
+            self.clients.append(socket)
+            logger.info("client connected, %s clients", len(self.clients))
+            self.connected.emit(socket)
+
+    def _drop(self, socket):
+        if socket in self.clients:
+            self.clients.remove(socket)
+            logger.info("client disconnected, %s clients", len(self.clients))
+        socket.deleteLater()
+
+    def publish(self, message):
+        if not self.clients:
+            return
+        line = self._encode(message)
+        for socket in list(self.clients):
+            self._write(socket, line)
+
+    def send(self, socket, message):
+        self._write(socket, self._encode(message))
+
+    def _encode(self, message):
+        return (json.dumps(message, separators=(',', ':')) + '\n').encode()
+
+    def _write(self, socket, line):
+        if socket.bytesToWrite() > MAXIMUM_BACKLOG:
+            logger.warning("dropping a client that is not reading")
+            self.clients.remove(socket)
+            socket.abort()
+            socket.deleteLater()
+            return
+        socket.write(line)
+
+
+class Collector(QtCore.QObject):
+    """Subscribes to the streams of markets and passes their updates to
+    a Publisher, and to the tick stores if record is True."""
+
+    def __init__(self, publisher, streams=STREAMS, record=False, parent=None):
+        super(Collector, self).__init__(parent)
+        self.publisher = publisher
+        self.streams = streams
+        self.record = record
+        # (exchange id, remote market id) -> exchange object
+        self.markets = dict()
+        self.depth_proxies = dict()
+        publisher.connected.connect(self._greet)
+
+    def collect(self):
+        """Subscribe to every market the commodity mappings configure."""
+        dojima.exchanges.refresh()
+        for market_proxy in dojima.markets.container:
+            for exchange_proxy in market_proxy:
+                for remote_market_id in exchange_proxy.getRemoteMarketIDs(market_proxy.pair):
+                    self.addMarket(exchange_proxy, remote_market_id)
+        logger.info("collecting %s from %s markets",
+                    ', '.join(self.streams), len(self.markets))
+
+    def addMarket(self, exchange_proxy, remote_market_id):
+        key = (exchange_proxy.id, remote_market_id)
+        if key in self.markets:
+            return
+        exchange = exchange_proxy.getExchangeObject()
+        self.markets[key] = exchange
+        if self.record:
+            # the tick store is only imported when it is used
+            import dojima.data.ticks
+            dojima.data.ticks.record(exchange_proxy.id, exchange, remote_market_id)
+
+        if 'ticker' in self.streams:
+            ticker_proxy = exchange.getTickerProxy(remote_market_id)
+            for stat in ('last', 'ask', 'bid'):
+                getattr(ticker_proxy, stat + '_signal').connect(
+                    lambda value, k=key, s=stat: self._publishTicker(k, {s: value}))
+            exchange.setTickerStreamState(True, remote_market_id)
+
+        if 'depth' in self.streams and hasattr(exchange, 'getDepthProxy'):
+            depth_proxy = exchange.getDepthProxy(remote_market_id)
+            self.depth_proxies[key] = depth_proxy
+            depth_proxy.book.changed.connect(
+                lambda sequence, side, diff, k=key: self._publishDepth(k, sequence, side, diff))
+            exchange.setStreamState('depth', True, remote_market_id)
+
+        if 'trades' in self.streams and hasattr(exchange, 'getTradesProxy'):
+            trades_proxy = exchange.getTradesProxy(remote_market_id)
+            trades_proxy.added.connect(
+                lambda trades, k=key: self._publishTrades(k, trades))
+            exchange.setStreamState('trades', True, remote_market_id)
+
+    def _message(self, key, stream):
+        return {'exchange': key[0], 'market': key[1], 'stream': stream}
+
+    def _ticker(self, key, values):
+        message = self._message(key, 'ticker')
+        for stat, value in values.items():
+            # Decimal values are sent as strings to keep their precision
+            message[stat] = str(value)
+        return message
+
+    def _publishTicker(self, key, values):
+        self.publisher.publish(self._ticker(key, values))
+
+    def _publishDepth(self, key, sequence, side, diff):
+        message = self._message(key, 'depth')
+        message['seq'] = sequence
+        message['side'] = side
+        message['levels'] = diff.T.tolist()
+        self.publisher.publish(message)
+
+    def _publishTrades(self, key, trades):
+        # only new trades are added, newest first with matplotlib dates
+        if not trades.shape[1]:
+            return
+        trades = trades[:, ::-1].copy()
+        trades[0] = dojima.data.market.num2epoch(trades[0])
+        message = self._message(key, 'trades')
+        message['trades'] = trades.T.tolist()
+        self.publisher.publish(message)
+
+    def _greet(self, socket):
+        """Send a new client the state of each market."""
+        for key, exchange in self.markets.items():
+            if 'ticker' in self.streams:
+                values = exchange.getTickerProxy(key[1]).values
+                if values:
+                    self.publisher.send(socket, self._ticker(key, values))
+            if key in self.depth_proxies:
+                sequence, asks, bids = self.depth_proxies[key].book.snapshot()
+                message = self._message(key, 'depth')
+                message['seq'] = sequence
+                message['snapshot'] = True
+                message['asks'] = asks.T.tolist()
+                message['bids'] = bids.T.tolist()
+                self.publisher.send(socket, message)
@@ -1,7 +1,9 @@
+import importlib.util
 
-try:
-    import numpy
-    import matplotlib
+# numpy and matplotlib are only imported once depth or trades are, this
+# just checks that they may be
+if (importlib.util.find_spec('numpy') is not None and
+    importlib.util.find_spec('matplotlib') is not None):
     all = ('depth', 'ticker', 'trades')
-except ImportError:
+else:
     all = ('ticker')
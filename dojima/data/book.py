@@ -0,0 +1,302 @@
+# Dojima, a markets client.
+# Copyright (C) 2012-2013 Emery Hemingway
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+
+import numpy as np
+from PyQt4 import QtCore
+
+
+logger = logging.getLogger(__name__)
+
+# Rows of a consolidated side
+PRICE, AMOUNT, VENUE = list(range(3))
+
+
+def invert(side):
+    """Return the offers of a market quoted the other way around, that is
+    with the base and counter commodities swapped, as offers of the same
+    market quoted in the counter commodity."""
+    side = side[:, side[0] > 0]
+    return np.vstack((1 / side[0], side[0] * side[1]))
+
+def merge(sides, descending=False):
+    """Merge sorted (price, amount) arrays into one sorted
+    (price, amount, venue) array, where venue is the index of the array
+    an offer came from."""
+    arrays = [ np.vstack((side, np.full(side.shape[1], venue)))
+               for venue, side in enumerate(sides)
+               if side is not None and side.shape[1] ]
+    if not arrays:
+        return np.empty((3, 0))
+    merged = np.hstack(arrays)
+    # each array is already sorted, a merge sort just joins the runs
+    if descending:
+        order = np.argsort(-merged[PRICE], kind='mergesort')
+    else:
+        order = np.argsort(merged[PRICE], kind='mergesort')
+    return merged[:, order]
+
+
+class BookSide(object):
+    """The price levels of one side of a book, best first."""
+
+    def __init__(self, descending=False):
+        self.descending = descending
+        self.levels = np.empty((2, 0))
+
+    def _sort(self, levels):
+        """Return levels summed by price and sorted best first."""
+        prices, index = np.unique(levels[PRICE], return_inverse=True)
+        amounts = np.bincount(index, weights=levels[AMOUNT],
+                              minlength=prices.size)
+        levels = np.vstack((prices, amounts))
+        if self.descending:
+            levels = levels[:, ::-1]
+        return levels
+
+    def _ascending(self):
+        if self.descending:
+            return self.levels[:, ::-1]
+        return self.levels
+
+    def replace(self, levels, top=False):
+        """Replace the levels and return those that changed, with removed
+        levels at an amount of zero. If top is True only levels as good
+        as the worst of the new levels are replaced."""
+        new = self._sort(levels)
+        old = self.levels
+        if top and new.shape[1]:
+            if self.descending:
+                deeper = old[:, old[PRICE] < new[PRICE, -1]]
+            else:
+                deeper = old[:, old[PRICE] > new[PRICE, -1]]
+            new = np.hstack((new, deeper))
+
+        removed = old[:, ~np.in1d(old[PRICE], new[PRICE])]
+        removed[AMOUNT] = 0
+
+        ascending = self._ascending()
+        index = np.searchsorted(ascending[PRICE], new[PRICE])
+        index[index == ascending.shape[1]] = 0
+        if ascending.shape[1]:
+            unchanged = ((ascending[PRICE, index] == new[PRICE]) &
+                         (ascending[AMOUNT, index] == new[AMOUNT]))
+        else:
+            unchanged = np.zeros(new.shape[1], dtype=bool)
+
+        self.levels = new
+        return self._sort(np.hstack((new[:, ~unchanged], removed)))
+
+    def apply(self, diff):
+        """Apply levels that changed, levels at an amount of zero are
+        removed, and return the diff as applied."""
+        diff = self._sort(diff)
+        kept = self.levels[:, ~np.in1d(self.levels[PRICE], diff[PRICE])]
+        added = diff[:, diff[AMOUNT] > 0]
+        self.levels = self._sort(np.hstack((kept, added)))
+        return diff
+
+
+class OrderBook(QtCore.QObject):
+    """The order book of one exchange market, kept as sorted price levels.
+
+    Snapshots are compared with the levels held and streamed diffs are
+    applied to them. Each time levels change, changed is emitted with a
+    sequence number, the side, and only the levels that changed, removed
+    levels having an amount of zero. A consumer that sees a gap in the
+    sequence should start again from snapshot().
+    """
+
+    changed = QtCore.pyqtSignal(int, str, np.ndarray)
+
+    def __init__(self, parent=None):
+        super(OrderBook, self).__init__(parent)
+        self.sides = {'asks': BookSide(), 'bids': BookSide(descending=True)}
+        self.sequence = 0
+
+    @property
+    def asks(self):
+        return self.sides['asks'].levels
+
+    @property
+    def bids(self):
+        return self.sides['bids'].levels
+
+    def apply(self, side, diff):
+        """Apply a (price, amount) diff to side, 'asks' or 'bids'."""
+        return self._publish(side, self.sides[side].apply(diff))
+
+    def replace(self, side, levels, top=False):
+        """Replace side, 'asks' or 'bids', with a snapshot of (price,
+        amount) levels, or only its top if top is True."""
+        return self._publish(side, self.sides[side].replace(levels, top))
+
+    def snapshot(self):
+        """Return the sequence number, asks and bids."""
+        return self.sequence, self.asks, self.bids
+
+    def _publish(self, side, diff):
+        if diff.shape[1]:
+            self.sequence += 1
+            self.changed.emit(self.sequence, side, diff)
+        return diff
+
+
+class ConsolidatedBook(QtCore.QObject):
+    """The depth of every exchange that trades a local market, as one book.
+
+    Only exchanges that have already been made are venues, the book does
+    not make exchanges itself, and attach() adds those made since. Prices
+    of exchanges that scale them to integers are divided by the scale, and
+    exchanges that trade the market the other way around, with the base
+    and counter commodities swapped by the commodity mapping, have their
+    asks and bids inverted into this market's terms. Each time the order
+    book of one exchange changes only the side that changed is merged
+    again. asks and bids carry (price, amount, venue) arrays, where venue
+    indexes venues, and ask_signal and bid_signal the best prices across
+    all venues.
+    """
+
+    asks = QtCore.pyqtSignal(np.ndarray)
+    bids = QtCore.pyqtSignal(np.ndarray)
+    ask_signal = QtCore.pyqtSignal(float)
+    bid_signal = QtCore.pyqtSignal(float)
+
+    def __init__(self, market_proxy, inverse_proxy=None, parent=None):
+        super(ConsolidatedBook, self).__init__(parent)
+        self.pair = market_proxy.pair
+        # (exchange proxy, remote market id, inverted) of every market
+        # that may become a venue
+        self.markets = list()
+        for proxy, inverted in ((market_proxy, False), (inverse_proxy, True)):
+            if proxy is None:
+                continue
+            for exchange_proxy in proxy:
+                for remote_market_id in exchange_proxy.getRemoteMarketIDs(proxy.pair):
+                    self.markets.append((exchange_proxy, remote_market_id, inverted))
+
+        # (exchange proxy, remote market id, inverted)
+        self.venues = list()
+        self.exchanges = list()
+        self.depth_proxies = list()
+        self.scales = list()
+        self.venue_asks = list()
+        self.venue_bids = list()
+        self.last_asks = None
+        self.last_bids = None
+        self.best_ask = None
+        self.best_bid = None
+        self.attach()
+
+    def attach(self):
+        """Add the markets of exchanges made since the book was, starting
+        them from a snapshot of their order books."""
+        added = False
+        for market in self.markets:
+            if market in self.venues:
+                continue
+            exchange_proxy, remote_market_id, inverted = market
+            exchange = getattr(exchange_proxy, 'exchange_object', None)
+            if exchange is None or not hasattr(exchange, 'getDepthProxy'):
+                continue
+            self._addVenue(market, exchange)
+            added = True
+
+        if added:
+            self._mergeAsks()
+            self._mergeBids()
+
+    def _addVenue(self, market, exchange):
+        exchange_proxy, remote_market_id, inverted = market
+        depth_proxy = exchange.getDepthProxy(remote_market_id)
+        venue = len(self.venues)
+        self.venues.append(market)
+        self.exchanges.append(exchange)
+        self.depth_proxies.append(depth_proxy)
+        self.scales.append(exchange.getScale(remote_market_id))
+
+        sequence, asks, bids = depth_proxy.book.snapshot()
+        self.venue_asks.append(None)
+        self.venue_bids.append(None)
+        self._setSide(venue, 'asks', asks)
+        self._setSide(venue, 'bids', bids)
+        depth_proxy.book.changed.connect(
+            lambda sequence, side, diff, v=venue: self._update(v, side))
+
+    def echo(self):
+        """Emit the last consolidated book and best prices again."""
+        if self.last_asks is not None:
+            self.asks.emit(self.last_asks)
+        if self.last_bids is not None:
+            self.bids.emit(self.last_bids)
+        if self.best_ask is not None:
+            self.ask_signal.emit(self.best_ask)
+        if self.best_bid is not None:
+            self.bid_signal.emit(self.best_bid)
+
+    def getVenue(self, venue):
+        """Return the exchange proxy and remote market id of a venue."""
+        exchange_proxy, remote_market_id, inverted = self.venues[int(venue)]
+        return exchange_proxy, remote_market_id
+
+    def refresh(self):
+        self.attach()
+        for depth_proxy in self.depth_proxies:
+            depth_proxy.refresh()
+
+    def _setSide(self, venue, side, levels):
+        """Store a side of a venue's book, levels being the side of the
+        venue's own book, asks or bids, in its own terms."""
+        inverted = self.venues[venue][2]
+        scale = self.scales[venue]
+        if scale != 1:
+            levels = np.vstack((levels[PRICE] / scale, levels[AMOUNT]))
+        if inverted:
+            levels = invert(levels)
+        if (side == 'asks') != inverted:
+            self.venue_asks[venue] = levels
+        else:
+            self.venue_bids[venue] = levels
+
+    def _update(self, venue, side):
+        sequence, asks, bids = self.depth_proxies[venue].book.snapshot()
+        if side == 'asks':
+            self._setSide(venue, side, asks)
+        else:
+            self._setSide(venue, side, bids)
+        if (side == 'asks') != self.venues[venue][2]:
+            self._mergeAsks()
+        else:
+            self._mergeBids()
+
+    def _mergeAsks(self):
+        self.last_asks = merge(self.venue_asks)
+        self.asks.emit(self.last_asks)
+        if self.last_asks.shape[1]:
+            best = float(self.last_asks[PRICE, 0])
+            if best != self.best_ask:
+                self.best_ask = best
+                self.ask_signal.emit(best)
+
+    def _mergeBids(self):
+        self.last_bids = merge(self.venue_bids, descending=True)
+        self.bids.emit(self.last_bids)
+        if self.last_bids.shape[1]:
+            best = float(self.last_bids[PRICE, 0])
+            if best != self.best_bid:
+                self.best_bid = best
+                self.bid_signal.emit(best)
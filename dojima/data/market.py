@@ -19,23 +19,53 @@ import time
 
 from decimal import Decimal
 
-import matplotlib.dates
 import numpy as np
 from PyQt4 import QtCore, QtGui
 
+import dojima.data.book
 import dojima.exchange
 
 
 logger = logging.getLogger(__name__)
 
 
-class TickerProxyDecimal(QtCore.QObject):
+# matplotlib dates are days since 0001-01-01 plus one, this is the
+# date of the epoch
+EPOCH_DATE = 719163.0
+SECONDS_PER_DAY = 86400.0
+
+def epoch2num(epochs):
+    """Convert seconds since the epoch to matplotlib dates, without
+    importing matplotlib, which a daemon need not have."""
+    return EPOCH_DATE + np.asarray(epochs) / SECONDS_PER_DAY
+
+def num2epoch(dates):
+    """Convert matplotlib dates back to seconds since the epoch."""
+    return (np.asarray(dates) - EPOCH_DATE) * SECONDS_PER_DAY
+
+
+class _TickerProxy(QtCore.QObject):
+
+    def __init__(self, parent=None):
+        super(_TickerProxy, self).__init__(parent)
+        self.values = dict()
+        for stat in ('last', 'ask', 'bid'):
+            signal = getattr(self, stat + '_signal')
+            signal.connect(lambda value, stat=stat: self.values.__setitem__(stat, value))
+
+    def echo(self):
+        """Emit the last known values again."""
+        for stat, value in list(self.values.items()):
+            getattr(self, stat + '_signal').emit(value)
+
+
+class TickerProxyDecimal(_TickerProxy):
     
     last_signal = QtCore.pyqtSignal(Decimal)
     ask_signal  = QtCore.pyqtSignal(Decimal)
     bid_signal  = QtCore.pyqtSignal(Decimal)
 
-class TickerProxyInt(QtCore.QObject):
+class TickerProxyInt(_TickerProxy):
     
     last_signal = QtCore.pyqtSignal(int)
     ask_signal  = QtCore.pyqtSignal(int)
@@ -54,38 +84,73 @@ class DepthProxy(_StatsProxy):
 
     asks = QtCore.pyqtSignal(np.ndarray)    
     bids = QtCore.pyqtSignal(np.ndarray)
-    
+
+    def __init__(self, marketId, parent=None):
+        super(DepthProxy, self).__init__(marketId, parent)
+        self.book = dojima.data.book.OrderBook(self)
+        self.last_asks = None
+        self.last_bids = None
+
+    def echo(self):
+        """Emit the last processed asks and bids again."""
+        if self.last_asks is not None:
+            self.asks.emit(self.last_asks)
+        if self.last_bids is not None:
+            self.bids.emit(self.last_bids)
+
     def refresh(self):
         self.exchange_obj.refreshDepth(self.market_id)
 
+    def processTop(self, asks, bids):
+        """Process the best offers of a book, keeping the deeper offers
+        that were last processed."""
+        if self.book.replace('asks', asks, top=True).shape[1]:
+            self._emitAsks()
+        if self.book.replace('bids', bids, top=True).shape[1]:
+            self._emitBids()
+
+    def processDiff(self, asks, bids):
+        """Process levels that changed, levels at an amount of zero having
+        been removed."""
+        if self.book.apply('asks', asks).shape[1]:
+            self._emitAsks()
+        if self.book.apply('bids', bids).shape[1]:
+            self._emitBids()
+
     def processAsks(self, asks):
+        if self.book.replace('asks', asks).shape[1]:
+            self._emitAsks()
+        elif self.last_asks is not None:
+            self.asks.emit(self.last_asks)
+
+    def processBids(self, bids):
+        if self.book.replace('bids', bids).shape[1]:
+            self._emitBids()
+        elif self.last_bids is not None:
+            self.bids.emit(self.last_bids)
+
+    def _emitAsks(self):
+        asks = self.book.asks
+        if not asks.shape[1]:
+            return
         mask = asks[0] < (asks[0,0] * 1.25)
         orders = asks[:,mask]
-        
-        i = 0
-        j = 1
-        stop = orders[0].size
-        while j < stop:
-            orders[1,j] += orders[1,i]
-            i += 1
-            j += 1
+        orders[1] = np.cumsum(orders[1])
         orders[1,0] = 0
 
+        self.last_asks = orders
         self.asks.emit(orders)
 
-    def processBids(self, bids):
+    def _emitBids(self):
+        bids = self.book.bids
+        if not bids.shape[1]:
+            return
         mask = bids[0] > (bids[0,0] * 0.75)
         orders = bids[:,mask]
-        
-        i = 0
-        j = 1
-        stop = orders[0].size
-        while j < stop:
-            orders[1,j] += orders[1,i]
-            i += 1
-            j += 1
+        orders[1] = np.cumsum(orders[1])
         orders[1,0] = 0
 
+        self.last_bids = orders
         self.bids.emit(orders)
         
 """
@@ -103,12 +168,12 @@ class QuotesProxy(QtCore.QObject):
         self.exchange_obj.refreshTrades(self.market_id)
 
     def processTrades(self, epochs, prices, amounts):
-        dates = matplotlib.dates.epoch2num(epochs)
+        dates = epoch2num(epochs)
         trades
 
         epochs = np.array(trade_data[0], dtype=np.int32)
-        prices = np.array(trade_data[1], dtype=np.float)
-        amounts = np.array(trade_data[2], dtype=np.float)
+        prices = np.array(trade_data[1], dtype=np.float64)
+        amounts = np.array(trade_data[2], dtype=np.float64)
 
         #epochs.dump('/tmp/epochs')
         #prices.dump('/tmp/prices')
@@ -157,7 +222,7 @@ class QuotesProxy(QtCore.QObject):
         self.quotes = np.array((dates,
                                 opens, closes,
                                 highs, lows,
-                                volumes), dtype=np.float).transpose()
+                                volumes), dtype=np.float64).transpose()
         self.save()
         self.refreshed_signal.emit(self.quotes)
 
@@ -201,8 +266,8 @@ class QuotesProxy(QtCore.QObject):
     def _process_trades(self, trade_data):
         "Trade data should be (dates, prices, amounts)"
         epochs = np.array(trade_data[0], dtype=np.int32)
-        prices = np.array(trade_data[1], dtype=np.float)
-        amounts = np.array(trade_data[2], dtype=np.float)
+        prices = np.array(trade_data[1], dtype=np.float64)
+        amounts = np.array(trade_data[2], dtype=np.float64)
 
         #epochs.dump('/tmp/epochs')
         #prices.dump('/tmp/prices')
@@ -251,7 +316,7 @@ class QuotesProxy(QtCore.QObject):
         self.quotes = np.array((dates,
                                 opens, closes,
                                 highs, lows,
-                                volumes), dtype=np.float).transpose()
+                                volumes), dtype=np.float64).transpose()
         self.save()
         self.refreshed_signal.emit(self.quotes)
 
@@ -262,9 +327,50 @@ class QuotesProxy(QtCore.QObject):
         self.quotes.dump(self.array_filename)
 """
 
+# Rows of the trades a TradesProxy emits
+DATE, PRICE, AMOUNT, ID = list(range(4))
+# Trades held in memory for each market
+MAXIMUM_TRADES = 4096
+
+
 class TradesProxy(_StatsProxy):
+    """The recent trades of a market, as (date, price, amount, id) rows
+    newest first, with matplotlib dates and exchange trade ids.
+
+    Trades are merged by id, so a refresh that overlaps the last only adds
+    the trades that are new. added carries just those, and is emitted
+    empty when a refresh found none. refreshed carries every trade held.
+    """
 
     refreshed = QtCore.pyqtSignal(np.ndarray)
+    added = QtCore.pyqtSignal(np.ndarray)
+
+    def __init__(self, marketId, parent=None):
+        super(TradesProxy, self).__init__(marketId, parent)
+        self.last_trades = None
+        # a callable returning up to a count of stored trades, newest
+        # first, for before the first refresh
+        self.history = None
+
+    def _trades(self):
+        if self.last_trades is None and self.history is not None:
+            trades = self.history(MAXIMUM_TRADES)
+            if trades.shape[1]:
+                self.last_trades = trades
+        return self.last_trades
+
+    def getCursor(self):
+        """Return the id and epoch of the newest trade held, or None."""
+        trades = self._trades()
+        if trades is None:
+            return None
+        return int(trades[ID, 0]), float(num2epoch(trades[DATE, 0]))
+
+    def echo(self):
+        """Emit the trades held again."""
+        trades = self._trades()
+        if trades is not None:
+            self.refreshed.emit(trades)
 
     def reload(self):
         # TODO this is a temporary method, remove it when fetching market data works
@@ -273,8 +379,29 @@ class TradesProxy(_StatsProxy):
     def refresh(self):
         self.exchange_obj.refreshTrades(self.market_id)
 
-    def processTrades(self, epochs, prices, amounts):
-        dates = matplotlib.dates.epoch2num(epochs)
-        # this needs to be float because unless time is rounded to the day, dates is a float
-        trades = np.array((dates, prices), dtype=np.float32).transpose()
-        return trades
+    def processTrades(self, trades):
+        """Merge trades, a sequence of (id, epoch, price, amount), and emit
+        those that were not held through added."""
+        held = self._trades()
+        if held is not None:
+            # trade ids only grow, anything older was seen already
+            cursor = held[ID, 0]
+            trades = [ trade for trade in trades if trade[0] > cursor ]
+        if not trades:
+            self.unchanged()
+            return
+
+        trades = np.array(trades, dtype=np.float64).T
+        ids, index = np.unique(trades[0], return_index=True)
+        trades = trades[:, index[::-1]]
+        added = np.vstack((epoch2num(trades[1]), trades[2], trades[3],
+                           trades[0]))
+        if held is None:
+            self.last_trades = added[:, :MAXIMUM_TRADES]
+        else:
+            self.last_trades = np.hstack((added, held))[:, :MAXIMUM_TRADES]
+        self.added.emit(added)
+
+    def unchanged(self):
+        """Note a refresh that found no new trades."""
+        self.added.emit(np.empty((4, 0)))
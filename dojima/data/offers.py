@@ -14,6 +14,8 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import bisect
+
 from PyQt4 import QtCore, QtGui
 
 """
@@ -32,20 +34,248 @@ ASK = 'a'
 BID = 'b'
 
 
-class Model(QtGui.QStandardItemModel):
+COLUMNS = 6
+
+# Columns shown as text, price and outstanding are decimals held
+# under UserRole for the offer delegates.
+TEXT_COLUMNS = (ID, TYPE, BASE, COUNTER)
+VALUE_COLUMNS = (PRICE, OUTSTANDING)
+
+
+class Model(QtCore.QAbstractTableModel):
+    """Open offers, held column by column and indexed by offer id.
+
+    setOffers() takes the whole list of offers from a refresh and only
+    inserts, removes, or changes the rows that differ, so views keep
+    their selection and scroll position. Offers are rows of
+    (id, price, outstanding, type, base, counter).
+    """
 
     def __init__(self, parent=None):
         super(Model, self).__init__(parent)
-        self.setColumnCount(6)
+        self.columns = [ list() for column in range(COLUMNS) ]
+        self.rows = dict()
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.columns[ID])
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return COLUMNS
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        column = index.column()
+        if role == QtCore.Qt.DisplayRole:
+            if column in TEXT_COLUMNS:
+                return self.columns[column][index.row()]
+        elif role == QtCore.Qt.UserRole:
+            if column in VALUE_COLUMNS:
+                return self.columns[column][index.row()]
+        return None
+
+    def findRow(self, offer_id):
+        """Return the row of an offer, or None."""
+        return self.rows.get(offer_id)
+
+    def getOffer(self, offer_id):
+        row = self.rows.get(offer_id)
+        if row is None:
+            return None
+        return tuple(column[row] for column in self.columns)
+
+    def addOffer(self, offer_id, price, outstanding, type_,
+                 base=None, counter=None):
+        """Add an offer, or update the offer with the same id."""
+        offer = (offer_id, price, outstanding, type_, base, counter)
+        row = self.rows.get(offer_id)
+        if row is None or offer_id is None:
+            row = self.rowCount()
+            self.beginInsertRows(QtCore.QModelIndex(), row, row)
+            for column, value in zip(self.columns, offer):
+                column.append(value)
+            if offer_id is not None:
+                self.rows[offer_id] = row
+            self.endInsertRows()
+        else:
+            self._setRow(row, offer)
+
+    def removeOffer(self, offer_id):
+        row = self.rows.get(offer_id)
+        if row is None:
+            return False
+        self._removeRows((row,))
+        return True
+
+    def clear(self):
+        self.beginResetModel()
+        for column in self.columns:
+            del column[:]
+        self.rows.clear()
+        self.endResetModel()
+
+    def setOffers(self, offers):
+        """Make the offers those of a refresh."""
+        offers = list(offers)
+        ids = set(offer[ID] for offer in offers)
+        self._removeRows([ row for row, offer_id in enumerate(self.columns[ID])
+                           if offer_id is None or offer_id not in ids ])
+        for offer in offers:
+            row = self.rows.get(offer[ID])
+            if row is None:
+                self.addOffer(*offer)
+            else:
+                self._setRow(row, offer)
+
+    def _setRow(self, row, offer):
+        changed = [ i for i, value in enumerate(offer)
+                    if self.columns[i][row] != value ]
+        if not changed:
+            return
+        for i in changed:
+            self.columns[i][row] = offer[i]
+        self.dataChanged.emit(self.index(row, min(changed)),
+                              self.index(row, max(changed)))
+
+    def _removeRows(self, rows):
+        if not rows:
+            return
+        # remove from the bottom up, so the rows yet to go stay put
+        for row in sorted(rows, reverse=True):
+            self.beginRemoveRows(QtCore.QModelIndex(), row, row)
+            for column in self.columns:
+                del column[row]
+            self.endRemoveRows()
+        self.rows = dict( (offer_id, row)
+                          for row, offer_id in enumerate(self.columns[ID])
+                          if offer_id is not None )
+
+
+class _OffersModel(QtGui.QAbstractProxyModel):
+    """The offers of one side of a market, from a Model of all offers.
 
-class _OffersModel(QtGui.QSortFilterProxyModel):
+    The source rows shown are kept in a sorted list that is updated from
+    the rows the source inserts, removes, or changes, rather than
+    filtering the whole source again. base and counter may be None for
+    exchanges whose offers are all of one market.
+    """
 
-    def __init__(self, model, parent=None):
-        super(_OffersModel, self).__init__(parent,
-                                           dynamicSortFilter=True,
-                                           filterKeyColumn=TYPE)
+    side = None
+
+    def __init__(self, model, base=None, counter=None, parent=None):
+        super(_OffersModel, self).__init__(parent)
+        self.base = base
+        self.counter = counter
+        self.source_rows = list()
         self.setSourceModel(model)
+        model.rowsInserted.connect(self._sourceRowsInserted)
+        model.rowsAboutToBeRemoved.connect(self._sourceRowsAboutToBeRemoved)
+        model.rowsRemoved.connect(self._sourceRowsRemoved)
+        model.dataChanged.connect(self._sourceDataChanged)
+        model.modelReset.connect(self._sourceReset)
+        self._sourceReset()
+
+    def _accepts(self, source_row):
+        columns = self.sourceModel().columns
+        return ((columns[TYPE][source_row] == self.side) and
+                (self.base is None or columns[BASE][source_row] == self.base) and
+                (self.counter is None or
+                 columns[COUNTER][source_row] == self.counter))
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return self.sourceModel().columnCount()
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.source_rows)
+
+    def index(self, row, column, parent=QtCore.QModelIndex()):
+        if (parent.isValid() or not 0 <= row < len(self.source_rows) or
+            not 0 <= column < COLUMNS):
+            return QtCore.QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index):
+        return QtCore.QModelIndex()
+
+    def mapToSource(self, index):
+        if not index.isValid():
+            return QtCore.QModelIndex()
+        return self.sourceModel().index(self.source_rows[index.row()],
+                                        index.column())
+
+    def mapFromSource(self, index):
+        if not index.isValid():
+            return QtCore.QModelIndex()
+        row = self._find(index.row())
+        if row is None:
+            return QtCore.QModelIndex()
+        return self.createIndex(row, index.column())
+
+    def _find(self, source_row):
+        row = bisect.bisect_left(self.source_rows, source_row)
+        if row < len(self.source_rows) and self.source_rows[row] == source_row:
+            return row
+        return None
 
+    def _insert(self, source_row):
+        row = bisect.bisect_left(self.source_rows, source_row)
+        self.beginInsertRows(QtCore.QModelIndex(), row, row)
+        self.source_rows.insert(row, source_row)
+        self.endInsertRows()
+
+    def _remove(self, row):
+        self.beginRemoveRows(QtCore.QModelIndex(), row, row)
+        del self.source_rows[row]
+        self.endRemoveRows()
+
+    def _sourceReset(self):
+        self.beginResetModel()
+        self.source_rows = [ row for row in range(self.sourceModel().rowCount())
+                             if self._accepts(row) ]
+        self.endResetModel()
+
+    def _sourceRowsInserted(self, parent, first, last):
+        count = last - first + 1
+        start = bisect.bisect_left(self.source_rows, first)
+        for i in range(start, len(self.source_rows)):
+            self.source_rows[i] += count
+        for source_row in range(first, last + 1):
+            if self._accepts(source_row):
+                self._insert(source_row)
+
+    def _sourceRowsAboutToBeRemoved(self, parent, first, last):
+        start = bisect.bisect_left(self.source_rows, first)
+        stop = bisect.bisect_right(self.source_rows, last)
+        if start == stop:
+            return
+        self.beginRemoveRows(QtCore.QModelIndex(), start, stop - 1)
+        del self.source_rows[start:stop]
+        self.endRemoveRows()
+
+    def _sourceRowsRemoved(self, parent, first, last):
+        count = last - first + 1
+        start = bisect.bisect_left(self.source_rows, first)
+        for i in range(start, len(self.source_rows)):
+            self.source_rows[i] -= count
+
+    def _sourceDataChanged(self, top_left, bottom_right):
+        for source_row in range(top_left.row(), bottom_right.row() + 1):
+            row = self._find(source_row)
+            if self._accepts(source_row):
+                if row is None:
+                    self._insert(source_row)
+                else:
+                    self.dataChanged.emit(
+                        self.index(row, top_left.column()),
+                        self.index(row, bottom_right.column()))
+            elif row is not None:
+                self._remove(row)
 
     def headerData(self, section, orientation, role):
         if role == QtCore.Qt.DisplayRole:
@@ -62,20 +292,15 @@ class _OffersModel(QtGui.QSortFilterProxyModel):
 
 class FilterAsksModel(_OffersModel):
 
+    side = ASK
     _price_label = QtCore.QCoreApplication.translate('OffersModel', "Ask",
                                                      "The label over the ask "
                                                      "price column")
 
-    def __init__(self, model, parent=None):
-        super(FilterAsksModel, self).__init__(model, parent)
-        self.setFilterFixedString(ASK)
-
 
 class FilterBidsModel(_OffersModel):
+
+    side = BID
     _price_label = QtCore.QCoreApplication.translate('OffersModel', "Bid",
                                                      "The label over the bid "
                                                      "price column")
-
-    def __init__(self, model, parent=None):
-        super(FilterBidsModel, self).__init__(model, parent)
-        self.setFilterFixedString(BID)
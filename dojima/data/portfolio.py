@@ -0,0 +1,268 @@
+# Dojima, a markets client.
+# Copyright (C) 2012-2013 Emery Hemingway
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+
+from PyQt4 import QtCore
+
+
+logger = logging.getLogger(__name__)
+TOTAL, LIQUID = list(range(2))
+
+
+class Portfolio(QtCore.QObject):
+    """The balances of every exchange account, valued in one commodity.
+
+    Balances are held per exchange and local commodity, and the last
+    price of each commodity in the reference commodity is found through
+    the fewest markets between the two, taking the tickers that last
+    changed first, so a commodity with no market against the reference
+    is valued through one it has with a third. Holdings with no route to
+    the reference are left out of the totals and emitted through
+    unpriced_signal. When a balance or a price changes only the terms
+    that depend on it are valued again and the difference is applied to
+    the totals, which are emitted through total_signal and liquid_signal.
+    """
+
+    total_signal = QtCore.pyqtSignal(float)
+    liquid_signal = QtCore.pyqtSignal(float)
+    # commodity ids held that have no price in the reference
+    unpriced_signal = QtCore.pyqtSignal(list)
+    # exchange id, commodity id, total value, liquid value
+    valueChanged = QtCore.pyqtSignal(str, str, float, float)
+
+    def __init__(self, reference=None, parent=None):
+        super(Portfolio, self).__init__(parent)
+        self.reference = reference
+        # (exchange id, commodity id) -> [total, liquid]
+        self.balances = dict()
+        # (exchange id, commodity id) -> [total value, liquid value]
+        self.values = dict()
+        # (exchange id, commodity id) -> (market key, balance proxy, slots)
+        self.balance_connections = dict()
+        # commodity id -> set of (exchange id, commodity id)
+        self.holdings = dict()
+        # (base id, counter id) -> last price, the latest last
+        self.prices = dict()
+        # commodity id -> price in the reference commodity
+        self.rates = dict()
+        # (exchange id, remote market id) ->
+        #     (base id, counter id, balance proxies, ticker proxy, slot)
+        self.markets = dict()
+        self.totals = [0.0, 0.0]
+
+    def addMarket(self, exchange_id, exchange, remote_market_id,
+                  base_id, counter_id):
+        """Follow the balances and ticker of an exchange market, where
+        base_id and counter_id are local commodity ids."""
+        key = (exchange_id, remote_market_id)
+        if key in self.markets:
+            return
+        if exchange.valueType is int:
+            # integer values are in units that differ between markets
+            return
+        if self.reference is None:
+            self.reference = counter_id
+
+        balance_proxies = (
+            (base_id, exchange.getBalanceBaseProxy(remote_market_id)),
+            (counter_id, exchange.getBalanceCounterProxy(remote_market_id)))
+        ticker_proxy = exchange.getTickerProxy(remote_market_id)
+        slot = lambda price, b=base_id, c=counter_id: self.setPrice(b, c, price)
+        self.markets[key] = (base_id, counter_id, balance_proxies,
+                             ticker_proxy, slot)
+
+        for commodity_id, proxy in balance_proxies:
+            self._connectBalance(key, commodity_id, proxy)
+
+        ticker_proxy.last_signal.connect(slot)
+        if 'last' in ticker_proxy.values:
+            self.setPrice(base_id, counter_id, ticker_proxy.values['last'])
+
+    def removeMarket(self, exchange_id, remote_market_id):
+        """Stop following an exchange market. Balances that no other
+        market of the exchange holds are taken out of the totals, as is
+        the price of the market if no other market quotes it."""
+        key = (exchange_id, remote_market_id)
+        market = self.markets.pop(key, None)
+        if market is None:
+            return
+        base_id, counter_id, balance_proxies, ticker_proxy, slot = market
+        ticker_proxy.last_signal.disconnect(slot)
+
+        for commodity_id, proxy in balance_proxies:
+            balance_key = (exchange_id, commodity_id)
+            if self.balance_connections[balance_key][0] != key:
+                continue
+            self._disconnectBalance(balance_key)
+            for other_key, other in self.markets.items():
+                if other_key[0] != exchange_id:
+                    continue
+                proxies = dict(other[2])
+                if commodity_id in proxies:
+                    self._connectBalance(other_key, commodity_id,
+                                         proxies[commodity_id])
+                    break
+            else:
+                self._dropBalance(balance_key)
+
+        pair = (base_id, counter_id)
+        if not any(other[:2] == pair for other in self.markets.values()):
+            self.prices.pop(pair, None)
+            self._updateRates()
+        self._emitTotals()
+
+    def _connectBalance(self, market_key, commodity_id, proxy):
+        key = (market_key[0], commodity_id)
+        if key in self.balance_connections:
+            return
+        if key not in self.balances:
+            self.balances[key] = [0.0, 0.0]
+            self.values[key] = [0.0, 0.0]
+            self.holdings.setdefault(commodity_id, set()).add(key)
+        slots = (
+            (proxy.balance_total, lambda value, k=key: self.setBalance(k, TOTAL, value)),
+            (proxy.balance_liquid, lambda value, k=key: self.setBalance(k, LIQUID, value)),
+            (proxy.balance_total_changed, lambda value, k=key: self.changeBalance(k, TOTAL, value)),
+            (proxy.balance_liquid_changed, lambda value, k=key: self.changeBalance(k, LIQUID, value)))
+        for signal, slot in slots:
+            signal.connect(slot)
+        self.balance_connections[key] = (market_key, proxy, slots)
+
+    def _disconnectBalance(self, key):
+        market_key, proxy, slots = self.balance_connections.pop(key)
+        for signal, slot in slots:
+            signal.disconnect(slot)
+
+    def _dropBalance(self, key):
+        self.balances[key] = [0.0, 0.0]
+        self._value(key)
+        del self.balances[key]
+        del self.values[key]
+        self.holdings[key[1]].discard(key)
+
+    def getRate(self, commodity_id):
+        if commodity_id == self.reference:
+            return 1.0
+        return self.rates.get(commodity_id)
+
+    def getTotals(self):
+        return tuple(self.totals)
+
+    def getUnpriced(self):
+        """Return the ids of commodities held that have no price in the
+        reference commodity."""
+        return sorted(commodity_id
+                      for commodity_id, keys in self.holdings.items()
+                      if self.getRate(commodity_id) is None and
+                      any(self.balances[key][TOTAL] for key in keys))
+
+    def setBalance(self, key, kind, value):
+        self.balances[key][kind] = float(value)
+        self._value(key)
+        self._emitTotals()
+
+    def changeBalance(self, key, kind, value):
+        self.balances[key][kind] += float(value)
+        self._value(key)
+        self._emitTotals()
+
+    def setPrice(self, base_id, counter_id, price):
+        """Take the last price of base in counter."""
+        price = float(price)
+        if not price:
+            return
+        pair = (base_id, counter_id)
+        self.prices.pop(pair, None)
+        self.prices[pair] = price
+        if self._updateRates():
+            self._emitTotals()
+
+    def _updateRates(self):
+        """Find the rates of commodities in the reference and value the
+        holdings whose rates changed, returning whether any did."""
+        rates = dict()
+        if self.reference is not None:
+            rates[self.reference] = 1.0
+        frontier = set(rates)
+        # a breadth first search finds the routes through the fewest
+        # markets, and of those the one whose prices changed last
+        latest = list(self.prices.items())[::-1]
+        while frontier:
+            reached = set()
+            for (base_id, counter_id), price in latest:
+                if counter_id in frontier and base_id not in rates:
+                    rates[base_id] = price * rates[counter_id]
+                    reached.add(base_id)
+                elif base_id in frontier and counter_id not in rates:
+                    rates[counter_id] = rates[base_id] / price
+                    reached.add(counter_id)
+            frontier = reached
+        rates.pop(self.reference, None)
+
+        changed = [ commodity_id for commodity_id in set(rates) | set(self.rates)
+                    if rates.get(commodity_id) != self.rates.get(commodity_id) ]
+        self.rates = rates
+        for commodity_id in changed:
+            for key in self.holdings.get(commodity_id, ()):
+                self._value(key)
+        return bool(changed)
+
+    def setReference(self, commodity_id):
+        """Value the portfolio in another commodity, which values every
+        term again."""
+        if commodity_id == self.reference:
+            return
+        self.reference = commodity_id
+        self.rates.clear()
+        self._updateRates()
+        for key in self.values:
+            self._value(key)
+        self._emitTotals()
+        QtCore.QSettings().setValue('portfolio/reference', commodity_id)
+
+    def _value(self, key):
+        rate = self.getRate(key[1])
+        balance = self.balances[key]
+        old = self.values[key]
+        if rate is None:
+            new = [0.0, 0.0]
+        else:
+            new = [balance[TOTAL] * rate, balance[LIQUID] * rate]
+        if new == old:
+            return
+        self.totals[TOTAL] += new[TOTAL] - old[TOTAL]
+        self.totals[LIQUID] += new[LIQUID] - old[LIQUID]
+        self.values[key] = new
+        self.valueChanged.emit(key[0], key[1], new[TOTAL], new[LIQUID])
+
+    def _emitTotals(self):
+        self.total_signal.emit(self.totals[TOTAL])
+        self.liquid_signal.emit(self.totals[LIQUID])
+        self.unpriced_signal.emit(self.getUnpriced())
+
+
+def _load_reference():
+    settings = QtCore.QSettings()
+    return settings.value('portfolio/reference')
+
+portfolio = None
+
+def get_portfolio():
+    global portfolio
+    if portfolio is None:
+        portfolio = Portfolio(_load_reference())
+    return portfolio
@@ -0,0 +1,412 @@
+# Dojima, a markets client.
+# Copyright (C) 2012-2013 Emery Hemingway
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Market data kept on disk, so that history survives restarts.
+
+Each exchange market has a store for each kind of data, a directory of
+chunk files of fixed size records, which are appended to except when a
+record arrives older than the last, and its chunk is rewritten. Every
+column is an int64, epochs in milliseconds and prices and amounts in
+fixed point units of 1 / SCALE. Records are kept in epoch order, so a
+range of time is found by the first epoch of each chunk, which names
+its file, and then by a binary search of the memory mapped chunk.
+
+Chunks whose records are all older than ticks/retention_days in the
+settings are removed as new chunks are started. Markets are only
+recorded when ticks/record is set, or the daemon is run with
+--record-ticks.
+"""
+
+import bisect
+import logging
+import os
+import os.path
+import time
+
+from decimal import Decimal
+
+import numpy as np
+from PyQt4 import QtCore
+
+import dojima.data.market
+import dojima.storage
+
+
+logger = logging.getLogger(__name__)
+
+SCALE = 10**8
+# 2 MiB chunks, which is also how finely old records are removed
+CHUNK_ROWS = 1 << 16
+CHUNK_SUFFIX = '.ticks'
+# Days records are kept by default, 0 keeps them for ever
+RETENTION_DAYS = 90
+# Depth snapshots are stored at most this many seconds apart
+DEPTH_INTERVAL = 60
+
+ASKS, BIDS = list(range(2))
+
+DTYPES = { 'ticker': np.dtype([('epoch', '<i8'), ('last', '<i8'),
+                               ('ask', '<i8'), ('bid', '<i8')]),
+           'trades': np.dtype([('epoch', '<i8'), ('price', '<i8'),
+                               ('amount', '<i8'), ('id', '<i8')]),
+           # every level of a snapshot has the epoch of the snapshot
+           'depth':  np.dtype([('epoch', '<i8'), ('side', '<i8'),
+                               ('price', '<i8'), ('amount', '<i8')]) }
+
+
+def now():
+    return int(time.time() * 1000)
+
+def to_fixed(values):
+    """Convert a Decimal, a float, or an array of floats, to fixed point."""
+    if isinstance(values, Decimal):
+        return int(values * SCALE)
+    return np.round(np.asarray(values, dtype=np.float64) * SCALE).astype(np.int64)
+
+def to_float(column):
+    return column / SCALE
+
+def get_directory():
+    storage_directory = dojima.storage.get_directory()
+    return os.path.join(storage_directory, 'ticks')
+
+def get_retention():
+    """Return how long records are kept in milliseconds, or None to keep
+    them for ever."""
+    days = QtCore.QSettings().value('ticks/retention_days', RETENTION_DAYS,
+                                    type=int)
+    if days <= 0:
+        return None
+    return days * 24 * 60 * 60 * 1000
+
+
+class TickStore(object):
+    """The records of one kind of data of one exchange market, and if
+    retention is not None, only those of the last retention milliseconds."""
+
+    def __init__(self, directory, kind, retention=None):
+        self.directory = directory
+        self.dtype = DTYPES[kind]
+        self.retention = retention
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        # first epoch of each chunk, and the chunk files, in order
+        self.firsts = list()
+        self.chunks = list()
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith(CHUNK_SUFFIX):
+                self.firsts.append(int(filename[:-len(CHUNK_SUFFIX)]))
+                self.chunks.append(os.path.join(directory, filename))
+        # full chunks no longer change, so their maps are kept
+        self.maps = dict()
+
+        self.last_epoch = None
+        if self.chunks:
+            records = self._map(-1)
+            if records.size:
+                self.last_epoch = int(records['epoch'][-1])
+        self.prune()
+
+    def __len__(self):
+        return sum(self._rows(path) for path in self.chunks)
+
+    def _rows(self, path):
+        # a record torn by a crash is left off the end
+        return os.path.getsize(path) // self.dtype.itemsize
+
+    def _map(self, index):
+        path = self.chunks[index]
+        if path in self.maps:
+            return self.maps[path]
+        rows = self._rows(path)
+        if not rows:
+            return np.empty(0, dtype=self.dtype)
+        records = np.memmap(path, dtype=self.dtype, mode='r', shape=(rows,))
+        if rows >= CHUNK_ROWS:
+            self.maps[path] = records
+        return records
+
+    def _path(self, first):
+        return os.path.join(self.directory,
+                            '{:020d}{}'.format(first, CHUNK_SUFFIX))
+
+    def append(self, records):
+        """Add records, keeping the store in epoch order. Records as new
+        as the last record stored are appended, older records are merged
+        into the chunks they belong in, which rewrites those chunks."""
+        records = np.asarray(records, dtype=self.dtype)
+        if not records.size:
+            return
+        records = records[np.argsort(records['epoch'], kind='mergesort')]
+        if self.last_epoch is not None:
+            late = records['epoch'] < self.last_epoch
+            if late.any():
+                self._insert(records[late])
+                records = records[~late]
+
+        while records.size:
+            if self.chunks and self._rows(self.chunks[-1]) < CHUNK_ROWS:
+                path = self.chunks[-1]
+                free = CHUNK_ROWS - self._rows(path)
+            else:
+                first = int(records['epoch'][0])
+                path = self._path(first)
+                self.firsts.append(first)
+                self.chunks.append(path)
+                free = CHUNK_ROWS
+                self.prune()
+
+            with open(path, 'ab') as f:
+                f.write(records[:free].tobytes())
+            self.last_epoch = int(records['epoch'][:free][-1])
+            records = records[free:]
+
+    def _insert(self, records):
+        """Merge sorted records older than the last record stored into the
+        chunks they belong in."""
+        index = np.searchsorted(self.firsts, records['epoch'], 'right') - 1
+        # records older than the first chunk start it earlier
+        index[index < 0] = 0
+        for chunk in np.unique(index):
+            self._rewrite(int(chunk), records[index == chunk])
+
+    def _rewrite(self, index, records):
+        path = self.chunks[index]
+        merged = np.concatenate((np.array(self._map(index)), records))
+        # records already stored stay ahead of new ones of the same epoch
+        merged = merged[np.argsort(merged['epoch'], kind='mergesort')]
+        self.maps.pop(path, None)
+
+        first = int(merged['epoch'][0])
+        new_path = self._path(first)
+        temporary = new_path + '.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(merged.tobytes())
+        os.replace(temporary, new_path)
+        if new_path != path:
+            os.remove(path)
+            self.chunks[index] = new_path
+            self.firsts[index] = first
+        logger.debug("merged %s late records into %s", records.size, new_path)
+
+    def prune(self, before=None):
+        """Remove the chunks whose records are all older than the epoch
+        before, by default the start of the retention. The last chunk is
+        always kept."""
+        if before is None:
+            if self.retention is None:
+                return
+            before = now() - self.retention
+        while len(self.chunks) > 1:
+            records = self._map(0)
+            if records.size and records['epoch'][-1] >= before:
+                break
+            path = self.chunks.pop(0)
+            self.firsts.pop(0)
+            self.maps.pop(path, None)
+            os.remove(path)
+            logger.debug("removed %s", path)
+
+    def read(self, start=None, stop=None):
+        """Return the records from the epoch start up to but not including
+        stop, the records of a single chunk are not copied."""
+        if not self.chunks:
+            return np.empty(0, dtype=self.dtype)
+        if start is None:
+            first = 0
+        else:
+            # records of one epoch may run over into the next chunk
+            first = max(bisect.bisect_left(self.firsts, start) - 1, 0)
+        if stop is None:
+            last = len(self.chunks)
+        else:
+            last = bisect.bisect_left(self.firsts, stop)
+
+        parts = list()
+        for index in range(first, last):
+            records = self._map(index)
+            epochs = records['epoch']
+            lo = 0 if start is None else np.searchsorted(epochs, start, 'left')
+            hi = epochs.size if stop is None else np.searchsorted(epochs, stop, 'left')
+            if hi > lo:
+                parts.append(records[lo:hi])
+
+        if not parts:
+            return np.empty(0, dtype=self.dtype)
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts)
+
+    def tail(self, count):
+        """Return the last count records."""
+        parts = list()
+        index = len(self.chunks)
+        while count > 0 and index:
+            index -= 1
+            records = self._map(index)[-count:]
+            parts.append(records)
+            count -= records.size
+
+        if not parts:
+            return np.empty(0, dtype=self.dtype)
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts[::-1])
+
+    def readTrades(self, count):
+        """Return the last count trades as a TradesProxy holds them,
+        (date, price, amount, id) newest first, with matplotlib dates."""
+        records = self.tail(count)[::-1]
+        trades = np.empty((4, records.size))
+        trades[dojima.data.market.DATE] = dojima.data.market.epoch2num(
+            records['epoch'] / 1000)
+        trades[dojima.data.market.PRICE] = to_float(records['price'])
+        trades[dojima.data.market.AMOUNT] = to_float(records['amount'])
+        trades[dojima.data.market.ID] = records['id']
+        return trades
+
+
+class Recorder(QtCore.QObject):
+    """Appends the ticker, trades and depth of an exchange market to its
+    stores as the proxies emit them, until stop() is called.
+
+    The ticker values of one poll arrive one signal at a time, so they
+    are written as one row once control returns to the event loop, and
+    only if a value changed, which also leaves out echoed values.
+    """
+
+    def __init__(self, exchange_id, exchange, remote_market_id, parent=None):
+        super(Recorder, self).__init__(parent)
+        self.stores = dict(
+            (kind, get_store(exchange_id, remote_market_id, kind))
+            for kind in DTYPES)
+        # (signal, slot) pairs to disconnect when stopped
+        self.connections = list()
+
+        ticker_proxy = exchange.getTickerProxy(remote_market_id)
+        self.ticker = dict((stat, to_fixed(Decimal(str(value))))
+                           for stat, value in ticker_proxy.values.items())
+        self.ticker_pending = False
+        for stat in ('last', 'ask', 'bid'):
+            self._connect(getattr(ticker_proxy, stat + '_signal'),
+                          lambda value, stat=stat: self.recordTicker(stat, value))
+
+        if hasattr(exchange, 'getTradesProxy'):
+            trades_proxy = exchange.getTradesProxy(remote_market_id)
+            # the proxy starts from the stored trades, so that charts open
+            # with them and only newer trades are fetched
+            trades_proxy.history = self.stores['trades'].readTrades
+            self._connect(trades_proxy.added, self.recordTrades)
+
+        self.depth_epoch = None
+        if hasattr(exchange, 'getDepthProxy'):
+            self.book = exchange.getDepthProxy(remote_market_id).book
+            self._connect(self.book.changed, self.recordDepth)
+
+    def _connect(self, signal, slot):
+        signal.connect(slot)
+        self.connections.append((signal, slot))
+
+    def stop(self):
+        for signal, slot in self.connections:
+            signal.disconnect(slot)
+        self.connections = list()
+        if self.ticker_pending:
+            self._writeTicker()
+
+    def recordTicker(self, stat, value):
+        value = to_fixed(Decimal(str(value)))
+        if self.ticker.get(stat) == value:
+            return
+        self.ticker[stat] = value
+        if not self.ticker_pending:
+            self.ticker_pending = True
+            QtCore.QTimer.singleShot(0, self._writeTicker)
+
+    def _writeTicker(self):
+        if not self.ticker_pending:
+            return
+        self.ticker_pending = False
+        record = np.zeros(1, dtype=DTYPES['ticker'])
+        record['epoch'] = now()
+        for stat, value in self.ticker.items():
+            record[stat] = value
+        self.stores['ticker'].append(record)
+
+    def recordTrades(self, trades):
+        """Append trades the proxy added, which are newest first."""
+        if not trades.shape[1]:
+            return
+        trades = trades[:, ::-1]
+        epochs = np.round(dojima.data.market.num2epoch(
+            trades[dojima.data.market.DATE]) * 1000).astype(np.int64)
+        order = np.argsort(epochs, kind='mergesort')
+        records = np.empty(epochs.size, dtype=DTYPES['trades'])
+        records['epoch'] = epochs[order]
+        records['price'] = to_fixed(trades[dojima.data.market.PRICE, order])
+        records['amount'] = to_fixed(trades[dojima.data.market.AMOUNT, order])
+        records['id'] = trades[dojima.data.market.ID, order]
+        self.stores['trades'].append(records)
+
+    def recordDepth(self, sequence, side, diff):
+        epoch = now()
+        if (self.depth_epoch is not None and
+            epoch - self.depth_epoch < DEPTH_INTERVAL * 1000):
+            return
+        self.depth_epoch = epoch
+        sequence, asks, bids = self.book.snapshot()
+        records = np.empty(asks.shape[1] + bids.shape[1],
+                           dtype=DTYPES['depth'])
+        records['epoch'] = epoch
+        records['side'][:asks.shape[1]] = ASKS
+        records['side'][asks.shape[1]:] = BIDS
+        records['price'] = to_fixed(np.hstack((asks[0], bids[0])))
+        records['amount'] = to_fixed(np.hstack((asks[1], bids[1])))
+        self.stores['depth'].append(records)
+
+
+stores = dict()
+# (exchange id, remote market id) -> [recorder, number of users]
+recorders = dict()
+
+def get_store(exchange_id, remote_market_id, kind):
+    key = (exchange_id, remote_market_id, kind)
+    if key not in stores:
+        # single market exchanges have no remote market id
+        market = remote_market_id or exchange_id
+        stores[key] = TickStore(
+            os.path.join(get_directory(), exchange_id, market, kind), kind,
+            get_retention())
+    return stores[key]
+
+def record(exchange_id, exchange, remote_market_id):
+    """Keep the market data of an exchange market on disk, until each
+    call is matched by a call to release()."""
+    key = (exchange_id, remote_market_id)
+    if key not in recorders:
+        recorders[key] = [Recorder(exchange_id, exchange, remote_market_id), 0]
+    recorders[key][1] += 1
+    return recorders[key][0]
+
+def release(exchange_id, remote_market_id):
+    key = (exchange_id, remote_market_id)
+    if key not in recorders:
+        return
+    recorders[key][1] -= 1
+    if recorders[key][1] <= 0:
+        recorders.pop(key)[0].stop()
@@ -19,10 +19,10 @@ import os
 import os.path
 import time
 
-import matplotlib.dates
 import numpy as np
 from PyQt4 import QtCore, QtGui
 
+import dojima.data.market
 import dojima.exchange
 
 
@@ -62,8 +62,8 @@ class QuotesProxy(QtCore.QObject):
     def _process_trades(self, trade_data):
         "Trade data should be (dates, prices, amounts)"
         epochs = np.array(trade_data[0], dtype=np.int32)
-        prices = np.array(trade_data[1], dtype=np.float)
-        amounts = np.array(trade_data[2], dtype=np.float)
+        prices = np.array(trade_data[1], dtype=np.float64)
+        amounts = np.array(trade_data[2], dtype=np.float64)
 
         #epochs.dump('/tmp/epochs')
         #prices.dump('/tmp/prices')
@@ -89,14 +89,14 @@ class QuotesProxy(QtCore.QObject):
             if trim_index.any():
                 price_selection = prices[trim_index]
                 amount_selection = amounts[trim_index]
-                dates.append(matplotlib.dates.epoch2num(period_start))
+                dates.append(dojima.data.market.epoch2num(period_start))
                 opens.append(price_selection[0])
                 closes.append(price_selection[-1])
                 highs.append(price_selection.max())
                 lows.append(price_selection.min())
                 volumes.append(amount_selection.sum())
             else:
-                dates.append(matplotlib.dates.epoch2num(period_start))
+                dates.append(dojima.data.market.epoch2num(period_start))
                 last_price = closes[-1]
                 opens.append(last_price)
                 closes.append(last_price)
@@ -112,7 +112,7 @@ class QuotesProxy(QtCore.QObject):
         self.quotes = np.array((dates,
                                 opens, closes,
                                 highs, lows,
-                                volumes), dtype=np.float).transpose()
+                                volumes), dtype=np.float64).transpose()
         self.save()
         self.refreshed_signal.emit(self.quotes)
 
@@ -159,10 +159,10 @@ class DepthProxy(QtCore.QObject):
         volume_sums = list()
         step_size = 1.0 / pow(10, self.precision)
         now = time.time()
-        now = matplotlib.dates.epoch2num(now)
+        now = dojima.data.market.epoch2num(now)
 
         #bids
-        bids = np.array(depth_data[1], dtype=np.float).transpose()
+        bids = np.array(depth_data[1], dtype=np.float64).transpose()
         bid_prices = bids[0]
         bid_volumes = bids[1]
         floor = bid_prices.max().round(self.precision)
@@ -180,7 +180,7 @@ class DepthProxy(QtCore.QObject):
         volume_sums.reverse()
 
         # asks
-        asks = np.array(depth_data[0], dtype=np.float).transpose()
+        asks = np.array(depth_data[0], dtype=np.float64).transpose()
         ask_prices = asks[0]
         ask_volumes = bids[1]
         ceiling = ask_prices.min().round(self.precision)
@@ -14,13 +14,13 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import heapq
 import logging
 
 from PyQt4 import QtCore, QtGui
 
 import dojima.data.account
 import dojima.data.balance
+import dojima.data.offers
 #import dojima.data.orders
 
 
@@ -81,9 +81,12 @@ class ExchangeProxySingleMarket(ExchangeProxy):
 
     
 class Exchange:
+    # A dojima.network.stream.MarketStream that pushes market data, the
+    # ticker is only polled while it is down
+    market_stream = None
 
     def echoTicker(self, remoteMarketID):
-        pass
+        self.getTickerProxy(remoteMarketID).echo()
 
     def getAccountValidityProxy(self, marketID):
         if marketID not in self.account_validity_proxies:
@@ -110,8 +113,9 @@ class Exchange:
         if market_id in self.offers_proxies_asks:
             return self.offers_proxies_asks[market_id]
 
-        base_model = self.getOffersModel(market_id)
-        asks_model = dojima.data.offers.FilterAsksModel(base_model)
+        base, counter = self.getOffersPartition(market_id)
+        asks_model = dojima.data.offers.FilterAsksModel(self.offers_model,
+                                                        base, counter)
         self.offers_proxies_asks[market_id] = asks_model
         return asks_model
 
@@ -119,10 +123,16 @@ class Exchange:
         if market_id in self.offers_proxies_bids:
             return self.offers_proxies_bids[market_id]
 
-        base_model = self.getOffersModel(market_id)
-        bids_model = dojima.data.offers.FilterBidsModel(base_model)
+        base, counter = self.getOffersPartition(market_id)
+        bids_model = dojima.data.offers.FilterBidsModel(self.offers_model,
+                                                        base, counter)
         self.offers_proxies_bids[market_id] = bids_model
         return bids_model
+
+    def getOffersPartition(self, market_id):
+        """Return the base and counter column values of the offers of a
+        market."""
+        return self.getMarketSymbols(market_id)
         
     def getScale(self, remoteMarketID):
         return 1
@@ -137,33 +147,6 @@ class Exchange:
     def getTickerRefreshRate(self, market=None):
         return self._ticker_refresh_rate
 
-    def getOffersModel(self, market_id):
-        if market_id in self.offers_proxies:
-            return self.offers_proxies[market_id]
-
-        base_symbol, counter_symbol = self.getMarketSymbols(market_id)
-        if base_symbol in self.base_offers_proxies:
-            base_proxy = self.base_offers_proxies[base_symbol]
-        else:
-            base_proxy = QtGui.QSortFilterProxyModel()
-            base_proxy.setSourceModel(self.offers_model)
-            base_proxy.setFilterKeyColumn(dojima.data.offers.BASE)
-            base_proxy.setFilterFixedString(base_symbol)
-            base_proxy.setDynamicSortFilter(True)
-            self.base_offers_proxies[base_symbol] = base_proxy
-
-        proxy = QtGui.QSortFilterProxyModel()
-        proxy.setSourceModel(base_proxy)
-        proxy.setFilterKeyColumn(dojima.data.offers.COUNTER)
-        proxy.setFilterFixedString(counter_symbol)
-        proxy.setDynamicSortFilter(True)
-        self.offers_proxies[market_id] = proxy
-        return proxy
-
-    def pop_request(self):
-        request = heapq.heappop(self.requests)[1]
-        request.send()
-
     def populateMenuBar(self, menu, remoteMarketID):
         pass
         
@@ -171,34 +154,31 @@ class Exchange:
         self.refreshOffers(market_id)
         self.refreshBalance(market_id)
         
-    def setTickerRefreshRate(self, rate):
-        self._ticker_refresh_rate = rate
-        if self.ticker_timer.isActive():
-            self.ticker_timer.setInterval(self._ticker_refresh_rate * 1000)
-
-    def setTickerStreamState(self, state, market_id):
+    def _setMarketStreamLive(self, live):
+        if not live:
+            self.network_manager.subscriptions.poll_soon(self, 'ticker')
+
+    def setStreamState(self, stream, state, market_id=None):
+        """Subscribe to or unsubscribe from polls of a stream of a market,
+        the stream is one of dojima.network.SUBSCRIPTION_STREAMS."""
+        subscriptions = self.network_manager.subscriptions
         if state is True:
-            if not market_id in self.ticker_clients:
-                self.ticker_clients[market_id] = 1
-            else:
-                self.ticker_clients[market_id] += 1
-                
-            if self.ticker_timer.isActive(): return
-                
-            self.ticker_timer.start(self._ticker_refresh_rate * 1000)
+            subscriptions.subscribe(self, market_id, stream)
         else:
-            if market_id not in self.ticker_clients: return
-        
-            market_clients = self.ticker_clients[market_id]
-            if market_clients > 1:
-                self.ticker_clients[market_id] -= 1
-                return
-            
-            if market_clients == 1:
-                self.ticker_clients.pop(market_id)
+            subscriptions.unsubscribe(self, market_id, stream)
+
+        if stream == 'ticker' and self.market_stream is not None:
+            if subscriptions.is_subscribed(self, stream):
+                self.market_stream.open()
+            else:
+                self.market_stream.close()
 
-            if sum(self.ticker_clients.values()) == 0:
-                self.ticker_timer.stop()
+    def setTickerRefreshRate(self, rate):
+        self._ticker_refresh_rate = rate
+        self.network_manager.subscriptions.set_interval(self, 'ticker', rate)
+
+    def setTickerStreamState(self, state, market_id=None):
+        self.setStreamState('ticker', state, market_id)
         
 
 class ExchangeSingleMarket(Exchange):
@@ -224,22 +204,6 @@ class ExchangeSingleMarket(Exchange):
     def getTickerRefreshRate(self):
         return self._ticker_refresh_rate
 
-    def setTickerStreamState(self, state, market=None):
-        if state is True:
-            self.ticker_clients += 1
-            if self.ticker_timer.isActive():
-                self.ticker_timer.setInterval(self._ticker_refresh_rate * 1000)
-                return
-            self.ticker_timer.start(self._ticker_refresh_rate * 1000)
-        else:
-            if self.ticker_clients >1:
-                self.ticker_clients -= 1
-                return
-            if self.ticker_clients == 0:
-                return
-            self.ticker_clients = 0
-            self.ticker_timer.stop()
-
             
 class EditCredentialsAction(QtGui.QAction):
 
@@ -1,2 +1,170 @@
-# Add new modules here, so they get imported by *
-__all__ = ['bitstamp', 'btc-e', 'campbx']
+# Dojima, a markets client.
+# Copyright (C) 2012-2013 Emery Hemingway
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Exchange modules are only imported once an exchange object or wizard
+page is asked of them, everything needed before that is in the records
+below. Importing this package registers the exchanges into
+dojima.exchanges.
+"""
+
+import importlib
+import logging
+
+import dojima.exchange
+import dojima.exchanges
+import dojima.markets
+import dojima.model.commodities
+
+
+logger = logging.getLogger(__name__)
+
+# Add new modules here.
+# id: the exchange id, which remote commodity ids are prefixed with
+# module: the module within this package
+# exchange, wizard_page: the names of classes in the module
+# markets: remote market ids mapped to remote base and counter
+#          commodity ids, or None for exchanges of a single market
+# base, counter: the remote commodity ids of a single market
+RECORDS = (
+    { 'id': 'bitstamp',
+      'name': "Bitstamp",
+      'module': 'bitstamp',
+      'exchange': 'BitstampExchange',
+      'wizard_page': 'BitstampWizardPage',
+      'pretty_market': 'BTCUSD',
+      'markets': None,
+      'base': 'bitstamp-BTC',
+      'counter': 'bitstamp-USD' },
+
+    { 'id': 'btce',
+      'name': "BTC-e",
+      'module': 'btc-e',
+      'exchange': 'BtceExchange',
+      'wizard_page': 'BtceWizardPage',
+      'markets': dict(
+          (market, tuple('btce-' + symbol for symbol in market.split('_')))
+          for market in ( 'btc_eur', 'btc_rur', 'btc_usd',
+                          'eur_usd',
+                          'ftc_btc',
+                          'ltc_btc', 'ltc_eur', 'ltc_rur', 'ltc_usd',
+                          'nmc_btc',
+                          'nvc_btc', 'nvc_usd',
+                          'ppc_btc', 'ppc_usd',
+                          'trc_btc',
+                          'usd_rur',
+                          'xpm_btc' )) },
+
+    { 'id': 'campbx',
+      'name': "CampBX",
+      'module': 'campbx',
+      'exchange': 'CampbxExchange',
+      'wizard_page': 'CampbxWizardPage',
+      'pretty_market': 'BTCUSD',
+      'markets': None,
+      'base': 'campbx-BTC',
+      'counter': 'campbx-USD' },
+)
+
+
+def get_record(exchange_id):
+    for record in RECORDS:
+        if record['id'] == exchange_id:
+            return record
+    raise KeyError(exchange_id)
+
+def load_module(record):
+    """Import the module of an exchange record."""
+    name = __name__ + '.' + record['module']
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("loading exchange module %s", name)
+    return importlib.import_module(name)
+
+
+class RegisteredExchangeProxy(dojima.exchange.ExchangeProxy):
+    """An exchange proxy made from a record, that imports the exchange
+    module when the exchange object or a wizard page is needed."""
+
+    def __init__(self, record):
+        self.record = record
+        self.id = record['id']
+        self.name = record['name']
+        self.exchange_object = None
+        self.module = None
+        self.local_market_map = dict()
+        self.remote_market_map = dict()
+        self.local_market = None
+
+    def _module(self):
+        if self.module is None:
+            self.module = load_module(self.record)
+        return self.module
+
+    def getExchangeObject(self):
+        if self.exchange_object is None:
+            self.exchange_object = getattr(self._module(),
+                                           self.record['exchange'])()
+        return self.exchange_object
+
+    def getWizardPage(self, wizard):
+        return getattr(self._module(), self.record['wizard_page'])(wizard)
+
+    def getPrettyMarketName(self, remote_market_id=None):
+        if self.record['markets'] is None:
+            return self.record['pretty_market']
+        # TODO make the asset seperator (/) locale dependant
+        return remote_market_id.replace('_', '/').upper()
+
+    def getRemoteMarketIDs(self, local_market_id=None):
+        if self.record['markets'] is None:
+            return (None,)
+        return self.local_market_map[local_market_id]
+
+    def getRemoteToLocal(self, remote_market_id=None):
+        if self.record['markets'] is None:
+            return self.local_market
+        return self.remote_market_map[remote_market_id]
+
+    def refreshMarkets(self):
+        markets = self.record['markets']
+        if markets is None:
+            markets = {None: (self.record['base'], self.record['counter'])}
+
+        for remote_market_id, (remote_base_id, remote_counter_id) in markets.items():
+            local_base_id = dojima.model.commodities.remote_model.getRemoteToLocalMap(remote_base_id)
+            local_counter_id = dojima.model.commodities.remote_model.getRemoteToLocalMap(remote_counter_id)
+            if ((local_base_id is None) or
+                (local_counter_id is None)): continue
+
+            local_pair = local_base_id + '_' + local_counter_id
+            if remote_market_id is None:
+                self.local_market = local_pair
+            else:
+                local_map = self.local_market_map.setdefault(local_pair, list())
+                if remote_market_id not in local_map:
+                    local_map.append(remote_market_id)
+                self.remote_market_map[remote_market_id] = local_pair
+
+            dojima.markets.container.addExchange(self, local_pair,
+                                                 local_base_id, local_counter_id)
+
+
+def register():
+    for record in RECORDS:
+        if record['id'] not in dojima.exchanges.container.exchanges:
+            dojima.exchanges.container.addExchange(RegisteredExchangeProxy(record))
+
+register()
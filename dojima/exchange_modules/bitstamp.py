@@ -23,23 +23,29 @@ import logging
 import time
 from decimal import Decimal
 
-import matplotlib.dates
 import numpy as np
 from PyQt4 import QtCore, QtGui, QtNetwork
 
 import dojima.exchange
-import dojima.exchanges
 import dojima.data.account
 import dojima.data.market
 import dojima.data.offers
 import dojima.network
+import dojima.network.depth
+import dojima.network.nonce
+import dojima.network.stream
 import dojima.ui.wizard
 
 PRETTY_NAME = "Bitstamp"
 PLAIN_NAME = "bitstamp"
 HOSTNAME = "www.bitstamp.net"
 URL_BASE = "https://" + HOSTNAME + "/api/"
+# Seconds of transactions the API returns when not told otherwise
+TRANSACTIONS_TIMEDELTA = 3600
 MARKET_ID = 'BTCUSD'
+# Bitstamp pushes trades and the top of the book through Pusher
+STREAM_URL = ("wss://ws.pusherapp.com/app/de504dc5763aeef9ff52"
+              "?protocol=6&client=dojima&version=0.1")
 
 logger = logging.getLogger(PLAIN_NAME)
 
@@ -63,27 +69,6 @@ def loadAccountSettings():
     return client_id, api_key, api_secret
 
 
-class BitstampExchangeProxy(dojima.exchange.ExchangeProxySingleMarket):
-
-    id = PLAIN_NAME
-    name = PRETTY_NAME
-    local_market_map = None
-    remote_market_map = None
-    base_id = 'bitstamp-BTC'
-    counter_id = 'bitstamp-USD'
-
-    def getExchangeObject(self):
-        if self.exchange_object is None:
-            self.exchange_object = BitstampExchange()
-        return self.exchange_object
-
-    def getPrettyMarketName(self, market_id=None):
-        return 'BTCUSD'
-        
-    def getWizardPage(self, wizard):
-        return BitstampWizardPage(wizard)
-
-    
 class BitstampWizardPage(dojima.ui.wizard.ExchangeWizardPage):
     name = PRETTY_NAME
 
@@ -159,14 +144,15 @@ class BitstampExchange(QtCore.QObject, dojima.exchange.ExchangeSingleMarket):
         super(BitstampExchange, self).__init__(parent)
 
         self.network_manager = network_manager
-        self.host_queue = self.network_manager.get_host_request_queue(HOSTNAME, 500)
-        self.requests = list()
+        self.host_queue = self.network_manager.get_host_request_queue(HOSTNAME, 500, 4)
+        # keep some of the host budget free for private requests
+        self.host_queue.set_budget(dojima.network.PUBLIC, 1.5, 3)
         self.replies = set()
 
         self._client_id = None
         self._api_key = None
         self._api_secret = None
-        self._nonce = int(time.time() / 2)
+        self.nonces = None
         self._bitcoin_deposit_address = None
         
         self._ticker_refresh_rate = 16
@@ -174,9 +160,8 @@ class BitstampExchange(QtCore.QObject, dojima.exchange.ExchangeSingleMarket):
         self.depth_proxy = dojima.data.market.DepthProxy('BTCUSD', self)
         self.ticker_proxy = dojima.data.market.TickerProxyDecimal(self)
         self.trades_proxy = dojima.data.market.TradesProxy('BTCUSD', self)
-        self.ticker_clients = 0
-        self.ticker_timer = QtCore.QTimer(self)
-        self.ticker_timer.timeout.connect(self.refreshTicker)
+        self.market_stream = BitstampStream(self)
+        self.market_stream.liveChanged.connect(self._setMarketStreamLive)
 
         self.base_balance_proxy = dojima.data.balance.BalanceProxyDecimal(self)
         self.counter_balance_proxy = dojima.data.balance.BalanceProxyDecimal(self)
@@ -213,6 +198,8 @@ class BitstampExchange(QtCore.QObject, dojima.exchange.ExchangeSingleMarket):
             self._client_id = client_id
             self._api_key = api_key
             self._api_secret = api_secret
+            self.nonces = dojima.network.nonce.get_sequencer(PLAIN_NAME,
+                                                             api_key)
             self.accountChanged.emit(MARKET_ID)
 
     def placeAskLimitOffer(self, amount, price, market=None):
@@ -253,30 +240,86 @@ class BitstampExchange(QtCore.QObject, dojima.exchange.ExchangeSingleMarket):
                   'amount': str(amount)}
         BitstampBitcoinWithdrawalRequest(params, self)        
 
-        
+
+
+class BitstampStream(dojima.network.stream.MarketStream):
+    url = QtCore.QUrl(STREAM_URL)
+    channels = ('live_trades', 'order_book', 'diff_order_book')
+
+    def _subscribe(self, channel):
+        self.send(json.dumps({'event': 'pusher:subscribe',
+                              'data': {'channel': channel}}))
+
+    def _handle_message(self, message):
+        message = json.loads(message)
+        event = message['event']
+        if event == 'pusher:connection_established':
+            self._ready()
+        elif event == 'pusher:ping':
+            self.send(json.dumps({'event': 'pusher:pong', 'data': {}}))
+        elif event == 'pusher:error':
+            logger.warning("stream error: %s", message['data'])
+        elif event == 'trade':
+            self._handle_trade(json.loads(message['data']))
+        elif event == 'data' and message.get('channel') == 'order_book':
+            self._handle_book(json.loads(message['data']))
+        elif event == 'data' and message.get('channel') == 'diff_order_book':
+            self._handle_diff(json.loads(message['data']))
+
+    def _handle_trade(self, trade):
+        exchange = self.parent()
+        exchange.ticker_proxy.last_signal.emit(Decimal(str(trade['price'])))
+
+        if 'timestamp' not in trade:
+            # without the time of the exchange the trade is left to the
+            # transactions poll, so that stream and polled trades agree
+            exchange.network_manager.subscriptions.poll_soon(exchange, 'trades')
+            return
+        exchange.trades_proxy.processTrades(
+            [ (trade['id'], int(trade['timestamp']),
+               float(trade['price']), float(trade['amount'])) ])
+
+    def _handle_book(self, book):
+        exchange = self.parent()
+        if book['bids']:
+            exchange.ticker_proxy.bid_signal.emit(Decimal(book['bids'][0][0]))
+        if book['asks']:
+            exchange.ticker_proxy.ask_signal.emit(Decimal(book['asks'][0][0]))
+
+        asks = np.array(book['asks'], dtype=np.float64).reshape(-1, 2).transpose()
+        bids = np.array(book['bids'], dtype=np.float64).reshape(-1, 2).transpose()
+        exchange.depth_proxy.processTop(asks, bids)
+
+    def _handle_diff(self, diff):
+        asks = np.array(diff['asks'], dtype=np.float64).reshape(-1, 2).transpose()
+        bids = np.array(diff['bids'], dtype=np.float64).reshape(-1, 2).transpose()
+        self.parent().depth_proxy.processDiff(asks, bids)
+
+
 class _BitstampRequest(dojima.network.ExchangeGETRequest):
-    priority = 3
-    host_priority = None
+    pass
 
 
 class BitstampOrderBookRequest(_BitstampRequest):
     url = QtCore.QUrl(URL_BASE + 'order_book/')
+    stream = 'depth'
+    latency_class = dojima.network.BOOK
+    cache_ttl = 2
 
-    def _handle_reply(self, raw):
-        logger.debug(raw)
-        data = json.loads(raw)
+    def _handle_unchanged(self):
+        self.parent.depth_proxy.echo()
 
-        bids = data['bids']
-        bids = np.array(bids, dtype=np.float).transpose()
-        self.parent.depth_proxy.processBids(bids)
-        
-        asks = data['asks']
-        asks = np.array(asks, dtype=np.float).transpose()
-        self.parent.depth_proxy.processAsks(asks)
+    def _create_parser(self):
+        return dojima.network.depth.DepthParser(self.url.toString())
+
+    def _handle_reply(self, depth):
+        self.parent.depth_proxy.processBids(depth['bids'])
+        self.parent.depth_proxy.processAsks(depth['asks'])
 
 
 class BitstampTickerRequest(_BitstampRequest):
     url = QtCore.QUrl(URL_BASE + 'ticker/')
+    stream = 'ticker'
     
     def _handle_reply(self, raw):
         logger.debug(raw)
@@ -287,22 +330,31 @@ class BitstampTickerRequest(_BitstampRequest):
 
 
 class BitstampTransactionsRequest(_BitstampRequest):
-    url = QtCore.QUrl(URL_BASE + 'transactions/')
+    stream = 'trades'
+    latency_class = dojima.network.HISTORY
+    cache_ttl = 5
+
+    def __init__(self, parent):
+        self.url = QtCore.QUrl(URL_BASE + 'transactions/')
+        cursor = parent.trades_proxy.getCursor()
+        if cursor is not None:
+            # transactions are asked for by the seconds they go back, not
+            # from an id, in whole minutes so that the url repeats
+            minutes = int(time.time() - cursor[1]) // 60 + 2
+            if minutes * 60 < TRANSACTIONS_TIMEDELTA:
+                self.url.addQueryItem('timedelta', str(minutes * 60))
+        super(BitstampTransactionsRequest, self).__init__(parent)
+
+    def _handle_unchanged(self):
+        self.parent.trades_proxy.unchanged()
 
     def _handle_reply(self, raw):
         logger.debug(raw)
         data = json.loads(raw)
-
-        trades = np.empty( (3, len(data)) )
-
-        for i, trade in enumerate(data):
-            trades[0,i] = trade['date']
-            trades[1,i] = trade['price']
-            trades[2,i] = trade['amount']
-
-        trades[0] = matplotlib.dates.epoch2num(trades[0])
-
-        self.parent.trades_proxy.refreshed.emit(trades)
+        self.parent.trades_proxy.processTrades(
+            [ (trade['tid'], int(trade['date']),
+               float(trade['price']), float(trade['amount']))
+              for trade in data ])
     
     
 class _BitstampPrivateRequest(dojima.network.ExchangePOSTRequest):
@@ -312,7 +364,7 @@ class _BitstampPrivateRequest(dojima.network.ExchangePOSTRequest):
         self.request.setHeader(QtNetwork.QNetworkRequest.ContentTypeHeader,
                                "application/x-www-form-urlencoded")
 
-        nonce = str(self.parent._nonce)
+        nonce = str(self.parent.nonces.next())
         
         message = bytes(nonce + self.parent._client_id + self.parent._api_key, 'utf')
         signature = hmac.new(bytes(self.parent._api_secret, 'utf'), msg=message, digestmod = hashlib.sha256).hexdigest().upper()
@@ -321,17 +373,19 @@ class _BitstampPrivateRequest(dojima.network.ExchangePOSTRequest):
         query.addQueryItem('key',       self.parent._api_key)
         query.addQueryItem('signature', signature)
         query.addQueryItem('nonce',     nonce)
-        self.parent._nonce += 1
         
         if self.params:
             for key, value in list(self.params.items()):
                 query.addQueryItem(key, value)
         self.query = query.encodedQuery()
 
+    def _nonce_refused(self, raw):
+        return 'Invalid nonce' in raw
+
     
 class BitstampBalanceRequest(_BitstampPrivateRequest):    
     url = QtCore.QUrl(URL_BASE + 'balance/')
-    priority = 2
+    stream = 'balance'
 
     """
     usd_balance - USD balance
@@ -358,7 +412,6 @@ class BitstampBalanceRequest(_BitstampPrivateRequest):
 
 class BitstampBitcoinDepositAddressRequest(_BitstampPrivateRequest):
     url = QtCore.QUrl(URL_BASE + 'bitcoin_deposit_address/')
-    priority = 2
 
     def _handle_reply(self, raw):
         logger.debug(raw)
@@ -368,7 +421,6 @@ class BitstampBitcoinDepositAddressRequest(_BitstampPrivateRequest):
 
 class BitstampBitcoinWithdrawalRequest(_BitstampPrivateRequest):
     url = QtCore.QUrl(URL_BASE + 'bitcoin_withdrawal/')
-    priority = 2
 
     def _handle_reply(self, raw):
         logger.debug(raw)
@@ -377,19 +429,18 @@ class BitstampBitcoinWithdrawalRequest(_BitstampPrivateRequest):
         
 class BitstampCancelOrderRequest(_BitstampPrivateRequest):
     url = QtCore.QUrl(URL_BASE + 'cancel_order/')
-    priority = 0
+    latency_class = dojima.network.ORDER
 
     def _handle_reply(self, raw):
         logger.debug(raw)
         data = json.loads(raw)
 
         if data == True:
-            search = self.parent.offers_model.findItems(self.params['id'])
-            for item in search:
-                self.parent.offers_model.removeRow(item.row())
+            self.parent.offers_model.removeOffer(self.params['id'])
 
         
 class _BitstampOrderRequest(_BitstampPrivateRequest):
+    latency_class = dojima.network.ORDER
 
     def _handle_reply(self, raw):
         logger.debug(raw)
@@ -399,21 +450,10 @@ class _BitstampOrderRequest(_BitstampPrivateRequest):
             self._handle_error(data['error'])
             return
         
-        row = self.parent.offers_model.rowCount()
-        
-        item = QtGui.QStandardItem(data['id'])
-        self.parent.offers_model.setItem(row, dojima.data.offers.ID, item)
-
-        item = QtGui.QStandardItem()
-        item.setData(Decimal(data['price']), QtCore.Qt.UserRole)
-        self.parent.offers_model.setItem(row, dojima.data.offers.PRICE, item)
-
-        item = QtGui.QStandardItem()
-        item.setData(Decimal(data['amount']), QtCore.Qt.UserRole)
-        self.parent.offers_model.setItem(row, dojima.data.offers.OUTSTANDING, item)
-
-        item = QtGui.QStandardItem(self.order_type)
-        self.parent.offers_model.setItem(row, dojima.data.offers.TYPE, item)
+        self.parent.offers_model.addOffer(str(data['id']),
+                                          Decimal(data['price']),
+                                          Decimal(data['amount']),
+                                          self.order_type)
 
         
 class BitstampBuyRequest(_BitstampOrderRequest):
@@ -428,39 +468,25 @@ class BitstampSellRequest(_BitstampOrderRequest):
         
 class BitstampOpenOrdersRequest(_BitstampPrivateRequest):    
     url = QtCore.QUrl(URL_BASE + 'open_orders/')
-    priority = 2
+    stream = 'offers'
 
     def _handle_reply(self, raw):
         logger.debug(raw)
         data = json.loads(raw)
-        self.parent.offers_model.clear()
-        if not data: return
-
-        row = 0
-
-        for order in data:
-            self.addOrder(row, order)
-            row += 1
-
-    def addOrder(self, row, order):
-        item = QtGui.QStandardItem(str(order['id']))
-        self.parent.offers_model.setItem(row, dojima.data.offers.ID, item)        
-
-        item = QtGui.QStandardItem()
-        item.setData(order['price'], QtCore.Qt.UserRole)
-        self.parent.offers_model.setItem(row, dojima.data.offers.PRICE, item)
+        if not data:
+            self.parent.offers_model.clear()
+            return
 
-        item = QtGui.QStandardItem()
-        item.setData(order['amount'], QtCore.Qt.UserRole)
-        self.parent.offers_model.setItem(row, dojima.data.offers.OUTSTANDING, item)
+        self.parent.offers_model.setOffers(
+            [ self.getOffer(order) for order in data ])
 
+    def getOffer(self, order):
         if order['type'] == BUY:
             order_type = dojima.data.offers.BID
         else:
             order_type = dojima.data.offers.ASK
-        
-        item = QtGui.QStandardItem(order_type)           
-        self.parent.offers_model.setItem(row, dojima.data.offers.TYPE, item)
+        return (str(order['id']), order['price'], order['amount'],
+                order_type, None, None)
         
 
 class BitstampEditCredentialsAction(dojima.exchange.EditCredentialsAction):
@@ -501,11 +527,3 @@ class BitstampEditCredentialsDialog(QtGui.QDialog):
     def save(self):
         saveAccountSettings(self.client_id_edit.text(), self.api_key_edit.text(), self.api_secret_edit.text())
         self.accept()
-        
-        
-def parse_markets():
-    if PLAIN_NAME in dojima.exchanges.container: return
-    exchange_proxy = BitstampExchangeProxy()
-    dojima.exchanges.container.addExchange(exchange_proxy)
-
-parse_markets()
@@ -19,42 +19,42 @@ import heapq
 import hmac
 import json
 import logging
+import re
 import time
 import urllib.parse
 
 from decimal import Decimal
 
-import matplotlib.dates
-import numpy as np
 from PyQt4 import QtCore, QtGui, QtNetwork
 
-import dojima.exchanges
 import dojima.exchange
+import dojima.exchange_modules
 import dojima.data.account
 import dojima.data.market
 import dojima.data.offers
-import dojima.markets
 import dojima.network
+import dojima.network.depth
+import dojima.network.nonce
 import dojima.ui.wizard
 
 
 PRETTY_NAME = "BTC-e"
 HOSTNAME = "btc-e.com"
 URL_BASE = "https://" + HOSTNAME + "/api/2/"
+# version 3 of the public API can answer for several pairs at once
+URL_BASE_3 = "https://" + HOSTNAME + "/api/3/"
 PLAIN_NAME = "btce"
 
 logger = logging.getLogger(PLAIN_NAME)
 
-MARKETS = ( 'btc_eur', 'btc_rur', 'btc_usd',
-            'eur_usd',
-            'ftc_btc',
-            'ltc_btc', 'ltc_eur', 'ltc_rur', 'ltc_usd',
-            'nmc_btc', 'nmc_btc',
-            'nvc_btc', 'nvc_usd',
-            'ppc_btc', 'ppc_usd',
-            'trc_btc', 
-            'usd_rur',
-            'xpm_btc',)
+# HTTP statuses and the error that show the batched ticker API is not there
+UNSUPPORTED_STATUS = (404, 405, 410, 501)
+UNSUPPORTED_ERROR = re.compile('invalid method', re.IGNORECASE)
+
+# BTC-e reports the last nonce it saw when it refuses one
+NONCE_REFUSAL = re.compile(r'invalid nonce.*on key:(\d+)')
+
+MARKETS = tuple(dojima.exchange_modules.get_record(PLAIN_NAME)['markets'])
 
 FACTORS = { 'btc':int(1e8),
             'eur':int(1e6),
@@ -93,55 +93,6 @@ def loadAccountSettings():
     return key, secret
 
 
-class BtceExchangeProxy(dojima.exchange.ExchangeProxy):
-
-    id = 'btce'
-    name = PRETTY_NAME
-    local_market_map = dict()
-    remote_market_map = dict()
-
-    def __init__(self):
-        self.exchange_object = None
-
-    def getExchangeObject(self):
-        if self.exchange_object is None:
-            self.exchange_object = BtceExchange()
-
-        return self.exchange_object
-
-    def getPrettyMarketName(self, remote_market_id):
-        # TODO make the asset seperator (/) locale dependant
-        s = remote_market_id.replace('_', '/')
-        return s.upper()
-
-    def getWizardPage(self, wizard):
-        return BtceWizardPage(wizard)
-        
-    def refreshMarkets(self):
-        for market_symbol in MARKETS:
-            remote_base_id, remote_counter_id = market_symbol.split('_')
-            local_counter_id = dojima.model.commodities.remote_model.getRemoteToLocalMap('btce-' + remote_counter_id)
-            local_base_id = dojima.model.commodities.remote_model.getRemoteToLocalMap('btce-' + remote_base_id)
-            if ((local_base_id is None) or
-                (local_counter_id is None)) : continue
-
-            local_pair = local_base_id + '_' + local_counter_id
-
-            if local_pair in self.local_market_map:
-                local_map = self.local_market_map[local_pair]
-            else:
-                local_map = list()
-                self.local_market_map[local_pair] = local_map
-
-            if market_symbol not in local_map:
-                local_map.append(market_symbol)
-
-            self.remote_market_map[market_symbol] = local_pair
-
-            dojima.markets.container.addExchange(self, local_pair,
-                                                 local_base_id, local_counter_id)
-
-            
 class BtceWizardPage(dojima.ui.wizard.ExchangeWizardPage):
     name = PRETTY_NAME
 
@@ -212,31 +163,27 @@ class BtceExchange(QtCore.QObject, dojima.exchange.Exchange):
         super(BtceExchange, self).__init__(parent)
 
         self.network_manager = network_manager
-        self.host_queue = self.network_manager.get_host_request_queue(HOSTNAME, 1000)
-        self.requests = list()
+        self.host_queue = self.network_manager.get_host_request_queue(HOSTNAME, 1000, 4)
+        # keep some of the host budget free for private requests
+        self.host_queue.set_budget(dojima.network.PUBLIC, 0.75, 3)
         self.replies = set()
 
         self._key = None
         self._secret = None
-        self._nonce = int(time.time() / 2)
+        self.nonces = None
         
         self.account_validity_proxies = dict()
         self.ticker_proxies = dict()
-        self.ticker_clients = dict()
         self.balance_proxies = dict()
         self.depth_proxies = dict()
         self.trades_proxies = dict()
 
         self.offers_model = dojima.data.offers.Model()
-        self.base_offers_proxies = dict()
-        self.offers_proxies = dict()
         self.offers_proxies_asks = dict()
         self.offers_proxies_bids = dict()
 
         self._ticker_refresh_rate = 16
-        self.ticker_timer = QtCore.QTimer(self)
-        self.ticker_timer.timeout.connect(self._refresh_tickers)
-        self.ticker_clients = dict()
+        self._batch_tickers = True
         
         self.loadAccountCredentials()
 
@@ -294,6 +241,7 @@ class BtceExchange(QtCore.QObject, dojima.exchange.Exchange):
         if self._key != key or self._secret != secret:
             self._key = key
             self._secret = secret
+            self.nonces = dojima.network.nonce.get_sequencer(PLAIN_NAME, key)
             for pair in MARKETS:
                 self.accountChanged.emit(pair)
 
@@ -332,18 +280,21 @@ class BtceExchange(QtCore.QObject, dojima.exchange.Exchange):
         BtceDepthRequest(market_id, self)
 
     def refreshOffers(self, pair=None):
-        if pair is None:
-            param = None
-        else:
-            params = {'pair': pair}
-
-        BtceOrdersRequest(params, self)
+        # the offers model holds every pair, so every pair is listed
+        BtceOrdersRequest(None, self)
 
     def refreshTrades(self, market_id):
         BtceTradesRequest(market_id, self)
         
-    def _refresh_tickers(self):
-        for pair in list(self.ticker_clients.keys()):
+    def refreshTicker(self, pair):
+        BtceTickerRequest(pair, self)
+
+    def refreshTickers(self, pairs):
+        if self._batch_tickers and len(pairs) > 1:
+            BtceMultiTickerRequest(pairs, self)
+            return
+
+        for pair in pairs:
             BtceTickerRequest(pair, self)
 
 
@@ -354,30 +305,30 @@ class _BtcePublicRequest(dojima.network.ExchangeGETRequest):
         self.parent = parent
         self.url = QtCore.QUrl(URL_BASE + pair + self.path)
         self.reply = None
-        parent.requests.append( (self.priority, self,) )
-        parent.host_queue.enqueue(self.parent, self.host_priority)
+        self._enqueue()
 
 
 class BtceDepthRequest(_BtcePublicRequest):
     path = "/depth"
+    stream = 'depth'
+    latency_class = dojima.network.BOOK
+    cache_ttl = 2
 
-    def _handle_reply(self, raw):
-        logger.debug(raw)
-        data = json.loads(raw)
+    def _create_parser(self):
+        return dojima.network.depth.DepthParser(self.url.toString())
 
+    def _handle_unchanged(self):
+        self.parent.getDepthProxy(self.pair).echo()
+
+    def _handle_reply(self, depth):
         proxy = self.parent.getDepthProxy(self.pair)
-        
-        bids = data['bids']
-        bids = np.array(bids).transpose()
-        proxy.processBids(bids)
-        
-        asks = data['asks']
-        asks = np.array(asks).transpose()
-        proxy.processAsks(asks)       
+        proxy.processBids(depth['bids'])
+        proxy.processAsks(depth['asks'])
 
         
 class BtceTickerRequest(_BtcePublicRequest):
     path = "/ticker"
+    stream = 'ticker'
     
     def _handle_reply(self, raw):
         logger.debug(raw)
@@ -389,45 +340,119 @@ class BtceTickerRequest(_BtcePublicRequest):
         proxy.bid_signal.emit(data['sell'])
 
         
-class BtceTradesRequest(_BtcePublicRequest):
-    path = "/trades"
+class BtceMultiTickerRequest(dojima.network.ExchangeGETRequest):
+    """Fetches the tickers of several pairs in one request. If the API
+    answers that it has no such method, the tickers are fetched a pair at
+    a time from then on, a request that fails in any other way is only
+    sent again."""
+    stream = 'tickers'
+    # a request that failed on the way is sent this many times in all
+    maximum_attempts = 2
+
+    def __init__(self, pairs, parent, attempt=1):
+        self.pairs = pairs
+        self.parent = parent
+        self.attempt = attempt
+        self.url = QtCore.QUrl(URL_BASE_3 + 'ticker/' + '-'.join(pairs))
+        self.url.addQueryItem('ignore_invalid', '1')
+        self.reply = None
+        self._enqueue()
+
+    def subscription_keys(self):
+        return [ ('ticker', pair) for pair in self.pairs ]
+
+    def _handle_error(self, error):
+        status = None
+        if self.reply is not None:
+            status = self.reply.attribute(
+                QtNetwork.QNetworkRequest.HttpStatusCodeAttribute)
+        if status in UNSUPPORTED_STATUS:
+            self._unsupported(error)
+        else:
+            # a timeout, a dropped connection or a busy server says
+            # nothing of the API
+            self._retry(error)
+
+    def _retry(self, error):
+        if self.attempt < self.maximum_attempts:
+            logger.info("batched ticker request failed, sending it again: %s",
+                        error)
+            BtceMultiTickerRequest(self.pairs, self.parent, self.attempt + 1)
+        else:
+            logger.warning("batched ticker request failed: %s", error)
+
+    def _unsupported(self, error):
+        logger.warning("batched tickers are not available, falling back to "
+                       "one request per pair: %s", error)
+        self.parent._batch_tickers = False
+        for pair in self.pairs:
+            BtceTickerRequest(pair, self.parent)
 
     def _handle_reply(self, raw):
         logger.debug(raw)
-        data = json.loads(raw)
+        try:
+            data = json.loads(raw, parse_float=Decimal, parse_int=Decimal)
+        except ValueError as e:
+            # a maintenance page or a truncated reply
+            self._retry(e)
+            return
+        if not isinstance(data, dict):
+            self._retry("unexpected reply: {}".format(raw[:64]))
+            return
+        if 'error' in data:
+            if UNSUPPORTED_ERROR.search(str(data['error'])):
+                self._unsupported(data['error'])
+            else:
+                self._retry(data['error'])
+            return
 
-        trades = np.empty( (3, len(data)) )
+        for pair in self.pairs:
+            if pair not in data:
+                logger.warning("no ticker for %s in batched reply", pair)
+                continue
+            ticker = data[pair]
+            proxy = self.parent.ticker_proxies[pair]
+            proxy.ask_signal.emit(ticker['buy'])
+            proxy.last_signal.emit(ticker['last'])
+            proxy.bid_signal.emit(ticker['sell'])
 
-        for i, trade in enumerate(data):
-            trades[0,i] = trade['date']
-            trades[1,i] = trade['price']
-            trades[2,i] = trade['amount']
 
-        trades[0] = matplotlib.dates.epoch2num(trades[0])
-        
+class BtceTradesRequest(_BtcePublicRequest):
+    path = "/trades"
+    stream = 'trades'
+    latency_class = dojima.network.HISTORY
+    cache_ttl = 5
+
+    def _handle_unchanged(self):
+        self.parent.getTradesProxy(self.pair).unchanged()
+
+    def _handle_reply(self, raw):
+        logger.debug(raw)
+        data = json.loads(raw)
+        # there is no way to ask for only the trades since an id, so the
+        # whole recent list is passed on and processTrades drops the
+        # trades the proxy already holds
         proxy = self.parent.getTradesProxy(self.pair)
-        proxy.refreshed.emit(trades)
+        proxy.processTrades([ (trade['tid'], trade['date'],
+                               trade['price'], trade['amount'])
+                              for trade in data ])
         
 
 class _BtcePrivateRequest(dojima.network.ExchangePOSTRequest):
-    priority = 1
-    host_priority = 0
     url = QtCore.QUrl("https://" + HOSTNAME + "/tapi")
 
     def __init__(self, params, parent):
         self.params = params
         self.parent = parent
         self.reply = None
-        parent.requests.append( (self.priority, self,) )
-        parent.host_queue.enqueue(self.parent, self.host_priority)
+        self._enqueue()
 
     def _prepare_request(self):
         self.request = QtNetwork.QNetworkRequest(self.url)
         self.request.setHeader(QtNetwork.QNetworkRequest.ContentTypeHeader,
                                "application/x-www-form-urlencoded")
         params = {'method': self.method,
-                  'nonce': str(self.parent._nonce)}
-        self.parent._nonce += 1
+                  'nonce': str(self.parent.nonces.next())}
         if self.params:
             params.update(self.params)
         self.query = urllib.parse.urlencode(params)
@@ -438,6 +463,13 @@ class _BtcePrivateRequest(dojima.network.ExchangePOSTRequest):
         self.request.setRawHeader('Key', self.parent._key)
         self.request.setRawHeader('Sign', signature)
 
+    def _nonce_refused(self, raw):
+        match = NONCE_REFUSAL.search(raw)
+        if match is None:
+            return False
+        self.parent.nonces.advance(int(match.group(1)))
+        return True
+
     def _handle_reply(self, raw):
         logger.debug(raw)
         data = json.loads(raw, parse_float=Decimal, parse_int=Decimal)
@@ -450,6 +482,7 @@ class _BtcePrivateRequest(dojima.network.ExchangePOSTRequest):
 
 class BtceInfoRequest(_BtcePrivateRequest):
     method = 'getInfo'
+    stream = 'balance'
 
     def handle_reply(self, data):
         for symbol, balance in list(data['funds'].items()):
@@ -460,7 +493,7 @@ class BtceInfoRequest(_BtcePrivateRequest):
                 
 class BtceCancelOrderRequest(_BtcePrivateRequest):
     method = 'CancelOrder'
-    priority = 0
+    latency_class = dojima.network.ORDER
 
     def _handle_reply(self, raw):
         logger.debug(raw)
@@ -470,59 +503,45 @@ class BtceCancelOrderRequest(_BtcePrivateRequest):
             logger.error("%s: %s", data['error'], self.query)
             return
                
-        search = self.parent.offers_model.findItems(self.order_id)
-        for item in search:
-            self.parent.offers_model.removeRows(item.row(), 1)
+        self.parent.offers_model.removeOffer(self.order_id)
 
             
 class BtceOrdersRequest(_BtcePrivateRequest):
     method = 'OrderList'
+    stream = 'offers'
 
     def _handle_reply(self, raw):
         logger.debug(raw)
         data = json.loads(raw, parse_float=Decimal, parse_int=Decimal)
-        self.parent.offers_model.clear()
-
         if 'return' not in data:
+            # having no offers is reported as an error
+            if data.get('error') == 'no orders':
+                self.parent.offers_model.clear()
+            else:
+                logger.error("%s: %s", data.get('error'), self.query)
             return
 
-        row = 0
+        offers = list()
         for order_id, order in list(data['return'].items()):
-
-            #id 
-            item = QtGui.QStandardItem(order_id)
-            self.parent.offers_model.setItem(row, dojima.data.offers.ID, item)
-
-            # price
-            item = QtGui.QStandardItem()
-            item.setData(order['rate'], QtCore.Qt.UserRole)
-            self.parent.offers_model.setItem(row, dojima.data.offers.PRICE, item)
-
-            # offer outstanding
-            item = QtGui.QStandardItem()
-            item.setData(order['amount'], QtCore.Qt.UserRole)
-            self.parent.offers_model.setItem(row, dojima.data.offers.OUTSTANDING, item)
-
             offer_type = order['type']
             if offer_type == 'sell':
-                item = QtGui.QStandardItem(dojima.data.offers.ASK)
-                self.parent.offers_model.setItem(row, dojima.data.offers.TYPE, item)
+                offer_type = dojima.data.offers.ASK
             elif offer_type == 'buy':
-                item = QtGui.QStandardItem(dojima.data.offers.BID)
-                self.parent.offers_model.setItem(row, dojima.data.offers.TYPE, item)
+                offer_type = dojima.data.offers.BID
             else:
                 logger.error("Unrecognized order type: %s", offer_type)
+                offer_type = None
 
             base_symbol, counter_symbol = get_symbols(order['pair'])
-            item = QtGui.QStandardItem(base_symbol)
-            self.parent.offers_model.setItem(row, dojima.data.offers.BASE, item)
-            item = QtGui.QStandardItem(counter_symbol)
-            self.parent.offers_model.setItem(row, dojima.data.offers.COUNTER, item)            
-            row += 1
+            offers.append((order_id, order['rate'], order['amount'],
+                           offer_type, base_symbol, counter_symbol))
+
+        self.parent.offers_model.setOffers(offers)
 
 
 class BtceTradeRequest(_BtcePrivateRequest):
     method = 'Trade'
+    latency_class = dojima.network.ORDER
 
     def _handle_reply(self, raw):
         logger.debug(raw)
@@ -532,23 +551,12 @@ class BtceTradeRequest(_BtcePrivateRequest):
             return
 
         base_symbol, counter_symbol = get_symbols(self.pair)
-        row = self.parent.offers_model.rowCount()
-
-        item = QtGui.QStandardItem()
-        item.setData(self.price, QtCore.Qt.UserRole)
-        self.parent.offers_model.setItem(row, dojima.data.offers.PRICE, item)
-        
-        item = QtGui.QStandardItem()
-        item.setData(self.amount, QtCore.Qt.UserRole)
-        self.parent.offers_model.setItem(row, dojima.data.offers.OUTSTANDING, item)        
-
-        item = QtGui.QStandardItem(self.type_)
-        self.parent.offers_model.setItem(row, dojima.data.offers.TYPE, item)
-
-        item = QtGui.QStandardItem(base_symbol)
-        self.parent.offers_model.setItem(row, dojima.data.offers.BASE, item)
-        item = QtGui.QStandardItem(counter_symbol)
-        self.parent.offers_model.setItem(row, dojima.data.offers.COUNTER, item)
+        order_id = data.get('return', dict()).get('order_id')
+        if order_id is not None:
+            order_id = str(order_id)
+        self.parent.offers_model.addOffer(order_id, self.price, self.amount,
+                                          self.type_,
+                                          base_symbol, counter_symbol)
         
         if self.type_ is dojima.data.offers.ASK:
             total = (- self.amount)
@@ -670,11 +678,3 @@ class BtceAccount:
     def get_commission(self, amount, remote_market=None):
         return amount * self.commission
 """
-    
-def parse_markets():
-    if PLAIN_NAME in dojima.exchanges.container: return
-
-    exchange_proxy = BtceExchangeProxy()
-    dojima.exchanges.container.addExchange(exchange_proxy)
-
-parse_markets()
@@ -24,7 +24,6 @@ import numpy as np
 from PyQt4 import QtCore, QtGui, QtNetwork
 
 import dojima.exchange
-import dojima.exchanges
 import dojima.data.market
 import dojima.data.offers
 import dojima.network
@@ -53,27 +52,6 @@ def loadAccountSettings():
     return username, password
 
 
-class CampbxExchangeProxy(dojima.exchange.ExchangeProxySingleMarket):
-
-    id = PLAIN_NAME
-    name = PRETTY_NAME
-    local_market_map = None
-    remote_market_map = None
-    base_id = 'campbx-BTC'
-    counter_id = 'campbx-USD'
-
-    def getExchangeObject(self):
-        if self.exchange_object is None:
-            self.exchange_object = CampbxExchange()
-        return self.exchange_object
-
-    def getPrettyMarketName(self, market_id):
-        return 'BTCUSD'
-
-    def getWizardPage(self, wizard):
-        return CampbxWizardPage(wizard)
-
-
 class CampbxWizardPage(dojima.ui.wizard.ExchangeWizardPage):
     name = PRETTY_NAME
 
@@ -146,8 +124,7 @@ class CampbxExchange(QtCore.QObject, dojima.exchange.ExchangeSingleMarket):
         super(CampbxExchange, self).__init__(parent)
 
         self.network_manager = network_manager
-        self.host_queue = self.network_manager.get_host_request_queue(HOSTNAME, 500)
-        self.requests = list()
+        self.host_queue = self.network_manager.get_host_request_queue(HOSTNAME, 500, 2)
         self.replies = set()
         self._username = None
         self._password = None
@@ -159,9 +136,6 @@ class CampbxExchange(QtCore.QObject, dojima.exchange.ExchangeSingleMarket):
         self.balance_proxies = dict()
         self.ticker_proxy = dojima.data.market.TickerProxyDecimal(self)
         self.depth_proxy = dojima.data.market.DepthProxy('BTCUSD', self)
-        self.ticker_clients = 0
-        self.ticker_timer = QtCore.QTimer(self)
-        self.ticker_timer.timeout.connect(self.refreshTicker)
 
         self.account_validity_proxy = dojima.data.account.AccountValidityProxy(self)
 
@@ -239,19 +213,16 @@ class CampbxExchange(QtCore.QObject, dojima.exchange.ExchangeSingleMarket):
 
 
 class _CampbxRequest(dojima.network.ExchangeGETRequest):
-    priority = 3
-    host_priority = None
+    pass
 
     
 class _CampbxPrivateRequest(dojima.network.ExchangePOSTRequest):
-    priority = 2
 
     def __init__(self, params, parent):
         self.params = params
         self.parent = parent
         self.reply = None
-        parent.requests.append( (self.priority, self,) )
-        parent.host_queue.enqueue(self.parent, self.host_priority)
+        self._enqueue()
 
     def _prepare_request(self):
         self.request = QtNetwork.QNetworkRequest(self.url)
@@ -268,6 +239,12 @@ class _CampbxPrivateRequest(dojima.network.ExchangePOSTRequest):
         
 class CampbxDepthRequest(_CampbxRequest):
     url = QtCore.QUrl(URL_BASE + 'xdepth.php')
+    stream = 'depth'
+    latency_class = dojima.network.BOOK
+    cache_ttl = 2
+
+    def _handle_unchanged(self):
+        self.parent.depth_proxy.echo()
     
     def _handle_reply(self, raw):
         logger.debug(raw)
@@ -284,6 +261,7 @@ class CampbxDepthRequest(_CampbxRequest):
 
 class CampbxTickerRequest(_CampbxRequest):
     url = QtCore.QUrl(URL_BASE + 'xticker.php')
+    stream = 'ticker'
 
     def _handle_reply(self, raw):
         logger.debug(raw)
@@ -302,7 +280,6 @@ class CampbxTickerRequest(_CampbxRequest):
 
 class CampbxBitcoinAddressRequest(_CampbxPrivateRequest):
     url = QtCore.QUrl(URL_BASE + 'getbtcaddr.php')
-    priority = 2
     
     def _handle_reply(self, raw):
         logger.debug(raw)
@@ -318,7 +295,6 @@ class CampbxBitcoinAddressRequest(_CampbxPrivateRequest):
         
 class CampbxBitcoinWithdrawalRequest(_CampbxPrivateRequest):
     url = QtCore.QUrl(URL_BASE + 'sendbtc.php')
-    priority = 2
 
     def _handle_reply(self, raw):
         logger.debug(raw)
@@ -329,7 +305,7 @@ class CampbxBitcoinWithdrawalRequest(_CampbxPrivateRequest):
         
 class CampbxFundsRequest(_CampbxPrivateRequest):
     url = QtCore.QUrl(URL_BASE + 'myfunds.php')
-    priority = 2
+    stream = 'balance'
     
     def _handle_reply(self, raw):
         logger.debug(raw)
@@ -343,42 +319,31 @@ class CampbxFundsRequest(_CampbxPrivateRequest):
 
 class CampbxOrdersRequest(_CampbxPrivateRequest):
     url = QtCore.QUrl(URL_BASE + 'myorders.php')
+    stream = 'offers'
     
     def _handle_reply(self, raw):
         logger.debug(raw)
         data = json.loads(raw)
-        self.parent.offers_model.clear()
-        row = 0
+        offers = list()
 
         if not 'Info' in data['Buy'][0]:
             for order in data['Buy']:
-                self.addOrder(row, order, dojima.data.offers.BID)
-                row += 1
+                offers.append(self.getOffer(order, dojima.data.offers.BID))
 
         if not 'Info' in data['Sell'][0]:
             for order in data['Sell']:
-                self.addOrder(row, order, dojima.data.offers.ASK)
-                row += 1
+                offers.append(self.getOffer(order, dojima.data.offers.ASK))
 
-    def addOrder(self, row, order, type_):
-        item = QtGui.QStandardItem(order['Order ID'])
-        self.parent.offers_model.setItem(row, dojima.data.offers.ID, item)
+        self.parent.offers_model.setOffers(offers)
 
-        item = QtGui.QStandardItem()
-        item.setData(Decimal(order['Price']), QtCore.Qt.UserRole)
-        self.parent.offers_model.setItem(row, dojima.data.offers.PRICE, item)
-
-        item = QtGui.QStandardItem()
-        item.setData(Decimal(order['Quantity']), QtCore.Qt.UserRole)
-        self.parent.offers_model.setItem(row, dojima.data.offers.OUTSTANDING, item)
-            
-        item = QtGui.QStandardItem(type_)
-        self.parent.offers_model.setItem(row, dojima.data.offers.TYPE, item)
+    def getOffer(self, order, type_):
+        return (order['Order ID'], Decimal(order['Price']),
+                Decimal(order['Quantity']), type_, None, None)
 
 
 class CampbxTradeRequest(_CampbxPrivateRequest):
     url = QtCore.QUrl(URL_BASE + 'tradeenter.php')
-    priority = 1
+    latency_class = dojima.network.ORDER
 
     def _handle_reply(self, raw):
         logger.debug(raw)
@@ -403,26 +368,13 @@ class CampbxTradeRequest(_CampbxPrivateRequest):
                 self.parent.counter_balance_proxy.balance_total_changed.emit(total)
 
         if order_id:
-            row = self.parent.offers_model.rowCount()
-
-            item = QtGui.QStandardItem(data['Success'])
-            self.parent.offers_model.setItem(row, dojima.data.offers.ID, item)
-
-            item = QtGui.QStandardItem()
-            item.setData(self.price, QtCore.Qt.UserRole)
-            self.parent.offers_model.setItem(row, dojima.data.offers.PRICE, item)
-        
-            item = QtGui.QStandardItem()
-            item.setData(self.quantity, QtCore.Qt.UserRole)
-            self.parent.offers_model.setItem(row, dojima.data.offers.OUTSTANDING, item)        
-
-            item = QtGui.QStandardItem(self.type_)
-            self.parent.offers_model.setItem(row, dojima.data.offers.TYPE, item)
+            self.parent.offers_model.addOffer(data['Success'], self.price,
+                                              self.quantity, self.type_)
 
                 
 class CampbxCancelOrderRequest(_CampbxPrivateRequest):
     url = QtCore.QUrl(URL_BASE + 'tradecancel.php')
-    priority = 0
+    latency_class = dojima.network.ORDER
     
     def _handle_reply(self, raw):
         logger.debug(raw)
@@ -430,14 +382,11 @@ class CampbxCancelOrderRequest(_CampbxPrivateRequest):
 
         words = data['Success'].split()
         order_id = words[2]
-        search = self.parent.offers_model.findItems(order_id)
-        for item in search:
-            self.parent.offers_model.removeRow(item.row())
+        self.parent.offers_model.removeOffer(order_id)
 
             
 class CampbxWithdrawBitcoinRequest(_CampbxPrivateRequest):
-    priority = 2
-    
+
     def _handle_reply(self, raw):
         logger.debug(raw)
         data = json.loads(raw)
@@ -483,12 +432,3 @@ class CampbxEditCredentialsDialog(QtGui.QDialog):
     def save(self):
         saveAccountSettings(self.username_edit.text(), self.password_edit.text())
         self.accept()
-        
-
-def parse_markets():
-    if PLAIN_NAME in dojima.exchanges.container: return
-    exchange_proxy = CampbxExchangeProxy()
-    dojima.exchanges.container.addExchange(exchange_proxy)
-
-parse_markets()
-
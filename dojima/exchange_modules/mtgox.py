@@ -24,8 +24,6 @@ import time
 
 from decimal import Decimal
 
-import matplotlib.dates
-import numpy as np
 from PyQt4 import QtCore, QtGui, QtNetwork
 
 import dojima.exchange
@@ -33,6 +31,8 @@ import dojima.exchanges
 import dojima.data.offers
 import dojima.data.market
 import dojima.network
+import dojima.network.depth
+import dojima.network.nonce
 import dojima.ui.wizard
 
 
@@ -238,29 +238,23 @@ class MtgoxExchange(QtCore.QObject, dojima.exchange.Exchange):
         super(MtgoxExchange, self).__init__(parent)
         
         self.network_manager = network_manager
-        self.host_queue = self.network_manager.get_host_request_queue(HOSTNAME, 5000)
-        self.requests = list()
+        self.host_queue = self.network_manager.get_host_request_queue(HOSTNAME, 5000, 2)
         self.replies = set()
         #self.factors = dict()
 
         self._key = None
         self._secret = None
-        self._nonce = int(time.time() / 2)     
+        self.nonces = None
 
         self.account_validity_proxies = dict()
         self.balance_proxies = dict()
         self.depth_proxies = dict()
         self.ticker_proxies = dict()
-        self.ticker_clients = dict()
         self.trades_proxies = dict()
 
-        self.ticker_timer = QtCore.QTimer(self)
-        self.ticker_timer.timeout.connect(self._refresh_tickers)
         self._ticker_refresh_rate = 16
 
         self.offers_model = dojima.data.offers.Model()
-        self.base_offers_proxies = dict()
-        self.offers_proxies = dict()
         self.offers_proxies_asks = dict()
         self.offers_proxies_bids = dict()
         
@@ -339,6 +333,7 @@ class MtgoxExchange(QtCore.QObject, dojima.exchange.Exchange):
         if self._key != key or self._secret != secret:
             self._key = key
             self._secret = secret
+            self.nonces = dojima.network.nonce.get_sequencer(PLAIN_NAME, key)
 
             for pair in market_list:
                 self.accountChanged.emit(pair)       
@@ -381,9 +376,8 @@ class MtgoxExchange(QtCore.QObject, dojima.exchange.Exchange):
     def refreshTrades(self, pair):
         MtgoxTradesRequest(pair, self)
 
-    def _refresh_tickers(self):
-        for pair in list(self.ticker_clients.keys()):
-            MtgoxTickerRequest(pair, self)
+    def refreshTicker(self, pair):
+        MtgoxTickerRequest(pair, self)
 
 
 class _MtgoxPublicRequest(dojima.network.ExchangeGETRequest):
@@ -393,39 +387,32 @@ class _MtgoxPublicRequest(dojima.network.ExchangeGETRequest):
         self.parent = parent
         self.url = QtCore.QUrl(URL_BASE + pair + self.path)
         self.reply = None
-        parent.requests.append( (self.priority, self,) )
-        parent.host_queue.enqueue(self.parent, self.host_priority)
+        self._enqueue()
 
         
 class MtgoxDepthRequest(_MtgoxPublicRequest):
     path = "/money/depth/fetch"
+    stream = 'depth'
+    latency_class = dojima.network.BOOK
+    cache_ttl = 5
 
-    def _handle_reply(self, raw):
-        logger.debug(raw)
-        data = json.loads(raw)
-        proxy = self.parent.getDepthProxy(self.pair)
+    def _handle_unchanged(self):
+        self.parent.getDepthProxy(self.pair).echo()
 
-        offers = data['data']['asks']
-        a = np.empty((2, len(offers)))
-        for i, offer in enumerate(offers):
-            a[0,i] = offer["price"]
-            a[1,i] = offer["amount"]
-        
-        proxy.processAsks(a)
-        
-        offers = data['data']['bids']
-        offers.reverse()
-        a = np.empty((2, len(offers)))
-        for i, offer in enumerate(offers):
-            a[0,i] = offer["price"]
-            a[1,i] = offer["amount"]
+    def _create_parser(self):
+        return dojima.network.depth.DepthParser(self.url.toString(),
+                                                dojima.network.depth.OBJECT)
 
-        
-        proxy.processBids(a)
+    def _handle_reply(self, depth):
+        proxy = self.parent.getDepthProxy(self.pair)
+        proxy.processAsks(depth['asks'])
+        # bids are sent lowest first
+        proxy.processBids(depth['bids'][:,::-1])
 
 
 class MtgoxTickerRequest(_MtgoxPublicRequest):
     path = "/money/ticker_fast"
+    stream = 'ticker'
 
     def _handle_reply(self, raw):
         logger.debug(raw)
@@ -439,35 +426,41 @@ class MtgoxTickerRequest(_MtgoxPublicRequest):
         
 class MtgoxTradesRequest(_MtgoxPublicRequest):
     path = "/money/trades/fetch"
+    stream = 'trades'
+    latency_class = dojima.network.HISTORY
+    cache_ttl = 10
+
+    def __init__(self, pair, parent):
+        self.pair = pair
+        self.parent = parent
+        self.url = QtCore.QUrl(URL_BASE + pair + self.path)
+        cursor = parent.getTradesProxy(pair).getCursor()
+        if cursor is not None:
+            # only the trades after the newest one held
+            self.url.addQueryItem('since', str(cursor[0]))
+        self.reply = None
+        self._enqueue()
+
+    def _handle_unchanged(self):
+        self.parent.getTradesProxy(self.pair).unchanged()
 
     def _handle_reply(self, raw):
         logger.debug(raw)
         data = json.loads(raw)["data"]
-        
-        trades = np.empty((3, len(data),))
-
-        for i, trade in enumerate(data):
-            trades[0,i] = trade['date']
-            trades[1,i] = trade['price']
-            trades[2,i] = trade['amount']
-
-        trades[0] = matplotlib.dates.epoch2num(trades[0])
-                                  
         proxy = self.parent.getTradesProxy(self.pair)
-        proxy.refreshed.emit(trades)
+        proxy.processTrades([ (int(trade['tid']), trade['date'],
+                               float(trade['price']), float(trade['amount']))
+                              for trade in data ])
 
         
 class _MtgoxPrivateRequest(dojima.network.ExchangePOSTRequest):
-    priority = 1
-    host_priority = 0
 
     def __init__(self, pair, params, parent):
         self.pair = pair
         self.params = params
         self.parent = parent
         self.reply = None
-        parent.requests.append( (self.priority, self,) )
-        parent.host_queue.enqueue(self.parent, self.host_priority)
+        self._enqueue()
         
     def _prepare_request(self):
         path = self.pair + self.method
@@ -478,8 +471,7 @@ class _MtgoxPrivateRequest(dojima.network.ExchangePOSTRequest):
         self.request.setHeader(QtNetwork.QNetworkRequest.ContentTypeHeader,
                           "application/x-www-form-urlencoded")
         query = QtCore.QUrl()
-        query.addQueryItem('nonce', str(self.parent._nonce))
-        self.parent._nonce += 1
+        query.addQueryItem('nonce', str(self.parent.nonces.next()))
         if self.params:
             for key, value in list(self.params.items()):
                 query.addQueryItem(key, value)
@@ -491,6 +483,9 @@ class _MtgoxPrivateRequest(dojima.network.ExchangePOSTRequest):
         self.request.setRawHeader('Rest-Key', self.parent._key)
         self.request.setRawHeader('Rest-Sign', signature)
 
+    def _nonce_refused(self, raw):
+        return 'Invalid nonce' in raw
+
     def _handle_reply(self, raw):
         logger.debug(raw)
         data = json.loads(raw, object_hook=_object_hook)
@@ -503,7 +498,7 @@ class _MtgoxPrivateRequest(dojima.network.ExchangePOSTRequest):
             
 class MtgoxInfoRequest(_MtgoxPrivateRequest):
     method = "/money/info"
-    priority = 2
+    stream = 'balance'
         
     def handle_reply(self, data):
             for symbol, dict_ in list(data["Wallets"].items()):
@@ -520,92 +515,46 @@ class MtgoxInfoRequest(_MtgoxPrivateRequest):
             
 class MtgoxCancelOrderRequest(_MtgoxPrivateRequest):
     method = "/money/order/cancel"
-    priority = 0
+    latency_class = dojima.network.ORDER
 
     def handle_reply(self, data):
-        search = self.parent.offers_model.findItems(data["oid"])
-        for item in search:
-            self.parent.offers_model.removeRows(item.row(), 1)
+        self.parent.offers_model.removeOffer(data["oid"])
 
         
 class MtgoxOrdersRequest(_MtgoxPrivateRequest):
     method = "/money/orders"
+    stream = 'offers'
 
     def handle_reply(self, data):
-        self.parent.offers_model.clear()
         if not data:
+            self.parent.offers_model.clear()
             return
 
-        row = 0
+        offers = list()
         for order in data:
-            #id
-            item = QtGui.QStandardItem(order["oid"])
-            self.parent.offer_model.setItem(row, dojima.data.offer.ID, item)
-                                       
-            # price
-            item = QtGui.QStandardItem()
-            item.setData(order["price"], QtCore.Qt.UserRole)
-            self.parent.offer_model.setItem(row, dojima.data.PRICE, item)
-            
-            # outstanding
-            item = QtGui.QStandardItem()
-            item.setData(order["amount"], QtCore.Qt.UserRole)
-            self.parent.offer_model.setItem(row, dojima.data.OUTSTANDING, item)
-
-            # type
-            order_type = order["type"]
+            offer_type = order["type"]
             if offer_type == "ask":
-                item = QtGui.QStandardItem(dojima.data.offers.ASK)
-                self.parent.offers_model.setItem(row, dojima.data.offers.TYPE, item)
+                offer_type = dojima.data.offers.ASK
             elif offer_type == "bid":
-                item = QtGui.QStandardItem(dojima.data.offers.BID)
-                self.parent.offers_model.setItem(row, dojima.data.offers.TYPE, item)
+                offer_type = dojima.data.offers.BID
             else:
                 logger.error("Unrecognized order type: %s", offer_type)
+                offer_type = None
 
-            # base
-            item = QtGui.QStandardItem(order["item"])
-            self.parent.offers_model.setItem(row, dojima.data.offers.BASE, item)
+            offers.append((order["oid"], order["price"], order["amount"],
+                           offer_type, order["item"], order["currency"]))
 
-            item = QtGui.QStandardItem(order["currency"])
-            self.parent.offers_model.setItem(row, dojima.data.offers.COUNTER, item)
-
-            row += 1
+        self.parent.offers_model.setOffers(offers)
 
 
 class MtgoxOrderRequest(_MtgoxPrivateRequest):
     method = "/money/order/add"
-    priority = 1
+    latency_class = dojima.network.ORDER
 
     def handle_reply(self, order_id):
-        row = self.parent.offers_model.rowCount()
-        
-        #id
-        item = QtGui.QStandardItem(order_id)
-        self.parent.offer_model.setItem(row, dojima.data.offer.ID, item)
-                                       
-        # price
-        item = QtGui.QStandardItem()
-        item.setData(self.price, QtCore.Qt.UserRole)
-        self.parent.offer_model.setItem(row, dojima.data.PRICE, item)
-            
-        # outstanding
-        item = QtGui.QStandardItem()
-        item.setData(self.amount, QtCore.Qt.UserRole)
-        self.parent.offer_model.setItem(row, dojima.data.OUTSTANDING, item)
-
-        # type
-        item = QtGui.QStandardItem(self.type_)
-        self.parent.offers_model.setItem(row, dojima.data.offers.TYPE, item)
-
         base, counter = get_symbols(self.pair)
-        # base
-        item = QtGui.QStandardItem(base)
-        self.parent.offers_model.setItem(row, dojima.data.offers.BASE, item)
-
-        # counter
-        item = QtGui.QStandardItem(counter)
-        self.parent.offers_model.setItem(row, dojima.data.offers.COUNTER, item)
+        self.parent.offers_model.addOffer(order_id, self.price, self.amount,
+                                          self.type_, base, counter)
 
         
 class MtgoxEditCredentialsAction(dojima.exchange.EditCredentialsAction):
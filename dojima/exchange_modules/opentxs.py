@@ -517,9 +517,6 @@ class OTExchange(QtCore.QObject, dojima.exchange.Exchange):
         self.offers_proxies_asks = dict()
         self.offers_proxies_bids = dict()
 
-        self.base_offers_proxies = dict()
-        self.offers_proxies = dict()
-
         storable = otapi.QueryObject(otapi.STORED_OBJ_MARKET_LIST, 'markets',
                                      self.server_id, 'market_data.bin')
         market_list = otapi.MarketList.ot_dynamic_cast(storable)
@@ -545,15 +542,13 @@ class OTExchange(QtCore.QObject, dojima.exchange.Exchange):
         self.ticker_timer.timeout.connect(self.enqueueGetMarketList)
 
     def _cancel_offer(self, order_id, market_id=None):
-        search = self.offers_model.findItems(order_id)
-        if not search:
+        offer = self.offers_model.getOffer(order_id)
+        if offer is None:
             logger.error("could not find order id %s to cancel", order_id)
             return
-        row = search[0].row()
         # TODO queuing the account and transaction number but not the nym id
         # could be a problem as the nym may change before the order is cancelled
-        account_id = self.offers_model.item(
-            row, dojima.data.offers.BASE).text()
+        account_id = offer[dojima.data.offers.BASE]
 
         self.requestRequest( (0, OTRequestCancelOffer(self.nym_id,
                                                       str(account_id),
@@ -650,35 +645,13 @@ class OTExchange(QtCore.QObject, dojima.exchange.Exchange):
         c_contract = dojima.ot.contract.CurrencyContract(c_asset_id)
         return ( b_contract.getFactor(), c_contract.getFactor(), )
 
-    def getOffersModel(self, market_id):
-        # what happens here is there is a model that contains all nym offers,
-        # that model is filtered by the base account,
-        # that model is filtered by the counter account.
-
+    def getOffersPartition(self, market_id):
+        # a model contains all nym offers, the offers of a market
+        # are those of its base and counter accounts
         if self.offers_model is None:
             self.offers_model = dojima.data.offers.Model()
-
-        if market_id in self.offers_proxies:
-            return self.offers_proxies[market_id]
-
         bacid, cacid = self.accounts[market_id]
-        if bacid in self.base_offers_proxies:
-            base_proxy = self.base_offers_proxies[bacid]
-        else:
-            base_proxy = QtGui.QSortFilterProxyModel()
-            base_proxy.setSourceModel(self.offers_model)
-            base_proxy.setFilterKeyColumn(dojima.data.offers.BASE)
-            base_proxy.setFilterFixedString(bacid)
-            base_proxy.setDynamicSortFilter(True)
-            self.base_offers_proxies[bacid] = base_proxy
-
-        proxy = QtGui.QSortFilterProxyModel()
-        proxy.setSourceModel(base_proxy)
-        proxy.setFilterKeyColumn(dojima.data.offers.COUNTER)
-        proxy.setFilterFixedString(cacid)
-        proxy.setDynamicSortFilter(True)
-        self.offers_proxies[market_id] = proxy
-        return proxy
+        return bacid, cacid
 
     def getPowers(self, market_id):
         b_asset_id, c_asset_id = self.assets[market_id]
@@ -824,46 +797,24 @@ class OTExchange(QtCore.QObject, dojima.exchange.Exchange):
                                      nym_id + '.bin')
         if not storable: return
         offers = otapi.OfferListNym.ot_dynamic_cast(storable)
-        self.offers_model.clear()
-
+        rows = list()
         for row in range(offers.GetOfferDataNymCount()):
             offer = offers.GetOfferDataNym(row)
 
-            # Offer ID
-            item = QtGui.QStandardItem(offer.transaction_id)
-            self.offers_model.setItem(row, dojima.data.offers.ID, item)
-
-            # Offer price
-            value = ( int(offer.price_per_scale)
+            price = ( int(offer.price_per_scale)
                       * int(offer.minimum_increment)
                       * int(offer.scale) )
-
-            item = QtGui.QStandardItem()
-            item.setData(value, QtCore.Qt.UserRole)
-            self.offers_model.setItem(row, dojima.data.offers.PRICE, item)
-
-            # Offer outstanding
-            value = ( int(offer.total_assets)
-                      - int(offer.finished_so_far) )
-            item = QtGui.QStandardItem()
-            item.setData(value, QtCore.Qt.UserRole)
-            self.offers_model.setItem(row, dojima.data.offers.OUTSTANDING, item)
-
-            # Offer type
+            outstanding = ( int(offer.total_assets)
+                            - int(offer.finished_so_far) )
             if offer.selling:
-                item = QtGui.QStandardItem(dojima.data.offers.ASK)
+                offer_type = dojima.data.offers.ASK
             else:
-                item = QtGui.QStandardItem(dojima.data.offers.BID)
-            self.offers_model.setItem(row, dojima.data.offers.TYPE, item)
-
-            # Offer base account
-            self.offers_model.setItem(row, dojima.data.offers.BASE,
-                                      QtGui.QStandardItem(
-                                          offer.asset_acct_id))
-            # Offer counter account
-            self.offers_model.setItem(row, dojima.data.offers.COUNTER,
-                                      QtGui.QStandardItem(
-                                          offer.currency_acct_id))
+                offer_type = dojima.data.offers.BID
+
+            rows.append((offer.transaction_id, price, outstanding, offer_type,
+                         offer.asset_acct_id, offer.currency_acct_id))
+
+        self.offers_model.setOffers(rows)
 
     def readTrades(self, market_id):
         proxy = self.trades_proxies.items[market_id]
@@ -873,14 +824,13 @@ class OTExchange(QtCore.QObject, dojima.exchange.Exchange):
         trades = otapi.TradeListMarket.ot_dynamic_cast(storable)
         if not trades: return
 
-        epochs, prices, amounts = list(), list(), list()
+        rows = list()
         for i in range(trades.GetTradeDataMarketCount()):
             trade = trades.GetTradeDataMarket(i)
-            epochs.append( int(trade.date))
-            prices.append( float(trade.price))
-            amounts.append( float(trade.amount_sold))
+            rows.append( (int(trade.transaction_id), int(trade.date),
+                          float(trade.price), float(trade.amount_sold)) )
 
-        proxy.processTrades(epochs, prices, amounts)
+        proxy.processTrades(rows)
 
     def refresh(self, market_id):
         self.refreshBalance(market_id)
@@ -14,6 +14,9 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import dojima.startup
+
+
 class ExchangesContainer(object):
 
     def __init__(self):
@@ -36,5 +39,6 @@ class ExchangesContainer(object):
 
 container = ExchangesContainer()
 
+@dojima.startup.timed('dojima.exchanges.refresh')
 def refresh():
     container.refresh()
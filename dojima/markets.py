@@ -56,10 +56,22 @@ class MarketProxy(object):
         self.exchanges = list()
         self.pair = marketPair
         self.base_id, self.counter_id = marketPair.split('_')
+        self.book = None
 
     def append(self, exchangeProxy):
         self.exchanges.append(exchangeProxy)
 
+    def getConsolidatedBook(self):
+        """Return the depth of all exchanges that trade this market, and
+        of those that trade it the other way around, as one book."""
+        if self.book is None:
+            # numpy is only needed once a book is
+            import dojima.data.book
+            inverse_pair = self.counter_id + '_' + self.base_id
+            self.book = dojima.data.book.ConsolidatedBook(
+                self, container.markets.get(inverse_pair))
+        return self.book
+
     def getPrettyName(self):
         base, counter = dojima.model.commodities.local_model.getNames(self.base_id, self.counter_id)
         return QtCore.QCoreApplication.translate('MarketProxy', "{0} / {1}", 
@@ -17,6 +17,7 @@
 
 from PyQt4 import QtCore, QtGui
 import dojima.model.base
+import dojima.startup
 
 
 class LocalCommoditiesModel(QtGui.QStandardItemModel):
@@ -111,6 +112,7 @@ class LocalCommoditiesModel(QtGui.QStandardItemModel):
         self.appendRow(items)
         return item.row()
 
+    @dojima.startup.timed('LocalCommoditiesModel.revert')
     def revert(self):
         settings = QtCore.QSettings()
         settings.beginGroup('local_commodities')
@@ -185,6 +187,7 @@ class RemoteCommoditiesModel(QtGui.QStandardItemModel):
         self.appendRow( (QtGui.QStandardItem(remote_id),
                          QtGui.QStandardItem(local_id),) )
 
+    @dojima.startup.timed('RemoteCommoditiesModel.revert')
     def revert(self):
         settings = QtCore.QSettings()
         settings.beginGroup('remote_commodities')
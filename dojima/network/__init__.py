@@ -15,60 +15,469 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import heapq
-import queue
+import itertools
 import logging
-import random
+import time
 from PyQt4 import QtCore, QtNetwork
 
+import dojima.network.cache
+import dojima.network.encoding
+import dojima.network.metrics
+import dojima.network.record
+
 
 logger = logging.getLogger(__name__)
 
 network_manager = None
 
+# Endpoint classes, each may be given its own budget within a host's budget.
+PUBLIC = 'public'
+PRIVATE = 'private'
+
+# Latency classes, and the seconds after it is made that a request of each
+# class should be sent by.
+ORDER = 'order'
+ACCOUNT = 'account'
+BOOK = 'book'
+TICKER = 'ticker'
+HISTORY = 'history'
+
+DEADLINES = { ORDER: 0.25,
+              ACCOUNT: 2,
+              BOOK: 4,
+              TICKER: 8,
+              HISTORY: 30 }
+
+# Qt opens up to this many connections to a host, and closes those that
+# have been idle for CONNECTION_TIMEOUT seconds.
+MAXIMUM_CONNECTIONS = 6
+CONNECTION_TIMEOUT = 120
+# Seconds a warm host may be idle before a request is made to keep its
+# connection open
+KEEP_ALIVE_IDLE = 90
+
+# The streams a SubscriptionManager polls, with the exchange method that
+# refreshes each, its endpoint class and its default interval in seconds.
+SUBSCRIPTION_STREAMS = { 'ticker':  ('refreshTicker',  PUBLIC,  16),
+                         'depth':   ('refreshDepth',   PUBLIC,  30),
+                         'trades':  ('refreshTrades',  PUBLIC,  60),
+                         'balance': ('refreshBalance', PRIVATE, 60),
+                         'offers':  ('refreshOffers',  PRIVATE, 60) }
+# Poll intervals stay within these factors of the base interval, and are
+# never shorter than MINIMUM_INTERVAL seconds.
+FASTEST = 0.25
+SLOWEST = 4
+MINIMUM_INTERVAL = 4
+# How an interval is scaled when a reply changes, when it repeats, and
+# when the last price moves by more than MOVE_THRESHOLD.
+CHANGED_FACTOR = 0.8
+REPEATED_FACTOR = 1.5
+MOVED_FACTOR = 0.5
+MOVE_THRESHOLD = 0.002
+
 def get_network_manager(parent=None):
+    global network_manager
     if not network_manager:
-        global network_manager
         network_manager = NetworkAccessManager(parent)
     return network_manager
 
+def set_network_manager(manager):
+    """Make manager the one exchanges use, this must be done before any
+    exchange object is made."""
+    global network_manager
+    network_manager = manager
+
+
+class TokenBucket(object):
+    """Tokens accrue at rate per second, up to burst tokens."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.stamp = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def consume(self):
+        self._refill()
+        self.tokens -= 1
+
+    def delay(self):
+        """Return the seconds until a token is available."""
+        self._refill()
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
 
 class HostRequestQueue(QtCore.QObject):
-    """Queues requests for a host."""
+    """Holds the request budget of a host.
 
-    #pending_requests_signal = QtCore.pyqtSignal(int)
+    A request may be sent when there is a token in the host bucket and in
+    the bucket of its endpoint class, if that class has a budget of its own.
+    """
 
-    def __init__(self, wait, parent=None):
+    def __init__(self, wait, parent=None, burst=1, hostname=None):
         super(HostRequestQueue, self).__init__(parent)
-        self.queue = queue.PriorityQueue()
+        self.hostname = hostname
         self.wait = wait
-        self.timer = QtCore.QTimer(self)
-        self.timer.timeout.connect(self.pop)
-        self.timer.start(wait)
+        self.bucket = TokenBucket(1000.0 / wait, burst)
+        self.budgets = dict()
+        self.in_flight = 0
+        self.connections = 0
+        self.last_active = None
 
     def set_wait(self, wait):
-        """Change the minimum interval between requests"""
-        self.timer.setInterval(wait)
+        """Change the minimum average interval between requests"""
+        self.bucket.rate = 1000.0 / wait
         self.wait = wait
 
-    def enqueue(self, requester, priority=None):
-        """Enqueue an object that wishes to request"""
-        if not self.timer.isActive():
-            self.timer.start(self.wait)
-            requester.pop_request()
-        else:
-            if priority is None:
-                priority = random.randint(4,16)
-            self.queue.put((priority, requester))
-
-    def pop(self):
-        # TODO !!! if queue is empty and wait has elasped since the last
-        # pop, pop immediatly
-        """Pop an object that has a request queued and call pop_request()"""
-        if self.queue.empty():
+    def set_burst(self, burst):
+        """Change how many requests may be sent back to back"""
+        self.bucket.burst = burst
+
+    def set_budget(self, endpoint, rate, burst=1):
+        """Limit an endpoint class to rate requests per second, within the
+        host budget."""
+        self.budgets[endpoint] = TokenBucket(rate, burst)
+
+    def consume(self, endpoint):
+        self.bucket.consume()
+        if endpoint in self.budgets:
+            self.budgets[endpoint].consume()
+
+    def delay(self, endpoint):
+        """Return the seconds until a request of endpoint may be sent."""
+        delay = self.bucket.delay()
+        if endpoint in self.budgets:
+            delay = max(delay, self.budgets[endpoint].delay())
+        return delay
+
+    def idle(self):
+        """Return the seconds since a request to the host was last active."""
+        if self.in_flight or self.last_active is None:
+            return 0
+        return time.monotonic() - self.last_active
+
+    def begin_request(self):
+        """Count a request going out to the host, and return True if it
+        should find a connection already open.
+
+        Qt does not tell which connection a reply came over, so this is
+        estimated from the requests in flight and the connections that
+        Qt would have kept open."""
+        now = time.monotonic()
+        if (self.last_active is None or
+            (not self.in_flight and now - self.last_active > CONNECTION_TIMEOUT)):
+            self.connections = 0
+        reused = (self.in_flight < self.connections or
+                  self.connections == MAXIMUM_CONNECTIONS)
+        if not reused:
+            self.connections += 1
+        self.in_flight += 1
+        self.last_active = now
+        dojima.network.metrics.record_connection(self.hostname, reused)
+        return reused
+
+    def end_request(self):
+        self.in_flight = max(self.in_flight - 1, 0)
+        self.last_active = time.monotonic()
+
+
+class RequestScheduler(QtCore.QObject):
+    """Sends the requests of every host, earliest deadline first.
+
+    A request's deadline is the time it was made plus the deadline of its
+    latency class. Deadlines grow with the time requests are made, so a
+    request that has waited long enough goes before any newer request,
+    whatever its class, and no class can starve another.
+    """
+
+    def __init__(self, parent=None):
+        super(RequestScheduler, self).__init__(parent)
+        self.pending = list()
+        self.latest = dict()
+        self.missed = 0
+        self.dropped = 0
+        self._sequence = itertools.count()
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.dispatch)
+
+    def enqueue(self, request):
+        """Queue request, dropping any queued request that it supersedes"""
+        key = request.supersede_key()
+        if key is not None:
+            older = self.latest.get(key)
+            if older is not None:
+                older.superseded = True
+                request._supersede(older)
+                self.dropped += 1
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("dropped superseded request for %s",
+                                 older.url.toString())
+            self.latest[key] = request
+
+        request.enqueued = time.monotonic()
+        request.deadline = request.enqueued + DEADLINES[request.latency_class]
+        heapq.heappush(self.pending,
+                       (request.deadline, next(self._sequence), request))
+        self.dispatch()
+
+    def dispatch(self):
+        """Send every pending request that its host budget allows, and wait
+        for the next token if any are left."""
+        delay = None
+        blocked = set()
+        held = list()
+        while self.pending:
+            entry = heapq.heappop(self.pending)
+            request = entry[-1]
+            if request.superseded:
+                continue
+
+            host_queue = request.parent.host_queue
+            budget = (host_queue, request.endpoint)
+            if budget in blocked:
+                held.append(entry)
+                continue
+
+            wait = host_queue.delay(request.endpoint)
+            if wait:
+                blocked.add(budget)
+                held.append(entry)
+                if delay is None or wait < delay:
+                    delay = wait
+                continue
+
+            host_queue.consume(request.endpoint)
+            key = request.supersede_key()
+            if key is not None and self.latest.get(key) is request:
+                del self.latest[key]
+            if time.monotonic() > request.deadline:
+                self.missed += 1
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("sending %s after its deadline",
+                                 request.url.toString())
+            request.send()
+
+        for entry in held:
+            heapq.heappush(self.pending, entry)
+        if self.pending:
+            self.timer.start(int(delay * 1000) + 1)
+
+
+class RequestCoalescer(object):
+    """Tracks public requests that are queued or in flight so that
+    identical requests made later may share the one reply.
+
+    The handlers of each attached request are called in turn with the
+    shared reply, or error, so coalescing is only for requests whose
+    handlers are idempotent.
+    """
+
+    def __init__(self):
+        self.pending = dict()
+        self.attached = 0
+
+    def key(self, request):
+        params = getattr(request, 'params', None)
+        if params:
+            params = tuple(sorted(params.items()))
+        return (request.url.host(), request.url.toString(), params)
+
+    def attach(self, request):
+        """Attach request to an identical pending request and return that
+        request, or return None if request is now the pending one."""
+        key = self.key(request)
+        request.coalesce_key = key
+        primary = self.pending.get(key)
+        if primary is None:
+            self.pending[key] = request
+            return None
+
+        primary.followers.append(request)
+        self.attached += 1
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("attached request for %s to pending request",
+                         request.url.toString())
+        return primary
+
+    def release(self, request):
+        """Stop attaching requests to request and return those attached."""
+        if self.pending.get(request.coalesce_key) is request:
+            del self.pending[request.coalesce_key]
+        followers = request.followers
+        request.followers = list()
+        return followers
+
+
+class Subscription(object):
+    """The poll schedule of a stream of one exchange market."""
+
+    def __init__(self, exchange, market, stream, base):
+        self.exchange = exchange
+        self.market = market
+        self.stream = stream
+        self.clients = 0
+        self.last = None
+        self.set_base(base)
+        self.due = time.monotonic()
+
+    def set_base(self, base):
+        self.base = base
+        self.interval = base
+
+    def _scale(self, factor):
+        interval = self.interval * factor
+        interval = max(interval, self.base * FASTEST, MINIMUM_INTERVAL)
+        interval = min(interval, self.base * SLOWEST)
+        # bring a poll forward if the interval shrinks
+        self.due = min(self.due, time.monotonic() + interval)
+        self.interval = interval
+
+    def changed(self):
+        self._scale(CHANGED_FACTOR)
+
+    def repeated(self):
+        self._scale(REPEATED_FACTOR)
+
+    def moved(self, value):
+        value = float(value)
+        if self.last and abs(value - self.last) / self.last > MOVE_THRESHOLD:
+            self._scale(MOVED_FACTOR)
+        self.last = value
+
+
+class SubscriptionManager(QtCore.QObject):
+    """Polls the streams of exchange markets that widgets subscribe to.
+
+    Subscriptions are keyed by exchange, market and stream, and counted so
+    that a stream is polled while anything watches it. Each interval
+    shrinks when replies change or the last price moves, and grows when
+    replies repeat. Polls wait while the host budget of their endpoint is
+    spent, and tickers are not polled while a market stream is live.
+    """
+
+    def __init__(self, parent=None):
+        super(SubscriptionManager, self).__init__(parent)
+        self.subscriptions = dict()
+        self.intervals = dict()
+        self.checksums = dict()
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self._poll)
+
+    def subscribe(self, exchange, market, stream):
+        key = (exchange, market, stream)
+        subscription = self.subscriptions.get(key)
+        if subscription is None:
+            base = self.intervals.get((exchange, stream),
+                                      SUBSCRIPTION_STREAMS[stream][2])
+            subscription = Subscription(exchange, market, stream, base)
+            self.subscriptions[key] = subscription
+            if stream == 'ticker':
+                exchange.getTickerProxy(market).last_signal.connect(
+                    subscription.moved)
+        subscription.clients += 1
+        self._schedule()
+
+    def unsubscribe(self, exchange, market, stream):
+        key = (exchange, market, stream)
+        subscription = self.subscriptions.get(key)
+        if subscription is None:
+            return
+        subscription.clients -= 1
+        if subscription.clients > 0:
+            return
+        del self.subscriptions[key]
+        if stream == 'ticker':
+            exchange.getTickerProxy(market).last_signal.disconnect(
+                subscription.moved)
+        self._schedule()
+
+    def is_subscribed(self, exchange, stream):
+        return any(s.exchange is exchange and s.stream == stream
+                   for s in self.subscriptions.values())
+
+    def set_interval(self, exchange, stream, interval):
+        """Set the base interval of a stream of exchange in seconds."""
+        self.intervals[(exchange, stream)] = interval
+        for subscription in self._matching(exchange, stream):
+            subscription.set_base(interval)
+            subscription.due = min(subscription.due,
+                                   time.monotonic() + interval)
+        self._schedule()
+
+    def poll_soon(self, exchange, stream):
+        for subscription in self._matching(exchange, stream):
+            subscription.due = time.monotonic()
+        self._schedule()
+
+    def observe(self, exchange, stream, market, checksum):
+        """Adapt the subscriptions that a reply refreshed, checksum is
+        that of the reply, or None if the cache found it unchanged."""
+        key = (exchange, stream, market)
+        changed = checksum is not None and self.checksums.get(key) != checksum
+        self.checksums[key] = checksum
+        for subscription in self._matching(exchange, stream, market):
+            if changed:
+                subscription.changed()
+            else:
+                subscription.repeated()
+        self._schedule()
+
+    def _matching(self, exchange, stream, market=None):
+        for subscription in list(self.subscriptions.values()):
+            if (subscription.exchange is exchange and
+                subscription.stream == stream and
+                (market is None or subscription.market == market)):
+                yield subscription
+
+    def _schedule(self):
+        if not self.subscriptions:
             self.timer.stop()
-        else:
-            requester = self.queue.get(False)[1]
-            requester.pop_request()
+            return
+        due = min(s.due for s in self.subscriptions.values())
+        delay = max(due - time.monotonic(), 0)
+        self.timer.start(int(delay * 1000))
+
+    def _poll(self):
+        now = time.monotonic()
+        tickers = dict()
+        for subscription in list(self.subscriptions.values()):
+            if subscription.due > now:
+                continue
+            exchange = subscription.exchange
+            method, endpoint, interval = SUBSCRIPTION_STREAMS[subscription.stream]
+            subscription.due = now + subscription.interval
+
+            if (subscription.stream == 'ticker' and
+                exchange.market_stream is not None and
+                exchange.market_stream.live):
+                continue
+            if endpoint == PRIVATE and not exchange.hasAccount(subscription.market):
+                continue
+            delay = exchange.host_queue.delay(endpoint)
+            if delay:
+                subscription.due = now + delay
+                continue
+
+            # exchanges that can fetch several tickers at once do
+            if (subscription.stream == 'ticker' and
+                hasattr(exchange, 'refreshTickers')):
+                tickers.setdefault(exchange, list()).append(subscription.market)
+                continue
+            getattr(exchange, method)(subscription.market)
+
+        for exchange, markets in list(tickers.items()):
+            exchange.refreshTickers(sorted(markets))
+        self._schedule()
 
 
 class NetworkAccessManager(QtNetwork.QNetworkAccessManager):
@@ -76,33 +485,122 @@ class NetworkAccessManager(QtNetwork.QNetworkAccessManager):
     def __init__(self, parent=None):
         super(NetworkAccessManager, self).__init__(parent)
         self._host_request_queues = dict()
+        self.coalescer = RequestCoalescer()
+        self.scheduler = RequestScheduler(self)
+        self.subscriptions = SubscriptionManager(self)
+        self.disk_cache = dojima.network.cache.DiskCache(self)
+        self.setCache(self.disk_cache)
+        self._warm_hosts = dict()
+        self.keep_alive_timer = QtCore.QTimer(self)
+        self.keep_alive_timer.timeout.connect(self._keep_alive)
+
+    def warm_up(self, hostname):
+        """Resolve hostname and open a connection to it, then keep the
+        connection open until cool_down is called as many times."""
+        count = self._warm_hosts.get(hostname, 0)
+        self._warm_hosts[hostname] = count + 1
+        if count:
+            return
+
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("warming up connection to %s", hostname)
+        QtNetwork.QHostInfo.lookupHost(hostname, self._host_resolved)
+        self._connect_host(hostname)
+        if not self.keep_alive_timer.isActive():
+            self.keep_alive_timer.start(KEEP_ALIVE_IDLE * 1000 // 3)
+
+    def cool_down(self, hostname):
+        count = self._warm_hosts.get(hostname)
+        if count is None:
+            return
+        if count > 1:
+            self._warm_hosts[hostname] = count - 1
+            return
+        del self._warm_hosts[hostname]
+        if not self._warm_hosts:
+            self.keep_alive_timer.stop()
+
+    def _connect_host(self, hostname):
+        # Qt 4 cannot open a connection without a request, so a HEAD
+        # request opens it and leaves it in the connection pool.
+        request = QtNetwork.QNetworkRequest(QtCore.QUrl('https://' + hostname + '/'))
+        request.setAttribute(QtNetwork.QNetworkRequest.CacheLoadControlAttribute,
+                             QtNetwork.QNetworkRequest.AlwaysNetwork)
+        request.setAttribute(QtNetwork.QNetworkRequest.CacheSaveControlAttribute,
+                             False)
+        host_queue = self._host_request_queues.get(hostname)
+        if host_queue is not None:
+            host_queue.begin_request()
+        reply = self.head(request)
+
+        def finished():
+            if host_queue is not None:
+                host_queue.end_request()
+            reply.deleteLater()
+        reply.finished.connect(finished)
+
+    def _host_resolved(self, host_info):
+        if host_info.error():
+            logger.warning("could not resolve %s: %s", host_info.hostName(),
+                           host_info.errorString())
+
+    def _keep_alive(self):
+        for hostname in list(self._warm_hosts.keys()):
+            host_queue = self._host_request_queues.get(hostname)
+            if host_queue is None or host_queue.idle() < KEEP_ALIVE_IDLE:
+                continue
+            if host_queue.delay(PUBLIC):
+                continue
+            host_queue.consume(PUBLIC)
+            self._connect_host(hostname)
 
-    def get_host_request_queue(self, hostname, wait):
+    def get_host_request_queue(self, hostname, wait, burst=1):
         """return a queue that object can queue themselves into"""
         if hostname in self._host_request_queues:
             host_queue = self._host_request_queues[hostname]
             #TODO manager this wait time better
             host_queue.set_wait(wait)
+            host_queue.set_burst(burst)
         else:
-            host_queue = HostRequestQueue(wait, self)
+            host_queue = HostRequestQueue(wait, self, burst, hostname)
             self._host_request_queues[hostname] = host_queue
         return host_queue
 
 
 class ExchangeRequest(object):
-    priority = 3
-    host_priority = None
+    endpoint = PUBLIC
+    latency_class = TICKER
+    # Share the reply of an identical request that is already pending.
+    # The handlers of every attached request are called with the one
+    # reply, so only requests whose handlers may safely see the same
+    # reply more than once, as those that pass market data to a proxy
+    # do, should set this.
+    coalesce = False
+    # Seconds a reply is served from the cache before it is revalidated,
+    # None leaves this to the cache headers of the host
+    cache_ttl = None
+    # Do not parse replies that the cache shows have not changed
+    skip_unchanged = False
+    # The data a polling request is for, a queued request is dropped when
+    # a newer request for the same stream and market is made
+    stream = None
+    superseded = False
 
     def __init__(self, parent):
         self.parent = parent
         self.reply = None
-        parent.requests.append( (self.priority, self,) )
-        parent.host_queue.enqueue(self.parent, self.host_priority)
+        self._enqueue()
 
     def __del__(self):
         if self.reply:
             self.reply.deleteLater()
 
+    def _create_parser(self):
+        """Return an object with feed(data) and finish() methods to parse
+        the reply as it arrives, what finish() returns is passed to
+        _handle_reply in place of the reply text."""
+        return None
+
     def _prepare_request(self):
         self.request = QtNetwork.QNetworkRequest(self.url)
         self.request.setHeader(QtNetwork.QNetworkRequest.ContentTypeHeader,
@@ -114,46 +612,183 @@ class ExchangeRequest(object):
         self.query = query.encodedQuery()
 
     def _extract_reply(self):
+        self.completed = time.monotonic()
+        self.parent.host_queue.end_request()
+        self.decoder.feed(self.reply)
+        self.size = self.decoder.received
+        if self.decoder.recorded is not None:
+            self.decoder.flush()
+            dojima.network.record.recorder.record(self, self.decoder.recorded)
         self.parent.replies.remove(self)
+        # requests attached to this one are answered with its reply
+        followers = self._release()
+        requests = (self,) + tuple(followers)
+        parse_time = None
         if self.reply.error():
-            logger.error(self.reply.errorString())
+            for request in requests:
+                request._handle_error(self.reply.errorString())
+        elif self.decoder.error:
+            for request in requests:
+                request._handle_error(self.decoder.error)
+        elif (self.skip_unchanged and
+              self.parent.network_manager.disk_cache.is_unchanged(self)):
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("reply to %s is unchanged", self.url.toString())
+            for request in requests:
+                request._handle_unchanged()
+            self._observe(None)
         else:
             if logger.isEnabledFor(logging.INFO):
                 logger.info("received reply to %s", self.url.toString())
-            raw_reply = bytearray(self.reply.readAll()).decode()
-            self._handle_reply(raw_reply)
+            try:
+                raw_reply = self.decoder.finish()
+            except ValueError as e:
+                # an error sent in place of the data, with a 200 status
+                for request in requests:
+                    request._handle_error(str(e))
+                dojima.network.metrics.record_request(self)
+                return
+            if self._should_resend(raw_reply):
+                if logger.isEnabledFor(logging.INFO):
+                    logger.info("resending request to %s",
+                                self.url.toString())
+                dojima.network.metrics.record_request(self)
+                # the followers wait for the reply to the resent request
+                if followers:
+                    self.followers.extend(followers)
+                self._resend()
+                return
+
+            started = time.monotonic()
+            for request in requests:
+                request._handle_reply(raw_reply)
+            parse_time = time.monotonic() - started
+            self._observe(self.decoder.checksum)
+
+        dojima.network.metrics.record_request(self, parse_time)
+
+    def _enqueue(self):
+        if self.coalesce:
+            self.followers = list()
+            coalescer = self.parent.network_manager.coalescer
+            if coalescer.attach(self) is not None:
+                return
+
+        self.parent.network_manager.scheduler.enqueue(self)
 
     def _handle_error(self, error):
         logger.error(error)
         #self.parent.exchange_error_signal.emit(msg)
         #logger.warning(msg)
 
+    def _handle_unchanged(self):
+        pass
+
+    def _should_resend(self, raw):
+        return False
+
+    def _mark_first_byte(self):
+        if self.first_byte is None:
+            self.first_byte = time.monotonic()
+
+    def _read_chunk(self):
+        self.decoder.feed(self.reply)
+
+    def _supersede(self, request):
+        """Take over the requests attached to request, which will not be
+        sent."""
+        if self.coalesce:
+            self.followers.extend(request._release())
+
+    def subscription_keys(self):
+        """Return the (stream, market) pairs that a reply refreshes."""
+        if self.stream is None:
+            return ()
+        return ((self.stream, getattr(self, 'pair', None)),)
+
+    def _observe(self, checksum):
+        subscriptions = self.parent.network_manager.subscriptions
+        for stream, market in self.subscription_keys():
+            subscriptions.observe(self.parent, stream, market, checksum)
+
+    def supersede_key(self):
+        if self.stream is None:
+            return None
+        return (self.parent, self.stream, getattr(self, 'pair', None))
+
+    def _release(self):
+        if self.coalesce:
+            return self.parent.network_manager.coalescer.release(self)
+        return ()
+
+    def _watch_reply(self):
+        self.dispatched = time.monotonic()
+        self.parent.host_queue.begin_request()
+        self.first_byte = None
+        self.decoder = dojima.network.encoding.ReplyDecoder(
+            self._create_parser(),
+            dojima.network.record.recorder is not None)
+        self.reply.metaDataChanged.connect(self._mark_first_byte)
+        self.reply.readyRead.connect(self._read_chunk)
+        self.reply.finished.connect(self._extract_reply)
+        self.parent.replies.add(self)
+
 
 class ExchangeGETRequest(ExchangeRequest):
+    coalesce = True
+    cache_ttl = 0
+    skip_unchanged = True
 
     def send(self):
         self.request = QtNetwork.QNetworkRequest(self.url)
+        self.request.setRawHeader(b'Accept-Encoding',
+                                  dojima.network.encoding.ACCEPT_ENCODING)
+        # Qt only pipelines requests to hosts that keep connections alive
+        self.request.setAttribute(
+            QtNetwork.QNetworkRequest.HttpPipeliningAllowedAttribute, True)
+        if self.cache_ttl is not None:
+            self.parent.network_manager.disk_cache.set_ttl(self.url,
+                                                           self.cache_ttl)
         if logger.isEnabledFor(logging.INFO):
             logger.info("GET to %s", self.url.toString())
         self.reply = self.parent.network_manager.get(self.request)
-        self.reply.finished.connect(self._extract_reply)
-        self.parent.replies.add(self)
+        self._watch_reply()
 
 
 class ExchangePOSTRequest(ExchangeRequest):
+    endpoint = PRIVATE
+    latency_class = ACCOUNT
+    # Signed requests may reach a host out of order, a request whose nonce
+    # is refused for that is signed again and resent up to this many times
+    maximum_attempts = 3
+    attempts = 1
 
     def __init__(self, params, parent):
         self.parent = parent
         self.params = params
         self.reply = None
-        parent.requests.append( (self.priority, self,) )
-        parent.host_queue.enqueue(self.parent, self.host_priority)
+        self._enqueue()
     
     def send(self):
         self._prepare_request()
+        self.request.setRawHeader(b'Accept-Encoding',
+                                  dojima.network.encoding.ACCEPT_ENCODING)
         if logger.isEnabledFor(logging.INFO):
             logger.info("POST to %s", self.url.toString())
         self.reply = self.parent.network_manager.post(self.request,
                                                       self.query)
-        self.reply.finished.connect(self._extract_reply)
-        self.parent.replies.add(self)
+        self._watch_reply()
+
+    def _nonce_refused(self, raw):
+        """Return True if raw is a refusal of the nonce of the request."""
+        return False
+
+    def _should_resend(self, raw):
+        return (self.attempts < self.maximum_attempts and
+                self._nonce_refused(raw))
+
+    def _resend(self):
+        self.attempts += 1
+        self.reply.deleteLater()
+        self.reply = None
+        self.parent.network_manager.scheduler.enqueue(self)
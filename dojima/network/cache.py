@@ -0,0 +1,101 @@
+# Dojima, a markets client.
+# Copyright (C) 2012-2013 Emery Hemingway
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import os.path
+
+from PyQt4 import QtCore, QtNetwork
+
+import dojima.storage
+
+
+logger = logging.getLogger(__name__)
+
+MAXIMUM_CACHE_SIZE = 32 * 1024 * 1024
+
+
+def get_cache_directory():
+    storage_directory = dojima.storage.get_directory()
+    return os.path.join(storage_directory, 'network_cache')
+
+def _without_query(url):
+    # requests that page with a cursor change their query on every poll
+    return url.toString(QtCore.QUrl.RemoveQuery)
+
+def _no_store(meta_data):
+    for name, value in meta_data.rawHeaders():
+        if (name.data().lower() == b'cache-control' and
+            b'no-store' in value.data().lower()):
+            return True
+    return False
+
+
+class DiskCache(QtNetwork.QNetworkDiskCache):
+    """Stores replies under the data location.
+
+    Replies to URLs whose path has been given a lifetime are stored even
+    if the host does not ask for it, unless the host forbids it with
+    no-store, and are served from the cache until that lifetime expires.
+    After that Qt revalidates them with the ETag and Last-Modified headers
+    of the stored reply.
+    """
+
+    def __init__(self, parent=None):
+        super(DiskCache, self).__init__(parent)
+        self.setCacheDirectory(get_cache_directory())
+        self.setMaximumCacheSize(MAXIMUM_CACHE_SIZE)
+        # URL without query -> seconds
+        self.ttls = dict()
+        # (exchange, request class, URL without query) -> checksum of the
+        # last reply handled
+        self.handled = dict()
+
+    def set_ttl(self, url, ttl):
+        """Keep replies to the path of url fresh for ttl seconds"""
+        self.ttls[_without_query(url)] = ttl
+
+    def is_unchanged(self, request):
+        """Return True if the reply to request came from the cache and is
+        the reply that the same kind of request from the same exchange
+        handled last."""
+        reply = request.reply
+        key = (request.parent, type(request), _without_query(reply.url()))
+        # the checksum is only complete once the decoder is flushed
+        request.decoder.flush()
+        checksum = request.decoder.checksum
+        from_cache = reply.attribute(
+            QtNetwork.QNetworkRequest.SourceIsFromCacheAttribute)
+        if from_cache and self.handled.get(key) == checksum:
+            return True
+        self.handled[key] = checksum
+        return False
+
+    def prepare(self, meta_data):
+        return super(DiskCache, self).prepare(self._apply_ttl(meta_data))
+
+    def updateMetaData(self, meta_data):
+        super(DiskCache, self).updateMetaData(self._apply_ttl(meta_data))
+
+    def _apply_ttl(self, meta_data):
+        ttl = self.ttls.get(_without_query(meta_data.url()))
+        if ttl is None or _no_store(meta_data):
+            return meta_data
+
+        meta_data.setSaveToDisk(True)
+        expiration = QtCore.QDateTime.currentDateTime().addMSecs(int(ttl * 1000))
+        meta_data.setExpirationDate(expiration)
+        return meta_data
+
@@ -0,0 +1,135 @@
+# Dojima, a markets client.
+# Copyright (C) 2012-2013 Emery Hemingway
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import re
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+SIDE = re.compile(rb'"(asks|bids)"\s*:\s*\[')
+SIDE_END = re.compile(rb'\s*\]')
+
+_NUMBER = rb'"?([^,"\]}\s]+)"?'
+
+# [price, amount, ...] as sent by BTC-e and Bitstamp
+PAIR = re.compile(rb'\[\s*' + _NUMBER + rb'\s*,\s*' + _NUMBER + rb'[^\]]*\]')
+
+# {"price": price, "amount": amount, ...} as sent by MtGox
+OBJECT = re.compile(rb'\{(?=[^{}]*"price"\s*:\s*' + _NUMBER + rb')'
+                    rb'(?=[^{}]*"amount"\s*:\s*' + _NUMBER + rb')[^{}]*\}')
+
+# Keys that may still be split over the end of a chunk
+SIDE_TAIL = 16
+# Bytes of the start of a reply kept to describe a reply without offers
+HEAD = 256
+
+# The number of offers last seen on each stream, used to size the buffers.
+_capacities = dict()
+MINIMUM_CAPACITY = 256
+
+
+class DepthBuffer(object):
+    """A growable array of price and amount rows."""
+
+    def __init__(self, capacity):
+        self.array = np.empty((2, capacity))
+        self.size = 0
+
+    def extend(self, values):
+        """Append an array of (price, amount) rows."""
+        stop = self.size + len(values)
+        if stop > self.array.shape[1]:
+            capacity = max(stop, self.array.shape[1] * 2)
+            array = np.empty((2, capacity))
+            array[:,:self.size] = self.array[:,:self.size]
+            self.array = array
+        self.array[:,self.size:stop] = values.transpose()
+        self.size = stop
+
+    def result(self):
+        return self.array[:,:self.size]
+
+
+class DepthParser(object):
+    """Parses the asks and bids of a depth reply as it arrives.
+
+    Only the part of the reply that has not yet been parsed is held, and
+    offers are written straight into arrays sized from the last reply on
+    the same stream. finish() returns a dict of asks and bids, as arrays
+    of prices and amounts, and raises ValueError if the reply had neither,
+    as an error sent in place of the depth does.
+    """
+
+    def __init__(self, key, entry=PAIR):
+        self.key = key
+        self.entry = entry
+        self.entries = re.compile(rb'(?:\s*,?\s*' + entry.pattern + rb')*')
+        capacity = _capacities.get(key, MINIMUM_CAPACITY)
+        self.buffers = {'asks': DepthBuffer(capacity),
+                        'bids': DepthBuffer(capacity)}
+        self.pending = bytearray()
+        self.side = None
+        # the sides that appeared in the reply
+        self.seen = set()
+        self.head = bytearray()
+
+    def feed(self, data):
+        if len(self.head) < HEAD:
+            self.head.extend(data[:HEAD - len(self.head)])
+        self.pending.extend(data)
+        pending = self.pending
+        pos = 0
+        while True:
+            if self.side is None:
+                match = SIDE.search(pending, pos)
+                if match is None:
+                    pos = max(pos, len(pending) - SIDE_TAIL)
+                    break
+                name = match.group(1).decode()
+                self.seen.add(name)
+                self.side = self.buffers[name]
+                pos = match.end()
+                continue
+
+            stop = self.entries.match(pending, pos).end()
+            if stop > pos:
+                offers = self.entry.findall(pending, pos, stop)
+                values = np.array(offers, dtype=bytes).astype(np.float64)
+                self.side.extend(values)
+                pos = stop
+
+            match = SIDE_END.match(pending, pos)
+            if match is None:
+                break
+            self.side = None
+            pos = match.end()
+
+        del pending[:pos]
+
+    def finish(self):
+        if self.side is not None:
+            raise ValueError("depth reply ended within an array of offers")
+        if not self.seen:
+            raise ValueError("depth reply has no asks or bids: {}".format(
+                bytes(self.head).decode(errors='replace')))
+        asks = self.buffers['asks'].result()
+        bids = self.buffers['bids'].result()
+        _capacities[self.key] = max(asks.shape[1], bids.shape[1],
+                                    MINIMUM_CAPACITY)
+        return {'asks': asks, 'bids': bids}
@@ -0,0 +1,99 @@
+# Dojima, a markets client.
+# Copyright (C) 2012-2013 Emery Hemingway
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import zlib
+
+
+logger = logging.getLogger(__name__)
+
+# Setting this header stops Qt from decompressing replies itself,
+# so replies are decompressed here as they arrive.
+ACCEPT_ENCODING = b'gzip, deflate'
+
+
+def _is_zlib_header(data):
+    return (len(data) > 1 and
+            data[0] & 0x0f == 8 and
+            ((data[0] << 8) | data[1]) % 31 == 0)
+
+
+class ReplyDecoder(object):
+    """Decompresses the body of a reply as its chunks arrive, and passes
+    them to parser if one is given. If record is True the whole body is
+    also kept in recorded."""
+
+    def __init__(self, parser=None, record=False):
+        self.parser = parser
+        self.recorded = bytearray() if record else None
+        self.flushed = False
+        self.buffer = bytearray()
+        self.decompressor = None
+        self.encoding = None
+        self.received = 0
+        self.checksum = 0
+        self.error = None
+
+    def feed(self, reply):
+        """Take the data that is available from reply."""
+        if self.error:
+            return
+        data = reply.readAll().data()
+        if not data:
+            return
+        self.received += len(data)
+
+        if self.encoding is None:
+            encoding = reply.rawHeader(b'Content-Encoding').data()
+            self.encoding = encoding.strip().lower()
+            if self.encoding == b'gzip':
+                self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            elif self.encoding == b'deflate':
+                # deflate is sent both with and without a zlib header
+                if _is_zlib_header(data):
+                    self.decompressor = zlib.decompressobj(zlib.MAX_WBITS)
+                else:
+                    self.decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+
+        if self.decompressor is not None:
+            try:
+                data = self.decompressor.decompress(data)
+            except zlib.error as e:
+                self.error = "could not decompress reply: {}".format(e)
+                return
+        self._take(data)
+
+    def _take(self, data):
+        self.checksum = zlib.crc32(data, self.checksum)
+        if self.recorded is not None:
+            self.recorded.extend(data)
+        if self.parser is None:
+            self.buffer.extend(data)
+        else:
+            self.parser.feed(data)
+
+    def flush(self):
+        """Take what is left in the decompressor."""
+        if self.decompressor is not None and not self.flushed and not self.error:
+            self._take(self.decompressor.flush())
+        self.flushed = True
+
+    def finish(self):
+        """Return the body as a string, or what the parser made of it."""
+        self.flush()
+        if self.parser is None:
+            return self.buffer.decode()
+        return self.parser.finish()
@@ -0,0 +1,247 @@
+# Dojima, a markets client.
+# Copyright (C) 2012-2013 Emery Hemingway
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import logging
+import os.path
+import signal
+import time
+
+from PyQt4 import QtCore
+
+import dojima.storage
+
+
+logger = logging.getLogger(__name__)
+
+# Times are recorded in microseconds, sizes in bytes.
+TIMES = ('queue_wait', 'first_byte', 'transfer', 'total', 'parse')
+SIZES = ('size',)
+
+# Each power of two is split into 2**SUB_BUCKET_BITS buckets, so recorded
+# values are within about 6% of the values they stand for.
+SUB_BUCKET_BITS = 4
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+PERCENTILES = (50, 90, 99)
+
+
+class Histogram(object):
+    """Counts integer values in buckets of constant relative width."""
+
+    def __init__(self):
+        self.counts = dict()
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def record(self, value):
+        value = max(int(value), 0)
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for index, count in list(other.counts.items()):
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent):
+        if not self.count:
+            return 0
+        threshold = self.count * percent / 100.0
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= threshold:
+                return min(self._value(index), self.max)
+        return self.max
+
+    def mean(self):
+        if not self.count:
+            return 0
+        return self.sum / self.count
+
+    def _index(self, value):
+        if value < SUB_BUCKETS * 2:
+            return value
+        exponent = value.bit_length() - SUB_BUCKET_BITS - 1
+        return exponent * SUB_BUCKETS + (value >> exponent)
+
+    def _value(self, index):
+        if index < SUB_BUCKETS * 2:
+            return index
+        exponent = index // SUB_BUCKETS - 1
+        return (index - exponent * SUB_BUCKETS) << exponent
+
+
+class RollingHistogram(object):
+    """A histogram of the values recorded in the last one or two windows."""
+
+    def __init__(self, window):
+        self.window = window
+        self.current = Histogram()
+        self.previous = Histogram()
+        self.started = time.monotonic()
+
+    def _rotate(self):
+        now = time.monotonic()
+        if now - self.started < self.window:
+            return
+        if now - self.started < self.window * 2:
+            self.previous = self.current
+        else:
+            self.previous = Histogram()
+        self.current = Histogram()
+        self.started = now
+
+    def record(self, value):
+        self._rotate()
+        self.current.record(value)
+
+    def snapshot(self):
+        self._rotate()
+        histogram = Histogram()
+        histogram.merge(self.previous)
+        histogram.merge(self.current)
+        return histogram
+
+
+class NetworkMetrics(object):
+    """Request timings and payload sizes by host and endpoint."""
+
+    def __init__(self, window=300):
+        self.window = window
+        self.histograms = dict()
+        self.connections = dict()
+
+    def record(self, host, endpoint, **values):
+        key = (host, endpoint)
+        if key not in self.histograms:
+            self.histograms[key] = dict(
+                (name, RollingHistogram(self.window)) for name in TIMES + SIZES)
+        histograms = self.histograms[key]
+        for name, value in list(values.items()):
+            if value is not None:
+                histograms[name].record(value)
+
+    def record_connection(self, host, reused):
+        counts = self.connections.setdefault(host, [0, 0])
+        if reused:
+            counts[1] += 1
+        else:
+            counts[0] += 1
+
+    def connection_stats(self):
+        """Return {host: summary} of the connections opened and reused."""
+        stats = dict()
+        for host, (opened, reused) in list(self.connections.items()):
+            stats[host] = {'opened': opened,
+                           'reused': reused,
+                           'reuse_ratio': reused / max(opened + reused, 1)}
+        return stats
+
+    def stats(self):
+        """Return {host: {endpoint: {measure: summary}}}, with times in
+        milliseconds and sizes in bytes."""
+        stats = dict()
+        for (host, endpoint), histograms in list(self.histograms.items()):
+            endpoint_stats = stats.setdefault(host, dict()).setdefault(endpoint, dict())
+            for name, rolling in list(histograms.items()):
+                histogram = rolling.snapshot()
+                if name in TIMES:
+                    scale = 1000.0
+                else:
+                    scale = 1
+                summary = {'count': histogram.count,
+                           'mean': histogram.mean() / scale,
+                           'max': histogram.max / scale}
+                for percent in PERCENTILES:
+                    summary['p{}'.format(percent)] = histogram.percentile(percent) / scale
+                endpoint_stats[name] = summary
+        return stats
+
+    def dump(self, filename):
+        directory = os.path.dirname(filename)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(filename, 'w') as f:
+            json.dump({'requests': self.stats(),
+                       'connections': self.connection_stats()},
+                      f, indent=1, sort_keys=True)
+        logger.info("wrote network stats to %s", filename)
+
+
+metrics = NetworkMetrics()
+
+def get_stats():
+    return metrics.stats()
+
+def get_connection_stats():
+    return metrics.connection_stats()
+
+def record_connection(host, reused):
+    metrics.record_connection(host, reused)
+
+def record_request(request, parse_time=None):
+    """Record the timestamps a request collected on its way through the
+    scheduler and the network manager."""
+    url = request.url
+    enqueued = getattr(request, 'enqueued', None)
+    dispatched = getattr(request, 'dispatched', None)
+    first_byte = getattr(request, 'first_byte', None) or request.completed
+    completed = request.completed
+
+    def span(start, stop):
+        if start is None or stop is None:
+            return None
+        return (stop - start) * 1000000
+
+    if parse_time is not None:
+        parse_time *= 1000000
+
+    metrics.record(url.host(), type(request).__name__,
+                   queue_wait=span(enqueued, dispatched),
+                   first_byte=span(dispatched, first_byte),
+                   transfer=span(first_byte, completed),
+                   total=span(enqueued, completed),
+                   parse=parse_time,
+                   size=request.size)
+
+def get_dump_filename():
+    storage_directory = dojima.storage.get_directory()
+    return os.path.join(storage_directory, 'network_stats.json')
+
+def install_signal_handler(parent=None):
+    """Dump the stats as JSON when the process receives SIGUSR1.
+
+    Python only runs signal handlers when the interpreter has control, so
+    a timer wakes it while the Qt event loop runs. The timer is returned.
+    """
+    if not hasattr(signal, 'SIGUSR1'):
+        return None
+
+    signal.signal(signal.SIGUSR1,
+                  lambda signum, frame: metrics.dump(get_dump_filename()))
+    timer = QtCore.QTimer(parent)
+    timer.timeout.connect(lambda: None)
+    timer.start(500)
+    return timer
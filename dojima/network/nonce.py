@@ -0,0 +1,141 @@
+# Dojima, a markets client.
+# Copyright (C) 2012-2013 Emery Hemingway
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+import logging
+import os
+import os.path
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+import dojima.storage
+
+
+logger = logging.getLogger(__name__)
+
+_sequencers = dict()
+# Nonces are reserved from the file this many at a time
+NONCE_BLOCK = 100
+
+
+def get_nonce_directory():
+    storage_directory = dojima.storage.get_directory()
+    return os.path.join(storage_directory, 'nonces')
+
+def get_sequencer(exchange, key):
+    """Return the sequencer for the nonces of an exchange API key, or None
+    if there is no key."""
+    if not key:
+        return None
+    if isinstance(key, str):
+        key = key.encode()
+    name = '{}-{}'.format(exchange, hashlib.sha1(key).hexdigest()[:16])
+    if name not in _sequencers:
+        _sequencers[name] = NonceSequencer(
+            os.path.join(get_nonce_directory(), name))
+    return _sequencers[name]
+
+
+def _lock(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+
+def _unlock(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class NonceSequencer(object):
+    """Hands out increasing nonces.
+
+    Nonces are reserved in blocks, and the last nonce of the newest block
+    is kept in a file that is locked while it is updated, so nonces keep
+    increasing across restarts and between processes that use the same
+    key. Within a block a nonce only costs a stat of the file, to see
+    whether another process has reserved a block since, in which case the
+    rest of this block is given up for one after it. Nonces never fall
+    behind the clock based seed that was used before they were recorded.
+    """
+
+    def __init__(self, filename, block=NONCE_BLOCK):
+        self.filename = filename
+        self.block = block
+        directory = os.path.dirname(filename)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        # the last nonce handed out, and the last of the reserved block
+        self.nonce = None
+        self.limit = None
+        # the file as it was left by the last reservation
+        self.stamp = None
+
+    def _stamp(self):
+        try:
+            stat = os.stat(self.filename)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _reserve(self, minimum):
+        """Reserve a block starting at minimum or later and return its
+        first nonce."""
+        with open(self.filename, 'a+') as f:
+            _lock(f)
+            try:
+                f.seek(0)
+                text = f.read().strip()
+                last = int(text) if text else 0
+                first = max(last + 1, minimum)
+                self.limit = first + self.block - 1
+                f.seek(0)
+                f.truncate()
+                f.write(str(self.limit))
+                f.flush()
+            finally:
+                _unlock(f)
+        self.stamp = self._stamp()
+        return first
+
+    def _take(self, minimum):
+        if self.nonce is not None:
+            minimum = max(self.nonce + 1, minimum)
+        if (self.limit is None or minimum > self.limit or
+            self._stamp() != self.stamp):
+            minimum = self._reserve(minimum)
+        self.nonce = minimum
+        return minimum
+
+    def next(self):
+        return self._take(int(time.time() / 2))
+
+    def advance(self, nonce):
+        """Make sure the next nonce is greater than nonce, for when a host
+        reports the last nonce it saw."""
+        if self.nonce is None or nonce > self.nonce:
+            self.nonce = nonce
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("advanced nonces in %s past %s", self.filename, nonce)
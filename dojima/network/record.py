@@ -0,0 +1,97 @@
+# Dojima, a markets client.
+# Copyright (C) 2012-2013 Emery Hemingway
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import atexit
+import gzip
+import json
+import logging
+import time
+import urllib.parse
+
+from PyQt4 import QtNetwork
+
+
+logger = logging.getLogger(__name__)
+
+recorder = None
+
+# Parameters that change with every signed request, or that identify
+# the account, are left out of the log.
+UNRECORDED_PARAMS = frozenset(('key', 'nonce', 'sign', 'signature'))
+
+OPERATIONS = { QtNetwork.QNetworkAccessManager.HeadOperation: 'HEAD',
+               QtNetwork.QNetworkAccessManager.GetOperation: 'GET',
+               QtNetwork.QNetworkAccessManager.PostOperation: 'POST' }
+
+
+def start_recording(filename):
+    """Record every exchange request and its reply to filename, which is
+    compressed if it ends in .gz."""
+    global recorder
+    recorder = Recorder(filename)
+    atexit.register(recorder.close)
+    return recorder
+
+def open_log(filename, mode):
+    if filename.endswith('.gz'):
+        return gzip.open(filename, mode + 't')
+    return open(filename, mode)
+
+def request_key(operation, url, body):
+    """Return what a recorded reply is looked up by."""
+    return '{} {} {}'.format(operation, url, body)
+
+def strip_body(body):
+    """Return body as a string, without the unrecorded parameters."""
+    if body is None:
+        return ''
+    if hasattr(body, 'data'):
+        body = body.data()
+    if isinstance(body, bytes):
+        body = body.decode()
+    params = [ (key, value) for key, value in urllib.parse.parse_qsl(body)
+               if key.lower() not in UNRECORDED_PARAMS ]
+    return urllib.parse.urlencode(sorted(params))
+
+
+class Recorder(object):
+    """Writes requests and replies as lines of JSON."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = open_log(filename, 'w')
+        self.started = time.monotonic()
+        logger.info("recording network replies to %s", filename)
+
+    def record(self, request, content):
+        reply = request.reply
+        entry = {'t': round(request.dispatched - self.started, 6),
+                 'latency': round(request.completed - request.dispatched, 6),
+                 'op': OPERATIONS.get(reply.operation(), 'GET'),
+                 'url': reply.url().toString(),
+                 'body': strip_body(getattr(request, 'query', None)),
+                 'status': reply.attribute(
+                     QtNetwork.QNetworkRequest.HttpStatusCodeAttribute),
+                 'type': reply.header(QtNetwork.QNetworkRequest.ContentTypeHeader),
+                 'reply': bytes(content).decode('utf-8', 'replace')}
+        if reply.error():
+            entry['error'] = reply.errorString()
+        self.file.write(json.dumps(entry, separators=(',', ':')))
+        self.file.write('\n')
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
@@ -0,0 +1,138 @@
+# Dojima, a markets client.
+# Copyright (C) 2012-2013 Emery Hemingway
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import logging
+
+from PyQt4 import QtCore, QtNetwork
+
+import dojima.network
+import dojima.network.record
+
+
+logger = logging.getLogger(__name__)
+
+
+def install_replay(filename, speed=1.0, parent=None):
+    """Serve exchange requests from the log at filename, speed times as
+    fast as they were recorded, or at once if speed is 0."""
+    manager = ReplayNetworkAccessManager(filename, speed, parent)
+    dojima.network.set_network_manager(manager)
+    return manager
+
+
+class ReplayReply(QtNetwork.QNetworkReply):
+    """A reply that serves a recorded reply after its recorded latency."""
+
+    def __init__(self, operation, request, entry, delay, parent=None):
+        super(ReplayReply, self).__init__(parent)
+        self.setOperation(operation)
+        self.setRequest(request)
+        self.setUrl(request.url())
+        self.open(QtCore.QIODevice.ReadOnly | QtCore.QIODevice.Unbuffered)
+        self.entry = entry
+        self.content = b''
+        self.offset = 0
+        QtCore.QTimer.singleShot(int(delay * 1000), self._deliver)
+
+    def _deliver(self):
+        entry = self.entry
+        if entry is None:
+            self.setError(QtNetwork.QNetworkReply.ContentNotFoundError,
+                          "no recorded reply to {}".format(self.url().toString()))
+        else:
+            self.content = entry['reply'].encode()
+            if entry.get('status') is not None:
+                self.setAttribute(QtNetwork.QNetworkRequest.HttpStatusCodeAttribute,
+                                  entry['status'])
+            if entry.get('type'):
+                self.setHeader(QtNetwork.QNetworkRequest.ContentTypeHeader,
+                               entry['type'])
+            self.setHeader(QtNetwork.QNetworkRequest.ContentLengthHeader,
+                           len(self.content))
+            if 'error' in entry:
+                self.setError(QtNetwork.QNetworkReply.UnknownNetworkError,
+                              entry['error'])
+            self.metaDataChanged.emit()
+            if self.content:
+                self.readyRead.emit()
+        self.setFinished(True)
+        self.finished.emit()
+
+    def abort(self):
+        pass
+
+    def bytesAvailable(self):
+        return (len(self.content) - self.offset +
+                super(ReplayReply, self).bytesAvailable())
+
+    def isSequential(self):
+        return True
+
+    def readData(self, maxlen):
+        data = self.content[self.offset:self.offset + maxlen]
+        self.offset += len(data)
+        return data
+
+
+class ReplayNetworkAccessManager(dojima.network.NetworkAccessManager):
+    """Serves the replies in a log written with --record.
+
+    Replies to each request are served in the order they were recorded,
+    and from the start again once they run out, so a replay runs as long
+    as the application does. Requests that were not recorded fail with
+    ContentNotFoundError.
+    """
+
+    def __init__(self, filename, speed=1.0, parent=None):
+        super(ReplayNetworkAccessManager, self).__init__(parent)
+        self.setCache(None)
+        self.speed = speed
+        self.entries = dict()
+        self.positions = dict()
+        with dojima.network.record.open_log(filename, 'r') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                key = dojima.network.record.request_key(
+                    entry['op'], entry['url'], entry['body'])
+                self.entries.setdefault(key, list()).append(entry)
+        logger.info("replaying %s recorded requests from %s",
+                    sum(len(e) for e in self.entries.values()), filename)
+
+    def createRequest(self, operation, request, outgoing_data=None):
+        body = None
+        if outgoing_data is not None:
+            body = outgoing_data.readAll()
+        key = dojima.network.record.request_key(
+            dojima.network.record.OPERATIONS.get(operation, 'GET'),
+            request.url().toString(),
+            dojima.network.record.strip_body(body))
+
+        entry = None
+        delay = 0
+        entries = self.entries.get(key)
+        if entries:
+            position = self.positions.get(key, 0)
+            entry = entries[position % len(entries)]
+            self.positions[key] = position + 1
+            if self.speed:
+                delay = entry['latency'] / self.speed
+        elif logger.isEnabledFor(logging.INFO):
+            logger.info("no recorded reply for %s", key)
+
+        return ReplayReply(operation, request, entry, delay, self)
@@ -0,0 +1,137 @@
+# Dojima, a markets client.
+# Copyright (C) 2012-2013 Emery Hemingway
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+
+from PyQt4 import QtCore
+
+import dojima.network.websocket
+
+
+logger = logging.getLogger(__name__)
+
+MINIMUM_RETRY = 1
+MAXIMUM_RETRY = 64
+
+
+class MarketStream(QtCore.QObject):
+    """A websocket that market data is pushed over.
+
+    The socket is reopened when it drops or goes quiet, and the channels
+    are subscribed to again. live is True while the stream is subscribed,
+    liveChanged is emitted when that changes so that the exchange may stop
+    or resume polling.
+
+    Subclasses set url and channels, call _ready() once the connection
+    may be subscribed on, and implement _subscribe and _handle_message.
+    """
+
+    liveChanged = QtCore.pyqtSignal(bool)
+
+    url = None
+    channels = ()
+    # Seconds without a message after which the socket is reopened
+    timeout = 60
+
+    def __init__(self, parent=None, url=None):
+        super(MarketStream, self).__init__(parent)
+        if url is not None:
+            self.url = url
+        self.socket = None
+        self.active = False
+        self.live = False
+        self.retry = MINIMUM_RETRY
+
+        self.retry_timer = QtCore.QTimer(self)
+        self.retry_timer.setSingleShot(True)
+        self.retry_timer.timeout.connect(self._connect)
+        self.idle_timer = QtCore.QTimer(self)
+        self.idle_timer.setSingleShot(True)
+        self.idle_timer.timeout.connect(self._idle)
+
+    def open(self):
+        if self.active:
+            return
+        self.active = True
+        self._connect()
+
+    def close(self):
+        self.active = False
+        self.retry_timer.stop()
+        self._drop_socket()
+
+    def send(self, text):
+        if self.socket is not None:
+            self.socket.send(text)
+
+    def _connect(self):
+        self._drop_socket()
+        self.socket = dojima.network.websocket.WebSocket(self)
+        self.socket.message.connect(self._receive)
+        self.socket.closed.connect(self._dropped)
+        self.socket.error.connect(self._error)
+        self.socket.open(self.url)
+        self.idle_timer.start(self.timeout * 1000)
+
+    def _drop_socket(self):
+        self.idle_timer.stop()
+        if self.socket is not None:
+            socket = self.socket
+            self.socket = None
+            socket.message.disconnect(self._receive)
+            socket.closed.disconnect(self._dropped)
+            socket.error.disconnect(self._error)
+            socket.close()
+            socket.deleteLater()
+        self._set_live(False)
+
+    def _dropped(self):
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("stream from %s dropped", self.url.host())
+        self._drop_socket()
+        if self.active:
+            self.retry_timer.start(self.retry * 1000)
+            self.retry = min(self.retry * 2, MAXIMUM_RETRY)
+
+    def _error(self, message):
+        logger.warning("stream from %s: %s", self.url.host(), message)
+        self._dropped()
+
+    def _idle(self):
+        logger.warning("stream from %s has gone quiet", self.url.host())
+        self._dropped()
+
+    def _ready(self):
+        for channel in self.channels:
+            self._subscribe(channel)
+        self.retry = MINIMUM_RETRY
+        self._set_live(True)
+
+    def _receive(self, message):
+        self.idle_timer.start(self.timeout * 1000)
+        self._handle_message(message)
+
+    def _set_live(self, live):
+        if live == self.live:
+            return
+        self.live = live
+        self.liveChanged.emit(live)
+
+    def _subscribe(self, channel):
+        raise NotImplementedError
+
+    def _handle_message(self, message):
+        raise NotImplementedError
@@ -0,0 +1,198 @@
+# Dojima, a markets client.
+# Copyright (C) 2012-2013 Emery Hemingway
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import base64
+import hashlib
+import logging
+import os
+import struct
+
+from PyQt4 import QtCore, QtNetwork
+
+
+logger = logging.getLogger(__name__)
+
+GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+CONTINUATION = 0x0
+TEXT = 0x1
+BINARY = 0x2
+CLOSE = 0x8
+PING = 0x9
+PONG = 0xA
+
+
+def _mask(data, key):
+    if not data:
+        return data
+    repeated = (key * (len(data) // 4 + 1))[:len(data)]
+    masked = int.from_bytes(data, 'big') ^ int.from_bytes(repeated, 'big')
+    return masked.to_bytes(len(data), 'big')
+
+
+class WebSocket(QtCore.QObject):
+    """A minimal RFC 6455 client, Qt 4 has none of its own."""
+
+    opened = QtCore.pyqtSignal()
+    closed = QtCore.pyqtSignal()
+    message = QtCore.pyqtSignal(str)
+    error = QtCore.pyqtSignal(str)
+
+    def __init__(self, parent=None):
+        super(WebSocket, self).__init__(parent)
+        self.socket = QtNetwork.QSslSocket(self)
+        self.socket.readyRead.connect(self._read)
+        self.socket.disconnected.connect(self.closed.emit)
+        self.socket.error.connect(self._socket_error)
+        self.buffer = bytearray()
+        self.fragments = None
+        self.handshaken = False
+        self.closing = False
+
+    def open(self, url):
+        self.url = url
+        if url.scheme() == 'wss':
+            self.socket.encrypted.connect(self._handshake)
+            self.socket.connectToHostEncrypted(url.host(), url.port(443))
+        else:
+            self.socket.connected.connect(self._handshake)
+            self.socket.connectToHost(url.host(), url.port(80))
+
+    def close(self):
+        if self.handshaken and not self.closing:
+            self.closing = True
+            self._send_frame(CLOSE, struct.pack('!H', 1000))
+        self.socket.disconnectFromHost()
+
+    def send(self, text):
+        self._send_frame(TEXT, text.encode())
+
+    def _handshake(self):
+        self.key = base64.b64encode(os.urandom(16))
+        path = self.url.encodedPath().data().decode() or '/'
+        if self.url.hasQuery():
+            path += '?' + self.url.encodedQuery().data().decode()
+        host = self.url.host()
+        if self.url.port() != -1:
+            host += ':{}'.format(self.url.port())
+
+        request = ("GET {} HTTP/1.1\r\n"
+                   "Host: {}\r\n"
+                   "Upgrade: websocket\r\n"
+                   "Connection: Upgrade\r\n"
+                   "Sec-WebSocket-Key: {}\r\n"
+                   "Sec-WebSocket-Version: 13\r\n"
+                   "Origin: http://{}\r\n\r\n").format(
+                       path, host, self.key.decode(), self.url.host())
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("opening websocket to %s", self.url.toString())
+        self.socket.write(request.encode())
+
+    def _check_handshake(self, header):
+        lines = header.split('\r\n')
+        if lines[0].split()[1:2] != ['101']:
+            return False
+        accept = base64.b64encode(hashlib.sha1(self.key + GUID).digest())
+        for line in lines[1:]:
+            name, sep, value = line.partition(':')
+            if name.strip().lower() == 'sec-websocket-accept':
+                return value.strip().encode() == accept
+        return False
+
+    def _read(self):
+        self.buffer.extend(self.socket.readAll().data())
+        if not self.handshaken:
+            end = self.buffer.find(b'\r\n\r\n')
+            if end < 0:
+                return
+            header = self.buffer[:end].decode('latin-1')
+            del self.buffer[:end + 4]
+            if not self._check_handshake(header):
+                self.error.emit("websocket handshake refused by {}: {}".format(
+                    self.url.host(), header.split('\r\n')[0]))
+                self.socket.abort()
+                return
+            self.handshaken = True
+            self.opened.emit()
+
+        while self._read_frame():
+            pass
+
+    def _read_frame(self):
+        buffer = self.buffer
+        if len(buffer) < 2:
+            return False
+        final = buffer[0] & 0x80
+        opcode = buffer[0] & 0x0f
+        masked = buffer[1] & 0x80
+        length = buffer[1] & 0x7f
+        offset = 2
+        if length == 126:
+            if len(buffer) < 4:
+                return False
+            length, = struct.unpack('!H', bytes(buffer[2:4]))
+            offset = 4
+        elif length == 127:
+            if len(buffer) < 10:
+                return False
+            length, = struct.unpack('!Q', bytes(buffer[2:10]))
+            offset = 10
+        if masked:
+            key = bytes(buffer[offset:offset + 4])
+            offset += 4
+        if len(buffer) < offset + length:
+            return False
+
+        payload = bytes(buffer[offset:offset + length])
+        del buffer[:offset + length]
+        if masked:
+            payload = _mask(payload, key)
+
+        if opcode in (TEXT, BINARY):
+            self.fragments = [payload]
+        elif opcode == CONTINUATION and self.fragments is not None:
+            self.fragments.append(payload)
+        elif opcode == PING:
+            self._send_frame(PONG, payload)
+            return True
+        elif opcode == CLOSE:
+            if not self.closing:
+                self.closing = True
+                self._send_frame(CLOSE, payload[:2])
+            self.socket.disconnectFromHost()
+            return False
+        else:
+            return True
+
+        if final:
+            text = b''.join(self.fragments).decode()
+            self.fragments = None
+            self.message.emit(text)
+        return True
+
+    def _send_frame(self, opcode, payload):
+        length = len(payload)
+        if length < 126:
+            header = struct.pack('!BB', 0x80 | opcode, 0x80 | length)
+        elif length < 0x10000:
+            header = struct.pack('!BBH', 0x80 | opcode, 0x80 | 126, length)
+        else:
+            header = struct.pack('!BBQ', 0x80 | opcode, 0x80 | 127, length)
+        key = os.urandom(4)
+        self.socket.write(header + key + _mask(payload, key))
+
+    def _socket_error(self, socket_error):
+        self.error.emit(self.socket.errorString())
@@ -0,0 +1,118 @@
+# Dojima, a markets client.
+# Copyright (C) 2012-2013 Emery Hemingway
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+A timeline of how startup is spent, written as a Chrome trace that
+chrome://tracing or Perfetto can open. Nothing is recorded unless
+start() was called.
+"""
+
+import builtins
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+profiler = None
+
+
+def start(filename):
+    """Record module imports and the phases marked with timed() until
+    finish() is called, then write the timeline to filename."""
+    global profiler
+    profiler = StartupProfiler(filename)
+    profiler.install()
+    return profiler
+
+def finish():
+    global profiler
+    if profiler is None:
+        return
+    profiler.uninstall()
+    profiler.instant('first idle')
+    profiler.write()
+    profiler = None
+
+def timed(name):
+    """Decorate a startup phase to be recorded as name."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if profiler is None:
+                return function(*args, **kwargs)
+            start = profiler.clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profiler.complete(name, 'startup', start)
+        return wrapper
+    return decorator
+
+
+class StartupProfiler(object):
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.events = list()
+        self.started = time.perf_counter()
+        self.pid = os.getpid()
+        self.tid = threading.get_ident()
+        self.original_import = None
+
+    def clock(self):
+        """Return microseconds since the profiler was started."""
+        return (time.perf_counter() - self.started) * 1e6
+
+    def complete(self, name, category, start):
+        self.events.append({'name': name, 'cat': category, 'ph': 'X',
+                            'ts': start, 'dur': self.clock() - start,
+                            'pid': self.pid, 'tid': self.tid})
+
+    def instant(self, name):
+        self.events.append({'name': name, 'cat': 'startup', 'ph': 'i',
+                            's': 'p', 'ts': self.clock(),
+                            'pid': self.pid, 'tid': self.tid})
+
+    def install(self):
+        self.original_import = builtins.__import__
+        builtins.__import__ = self._import
+
+    def uninstall(self):
+        if self.original_import is not None:
+            builtins.__import__ = self.original_import
+            self.original_import = None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        # only the first import of a module does any work
+        if level or name in sys.modules:
+            return self.original_import(name, globals, locals, fromlist, level)
+        start = self.clock()
+        try:
+            return self.original_import(name, globals, locals, fromlist, level)
+        finally:
+            self.complete(name, 'import', start)
+
+    def write(self):
+        with open(self.filename, 'w') as f:
+            json.dump({'traceEvents': self.events,
+                       'displayTimeUnit': 'ms'}, f)
+        logger.info("wrote startup profile to %s", self.filename)
@@ -0,0 +1,55 @@
+# Dojima, a markets client.
+# Copyright (C) 2012-2013 Emery Hemingway
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Where data is kept on disk. The location is worked out without QtGui,
+so that it is the same under the QCoreApplication of a daemon as under
+the QApplication of the GUI, and matches the DataLocation of
+QDesktopServices, where earlier versions kept their data.
+"""
+
+import os
+import os.path
+import sys
+
+from PyQt4 import QtCore
+
+
+directory = None
+
+
+def set_directory(path):
+    """Keep data in path rather than in the data location of the
+    platform."""
+    global directory
+    directory = path
+
+def get_directory():
+    if directory is not None:
+        return directory
+    names = [ name for name in (QtCore.QCoreApplication.organizationName(),
+                                QtCore.QCoreApplication.applicationName())
+              if name ]
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Application Support')
+    else:
+        base = os.environ.get('XDG_DATA_HOME')
+        if not base:
+            base = os.path.join(os.path.expanduser('~'), '.local', 'share')
+        base = os.path.join(base, 'data')
+    return os.path.join(base, *names)
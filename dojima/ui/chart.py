@@ -16,6 +16,7 @@
 
 from PyQt4 import QtCore, QtGui
 
+import numpy as np
 import matplotlib.ticker
 import matplotlib.figure
 from matplotlib.backends.backend_qt4agg import FigureCanvasQTAgg as FigureCanvas
@@ -30,8 +31,18 @@ class _ChartDialog(QtGui.QDialog):
         self.refresh_button.setDisabled(True)
         self.proxy.refresh()
 
+    def subscribe(self):
+        """Keep the chart polled until the dialog is closed."""
+        self.exchange.setStreamState(self.stream, True, self.remote_market_id)
+        self.finished.connect(self.unsubscribe)
+
+    def unsubscribe(self):
+        self.finished.disconnect(self.unsubscribe)
+        self.exchange.setStreamState(self.stream, False, self.remote_market_id)
+
         
 class DepthDialog(_ChartDialog):
+    stream = 'depth'
 
     def __init__(self, marketProxy, exchange, remoteMarketID, parent=None):
         super(DepthDialog, self).__init__(parent)
@@ -43,6 +54,9 @@ class DepthDialog(_ChartDialog):
         self.proxy = self.exchange.getDepthProxy(self.remote_market_id)
 
         self.chart_canvas = ChartCanvasDepth(self)
+        # each side is one line whose data is replaced as the book changes
+        self.ask_line, = self.chart_canvas.axes.step([], [], color='r')
+        self.bid_line, = self.chart_canvas.axes.step([], [], color='g')
 
         self.refresh_button = QtGui.QPushButton(QtCore.QCoreApplication.translate('ChartDialog', "Refresh"))
 
@@ -57,20 +71,77 @@ class DepthDialog(_ChartDialog):
         self.refresh_button.clicked.connect(self.requestRefresh)
         self.proxy.asks.connect(self.plotAsks)
         self.proxy.bids.connect(self.plotBids)
+        self.proxy.echo()
         self.requestRefresh()
+        self.subscribe()
         
     def plotAsks(self, data):
         self.refresh_button.setEnabled(True)
-        self.chart_canvas.axes.step(data[0], data[1], color='r')
-        self.chart_canvas.draw()
+        self.chart_canvas.plotLine(self.ask_line, data[0], data[1])
 
     def plotBids(self, data):
         self.refresh_button.setEnabled(True)
-        self.chart_canvas.axes.step(data[0], data[1], color='g')
-        self.chart_canvas.draw()
+        self.chart_canvas.plotLine(self.bid_line, data[0], data[1])
+
+
+class ConsolidatedDepthDialog(_ChartDialog):
+    """The depth of every open exchange that trades a market, with the
+    volume at each price summed across exchanges."""
+    stream = 'depth'
+
+    def __init__(self, marketProxy, parent=None):
+        super(ConsolidatedDepthDialog, self).__init__(parent)
+        self.market_proxy = marketProxy
+        self.proxy = self.market_proxy.getConsolidatedBook()
+        self.proxy.attach()
+
+        self.chart_canvas = ChartCanvasDepth(self)
+        self.ask_line, = self.chart_canvas.axes.step([], [], color='r')
+        self.bid_line, = self.chart_canvas.axes.step([], [], color='g')
+
+        self.refresh_button = QtGui.QPushButton(QtCore.QCoreApplication.translate('ChartDialog', "Refresh"))
+
+        button_box = QtGui.QDialogButtonBox()
+        button_box.addButton(self.refresh_button, button_box.ActionRole)
+
+        layout = QtGui.QVBoxLayout()
+        layout.addWidget(self.chart_canvas)
+        layout.addWidget(button_box)
+        self.setLayout(layout)
+
+        self.refresh_button.clicked.connect(self.requestRefresh)
+        self.proxy.asks.connect(self.plotAsks)
+        self.proxy.bids.connect(self.plotBids)
+        self.proxy.echo()
+        self.requestRefresh()
+        self.subscribe()
+
+    def subscribe(self):
+        """Keep the depth of every venue polled until the dialog is closed."""
+        self.subscribed = [ (exchange, remote_market_id)
+                            for exchange, (exchange_proxy, remote_market_id, inverted)
+                            in zip(self.proxy.exchanges, self.proxy.venues) ]
+        for exchange, remote_market_id in self.subscribed:
+            exchange.setStreamState(self.stream, True, remote_market_id)
+        self.finished.connect(self.unsubscribe)
+
+    def unsubscribe(self):
+        self.finished.disconnect(self.unsubscribe)
+        for exchange, remote_market_id in self.subscribed:
+            exchange.setStreamState(self.stream, False, remote_market_id)
+
+    def plotAsks(self, data):
+        self.refresh_button.setEnabled(True)
+        self.chart_canvas.plotLine(self.ask_line, data[0], np.cumsum(data[1]))
+
+    def plotBids(self, data):
+        self.refresh_button.setEnabled(True)
+        self.chart_canvas.plotLine(self.bid_line, data[0], np.cumsum(data[1]))
+
 
         
 class TradesDialog(_ChartDialog):
+    stream = 'trades'
 
     def __init__(self, marketProxy, exchange, remoteMarketID, parent=None):
         super(TradesDialog, self).__init__(parent)
@@ -94,8 +165,13 @@ class TradesDialog(_ChartDialog):
         self.setLayout(layout)
 
         self.refresh_button.clicked.connect(self.requestRefresh)
+        self.line = None
         self.proxy.refreshed.connect(self.plot)
+        self.proxy.added.connect(self.addTrades)
+        # plot what is already known while the refresh is out
+        self.proxy.echo()
         self.requestRefresh()
+        self.subscribe()
     
     def plot(self, data):
         self.refresh_button.setEnabled(True)
@@ -106,9 +182,21 @@ class TradesDialog(_ChartDialog):
                 QtCore.QCoreApplication.translate("TradesChartDialog",
                                                   "Not enough trade data to chart."))
             return
-        self.chart_canvas.axes.plot(data[0], data[1])
+        if self.line is None:
+            self.line, = self.chart_canvas.axes.plot(data[0], data[1])
+        else:
+            self.line.set_data(data[0], data[1])
+            self.chart_canvas.axes.relim()
+            self.chart_canvas.axes.autoscale_view()
         self.chart_canvas.draw()
 
+    def addTrades(self, data):
+        # a refresh that found nothing new leaves the chart as it is
+        if not data.shape[1]:
+            self.refresh_button.setEnabled(True)
+            return
+        self.plot(self.proxy.last_trades)
+
         
 class ChartCanvasDepth(FigureCanvas):
     
@@ -143,6 +231,14 @@ class ChartCanvasDepth(FigureCanvas):
 
         self.cid = self.mpl_connect('button_press_event', self.onclick)
 
+    def plotLine(self, line, x, y):
+        """Replace the data of a line and redraw when the event loop is
+        next idle, so that a burst of updates draws once."""
+        line.set_data(x, y)
+        self.axes.relim()
+        self.axes.autoscale_view()
+        self.draw_idle()
+
     def onclick(self, event):
         self.parent.pricePicked.emit(event.xdata)
 
@@ -19,13 +19,22 @@ from decimal import Decimal
 
 from PyQt4 import QtCore, QtGui
 
-import dojima.ui.chart
+import dojima.data.portfolio
 import dojima.ui.widget
 import dojima.model.commodities
 
 logger =  logging.getLogger(__name__)
 
 
+def recording_enabled():
+    """Return whether exchange docks keep the market data of their
+    markets on disk, which is off until chosen in the options menu."""
+    return QtCore.QSettings().value('ticks/record', False, type=bool)
+
+def set_recording_enabled(enable):
+    QtCore.QSettings().setValue('ticks/record', enable)
+
+
 class ErrorHandling(object):
 
     # TODO this thing make redundant messages, it sucks.
@@ -51,7 +60,13 @@ class ExchangeDockWidget(QtGui.QDockWidget, ErrorHandling):
         self.market_proxy = marketProxy
         self.exchange = exchangeProxy.getExchangeObject()
         self.remote_market = remoteMarketID
+        self.exchange_id = exchangeProxy.id
         self.enable_exchange_action = action
+        self.warm = False
+        self.account_streams = False
+        self.recording = False
+        self.in_portfolio = False
+        self.portfolio_market = None
 
         # get our display parameters
         if self.exchange.valueType is int:
@@ -106,6 +121,7 @@ class ExchangeDockWidget(QtGui.QDockWidget, ErrorHandling):
         self.menu_bar = ExchangeDockWidgetMenuBar(self)
         if hasattr(self.exchange, 'getDepthProxy'):
             self.menu_bar.addDepthChartAction()
+            self.menu_bar.addConsolidatedDepthChartAction()
         if hasattr(self.exchange, 'getTradesProxy'):
             self.menu_bar.addTradesChartAction()
 
@@ -350,10 +366,12 @@ class ExchangeDockWidget(QtGui.QDockWidget, ErrorHandling):
             self.exchange.cancelBidOffer(offer_id, self.remote_market)
 
     def changeMarket(self, market_id):
-        self.exchange.setTickerStreamState(self.remote_market, False)
-        self.remote_market = marked_id
-        self.exchange.setTickerStreamState(self.remote_market, True)
+        self.exchange.setTickerStreamState(False, self.remote_market)
+        self.remote_market = market_id
+        self.exchange.setTickerStreamState(True, self.remote_market)
         self.exchange.echoTicker(self.remote_market)
+        if self.in_portfolio:
+            self.setPortfolioState(True)
 
     def closeEvent(self, event):
         self.enableExchange(False)
@@ -366,10 +384,63 @@ class ExchangeDockWidget(QtGui.QDockWidget, ErrorHandling):
         self.setVisible(enable)
         self.set_signal_connection_state(enable)
         self.exchange.setTickerStreamState(enable, self.remote_market)
+        self.setAccountStreamState(enable)
+        self.setHostWarm(enable)
+        self.setRecording(enable)
+        self.setPortfolioState(enable)
 
         if enable:
             self.exchange.echoTicker(self.remote_market)
 
+    def setRecording(self, enable):
+        """Keep the market data of this market on disk while the dock is
+        open, if recording is enabled."""
+        enable = enable and recording_enabled()
+        if enable == self.recording:
+            return
+        self.recording = enable
+        # the tick store needs numpy, which is left until a market is open
+        import dojima.data.ticks
+        if enable:
+            dojima.data.ticks.record(self.exchange_id, self.exchange,
+                                     self.remote_market)
+        else:
+            dojima.data.ticks.release(self.exchange_id, self.remote_market)
+
+    def setPortfolioState(self, enable):
+        """Count the balances of this market in the portfolio while the
+        dock is open, following the market and account it shows."""
+        self.in_portfolio = enable
+        portfolio = dojima.data.portfolio.get_portfolio()
+        if self.portfolio_market is not None:
+            portfolio.removeMarket(*self.portfolio_market)
+            self.portfolio_market = None
+        if enable and self.exchange.hasAccount(self.remote_market):
+            portfolio.addMarket(self.exchange_id, self.exchange,
+                                self.remote_market,
+                                self.market_proxy.base_id,
+                                self.market_proxy.counter_id)
+            self.portfolio_market = (self.exchange_id, self.remote_market)
+
+    def setAccountStreamState(self, enable):
+        """Keep the balances and offers polled while the dock is open."""
+        if enable == self.account_streams:
+            return
+        self.account_streams = enable
+        self.exchange.setStreamState('balance', enable, self.remote_market)
+        self.exchange.setStreamState('offers', enable, self.remote_market)
+
+    def setHostWarm(self, warm):
+        """Keep a connection to the exchange open while the dock is."""
+        if warm == self.warm:
+            return
+        self.warm = warm
+        hostname = self.exchange.host_queue.hostname
+        if warm:
+            self.exchange.network_manager.warm_up(hostname)
+        else:
+            self.exchange.network_manager.cool_down(hostname)
+
     def placeAskLimit(self):
         amount = self.amount_spin.value()
         price = self.price_spin.value()
@@ -423,6 +494,10 @@ class ExchangeDockWidget(QtGui.QDockWidget, ErrorHandling):
         self.counter_balance_proxy.balance_total_changed.connect(self.counter_balance_total_label.changeValue)
         self.counter_balance_proxy.balance_liquid_changed.connect(self.counter_balance_liquid_label.changeValue)
 
+        if self.in_portfolio:
+            # follow the balances of the new account
+            self.setPortfolioState(True)
+
         self.asks_model = self.exchange.getOffersModelAsks(self.remote_market)
         self.bids_model = self.exchange.getOffersModelBids(self.remote_market)
 
@@ -497,6 +572,16 @@ class ExchangeDockWidgetMenuBar(QtGui.QMenuBar):
                                               "offers depth cart."))
         action.triggered.connect(self.showDepthChart)
 
+    def addConsolidatedDepthChartAction(self):
+        action = self.market_menu.addAction(
+            QtCore.QCoreApplication.translate('ExchangeDockWidget',
+                                              "Consolidated Depth Chart",
+                                              "A menu action to show the current "
+                                              "offers of all open exchanges "
+                                              "trading the market in one depth "
+                                              "chart."))
+        action.triggered.connect(self.showConsolidatedDepthChart)
+
     def addTradesChartAction(self):
         action = self.market_menu.addAction(
             QtCore.QCoreApplication.translate('ExchangeDockWidget',
@@ -515,11 +600,20 @@ class ExchangeDockWidgetMenuBar(QtGui.QMenuBar):
         return self.account_menu
 
     def showDepthChart(self):
+        # matplotlib is imported with the first chart
+        import dojima.ui.chart
         dialog = dojima.ui.chart.DepthDialog(self.dock.market_proxy, self.dock.exchange, self.dock.remote_market, self)
         dialog.pricePicked.connect(self.dock.price_spin.setValue)
         dialog.show()
 
+    def showConsolidatedDepthChart(self):
+        import dojima.ui.chart
+        dialog = dojima.ui.chart.ConsolidatedDepthDialog(self.dock.market_proxy, self)
+        dialog.pricePicked.connect(self.dock.price_spin.setValue)
+        dialog.show()
+
     def showTradesChart(self):
+        import dojima.ui.chart
         dialog = dojima.ui.chart.TradesDialog(self.dock.market_proxy, self.dock.exchange, self.dock.remote_market, self)
         dialog.pricePicked.connect(self.dock.price_spin.setValue)
         dialog.show()
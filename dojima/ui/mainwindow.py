@@ -20,9 +20,12 @@ import logging
 from PyQt4 import QtCore, QtGui
 
 import dojima.markets
-#This next import registers the exchanges into dojima.markets
-from dojima.exchange_modules import *
+import dojima.startup
+#This next import registers the exchanges into dojima.exchanges
+import dojima.exchange_modules
 import dojima.ui.exchange
+import dojima.ui.network
+import dojima.ui.portfolio
 import dojima.ui.edit.commodities
 import dojima.ui.wizard
 #import dojima.ui.ot.action
@@ -34,6 +37,7 @@ logger = logging.getLogger(__name__)
 
 class MainWindow(QtGui.QMainWindow):
 
+    @dojima.startup.timed('MainWindow.__init__')
     def __init__(self, parent=None):
         super (MainWindow, self).__init__(parent)
 
@@ -86,12 +90,34 @@ class MainWindow(QtGui.QMainWindow):
             menuRole=QtGui.QAction.PreferencesRole)
         
         options_menu.addAction(edit_commodities_action)
+
+        record_action = QtGui.QAction(
+            QtCore.QCoreApplication.translate("MainWindow", "&Record market data",
+                                              "A menu action to keep the "
+                                              "market data of open markets "
+                                              "on disk."),
+            self, checkable=True,
+            checked=dojima.ui.exchange.recording_enabled(),
+            toggled=dojima.ui.exchange.set_recording_enabled)
+        options_menu.addAction(record_action)
+
+        self.network_stats_dock = dojima.ui.network.NetworkStatsDockWidget(self)
+        self.addDockWidget(QtCore.Qt.BottomDockWidgetArea, self.network_stats_dock)
+        self.network_stats_dock.hide()
+        network_stats_action = self.network_stats_dock.toggleViewAction()
+        network_stats_action.setText(
+            QtCore.QCoreApplication.translate("MainWindow", "&Network stats"))
+        options_menu.addAction(network_stats_action)
         self.menuBar().addMenu(options_menu)
 
+        self.portfolio_widget = dojima.ui.portfolio.PortfolioWidget(self)
+        self.statusBar().addPermanentWidget(self.portfolio_widget)
+
         self.setDockNestingEnabled(True)
 
         self.refreshMarkets()
 
+    @dojima.startup.timed('MainWindow.refreshMarkets')
     def refreshMarkets(self, showNew=False):
         dojima.exchanges.refresh()
         for market_proxy in dojima.markets.container:
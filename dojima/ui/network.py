@@ -0,0 +1,95 @@
+# Dojima, a markets client.
+# Copyright (C) 2012-2013 Emery Hemingway
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from PyQt4 import QtCore, QtGui
+
+import dojima.network.metrics
+
+
+# (measure, percentile) pairs shown in the table
+COLUMNS = ( ('queue_wait', 'p50'), ('queue_wait', 'p99'),
+            ('first_byte', 'p50'), ('first_byte', 'p99'),
+            ('total', 'p50'), ('total', 'p99'),
+            ('parse', 'p50'), ('parse', 'p99'),
+            ('size', 'p50') )
+
+
+class NetworkStatsDockWidget(QtGui.QDockWidget):
+
+    def __init__(self, parent=None):
+        super(NetworkStatsDockWidget, self).__init__(
+            QtCore.QCoreApplication.translate('NetworkStatsDockWidget',
+                                              "Network stats",
+                                              "The title of the network "
+                                              "statistics dock."),
+            parent)
+
+        labels = [ QtCore.QCoreApplication.translate('NetworkStatsDockWidget', "Host"),
+                   QtCore.QCoreApplication.translate('NetworkStatsDockWidget', "Endpoint"),
+                   QtCore.QCoreApplication.translate('NetworkStatsDockWidget', "Requests"),
+                   QtCore.QCoreApplication.translate('NetworkStatsDockWidget', "Queue p50 ms"),
+                   QtCore.QCoreApplication.translate('NetworkStatsDockWidget', "Queue p99 ms"),
+                   QtCore.QCoreApplication.translate('NetworkStatsDockWidget', "First byte p50 ms"),
+                   QtCore.QCoreApplication.translate('NetworkStatsDockWidget', "First byte p99 ms"),
+                   QtCore.QCoreApplication.translate('NetworkStatsDockWidget', "Total p50 ms"),
+                   QtCore.QCoreApplication.translate('NetworkStatsDockWidget', "Total p99 ms"),
+                   QtCore.QCoreApplication.translate('NetworkStatsDockWidget', "Parse p50 ms"),
+                   QtCore.QCoreApplication.translate('NetworkStatsDockWidget', "Parse p99 ms"),
+                   QtCore.QCoreApplication.translate('NetworkStatsDockWidget', "Size p50 B"),
+                   QtCore.QCoreApplication.translate('NetworkStatsDockWidget', "Connection reuse %") ]
+
+        self.table = QtGui.QTableWidget(0, len(labels))
+        self.table.setHorizontalHeaderLabels(labels)
+        self.table.setEditTriggers(QtGui.QAbstractItemView.NoEditTriggers)
+        self.table.verticalHeader().hide()
+        self.setWidget(self.table)
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.visibilityChanged.connect(self.setRefreshState)
+
+    def setRefreshState(self, visible):
+        if visible:
+            self.refresh()
+            self.timer.start(2000)
+        else:
+            self.timer.stop()
+
+    def refresh(self):
+        stats = dojima.network.metrics.get_stats()
+        connection_stats = dojima.network.metrics.get_connection_stats()
+        rows = list()
+        for host, endpoints in sorted(stats.items()):
+            for endpoint, measures in sorted(endpoints.items()):
+                rows.append((host, endpoint, measures))
+
+        self.table.setRowCount(len(rows))
+        for row, (host, endpoint, measures) in enumerate(rows):
+            self.table.setItem(row, 0, QtGui.QTableWidgetItem(host))
+            self.table.setItem(row, 1, QtGui.QTableWidgetItem(endpoint))
+            self.table.setItem(row, 2, QtGui.QTableWidgetItem(
+                str(measures['total']['count'])))
+            for column, (measure, percentile) in enumerate(COLUMNS, 3):
+                value = measures[measure][percentile]
+                item = QtGui.QTableWidgetItem('{:.1f}'.format(value))
+                item.setTextAlignment(QtCore.Qt.AlignRight | QtCore.Qt.AlignVCenter)
+                self.table.setItem(row, column, item)
+
+            if host in connection_stats:
+                ratio = connection_stats[host]['reuse_ratio']
+                item = QtGui.QTableWidgetItem('{:.0f}'.format(ratio * 100))
+                item.setTextAlignment(QtCore.Qt.AlignRight | QtCore.Qt.AlignVCenter)
+                self.table.setItem(row, len(COLUMNS) + 3, item)
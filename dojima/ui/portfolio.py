@@ -0,0 +1,107 @@
+# Dojima, a markets client.
+# Copyright (C) 2012-2013 Emery Hemingway
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from PyQt4 import QtCore, QtGui
+
+import dojima.data.portfolio
+import dojima.model.commodities
+
+
+class PortfolioWidget(QtGui.QWidget):
+    """The value of the accounts of every open exchange dock in a
+    commodity chosen from the local commodities, for the status bar."""
+
+    def __init__(self, parent=None):
+        super(PortfolioWidget, self).__init__(parent)
+        self.portfolio = dojima.data.portfolio.get_portfolio()
+        self.commodities = dojima.model.commodities.local_model
+
+        self.total_label = QtGui.QLabel()
+        self.liquid_label = QtGui.QLabel()
+        self.unpriced_label = QtGui.QLabel()
+        self.reference_combo = QtGui.QComboBox()
+        self.reference_combo.setModel(self.commodities)
+        self.reference_combo.setModelColumn(self.commodities.NAME)
+        self.reference_combo.setToolTip(
+            QtCore.QCoreApplication.translate('PortfolioWidget',
+                                              "The commodity the portfolio "
+                                              "is valued in"))
+
+        layout = QtGui.QHBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(QtGui.QLabel(
+            QtCore.QCoreApplication.translate('PortfolioWidget', "total:",
+                                              "the value of all balances")))
+        layout.addWidget(self.total_label)
+        layout.addWidget(QtGui.QLabel(
+            QtCore.QCoreApplication.translate('PortfolioWidget', "liquid:",
+                                              "the value of all balances "
+                                              "not held by offers")))
+        layout.addWidget(self.liquid_label)
+        layout.addWidget(self.reference_combo)
+        layout.addWidget(self.unpriced_label)
+        self.setLayout(layout)
+
+        if self.portfolio.reference is not None:
+            row = self.commodities.getRow(self.portfolio.reference)
+            if row is not None:
+                self.reference_combo.setCurrentIndex(row)
+
+        self.reference_combo.currentIndexChanged[int].connect(self.changeReference)
+        self.portfolio.total_signal.connect(self.setTotal)
+        self.portfolio.liquid_signal.connect(self.setLiquid)
+        self.portfolio.unpriced_signal.connect(self.setUnpriced)
+        self.showValues()
+
+    def changeReference(self, row):
+        commodity_id = self.reference_combo.itemData(row, QtCore.Qt.UserRole)
+        if commodity_id:
+            self.portfolio.setReference(commodity_id)
+            self.showValues()
+
+    def setTotal(self, value):
+        self.total_label.setText(self._format(value))
+
+    def setLiquid(self, value):
+        self.liquid_label.setText(self._format(value))
+
+    def setUnpriced(self, commodity_ids):
+        if not commodity_ids:
+            self.unpriced_label.clear()
+            return
+        names = [ self.commodities.getName(commodity_id) or commodity_id
+                  for commodity_id in commodity_ids ]
+        self.unpriced_label.setText(
+            QtCore.QCoreApplication.translate('PortfolioWidget',
+                                              "unpriced: {}",
+                                              "commodities held that have "
+                                              "no price in the commodity the "
+                                              "portfolio is valued in"
+                                              ).format(", ".join(names)))
+
+    def showValues(self):
+        total, liquid = self.portfolio.getTotals()
+        self.setTotal(total)
+        self.setLiquid(liquid)
+        self.setUnpriced(self.portfolio.getUnpriced())
+
+    def _format(self, value):
+        reference = self.portfolio.reference
+        prefix, suffix = self.commodities.getPrefixSuffix(reference) or ('', '')
+        precision = self.commodities.getPrecision(reference)
+        if precision is None:
+            precision = 2
+        return "{}{:.{}f}{}".format(prefix, value, precision, suffix)
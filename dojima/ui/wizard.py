@@ -19,6 +19,10 @@ from PyQt4 import QtCore, QtGui
 import dojima.exchanges
 import dojima.ui.edit.commodities
 
+# Exchange pages are made when they are moved to, with ids from here
+FIRST_EXCHANGE_PAGE = 1000
+
+
 class AddMarketsWizard(QtGui.QWizard):
 
     def __init__(self, parent):
@@ -96,15 +100,32 @@ class SelectExchangePage(QtGui.QWizardPage):
         self.completeChanged.emit()
 
     def initializePage(self):
-        wizard = self.wizard()
+        self.list_widget.clear()
+        self.next_page_id = FIRST_EXCHANGE_PAGE
         for exchange_proxy in dojima.exchanges.container:
-            list_item = ExchangeListItem(exchange_proxy.name, self.list_widget)
-            list_item.setNextPageId(
-                wizard.addPage(exchange_proxy.getWizardPage(wizard)))
+            self.addExchange(exchange_proxy, exchange_proxy.getWizardPage)
 
         self.list_widget.sortItems()
         self.list_widget.setCurrentRow(0)
 
+    def addExchange(self, exchange_proxy, page_factory):
+        list_item = ExchangeListItem(exchange_proxy.name, self.list_widget)
+        list_item.setNextPageId(self.next_page_id)
+        list_item.page_factory = page_factory
+        self.next_page_id += 1
+
+    def validatePage(self):
+        # making the page of an exchange imports its module, so that
+        # waits until the exchange is chosen
+        item = self.list_widget.currentItem()
+        if item is None:
+            return False
+        wizard = self.wizard()
+        page_id = item.getNextPageId()
+        if wizard.page(page_id) is None:
+            wizard.setPage(page_id, item.page_factory(wizard))
+        return True
+
     def isComplete(self):
         return bool(self.list_widget.currentItem())
 
@@ -123,9 +144,7 @@ class SelectExchangePage(QtGui.QWizardPage):
             if exchange_proxy is None:
                 return
 
-            list_item = ExchangeListItem(exchange_proxy.name, self.list_widget)
-            list_item.setNextPageId(
-                self.wizard().addPage(exchange_proxy.nextPage(self.wizard())))
+            self.addExchange(exchange_proxy, exchange_proxy.nextPage)
             self.list_widget.sortItems()
 
             
@@ -0,0 +1,277 @@
+# Dojima, a markets client.
+# Copyright (C) 2012-2013 Emery Hemingway
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+The Qt application and local stand-in servers that tests run exchange
+code against, in place of the network.
+"""
+
+import base64
+import hashlib
+import os
+import struct
+import tempfile
+import time
+
+from PyQt4 import QtCore, QtNetwork
+
+
+_application = None
+
+def get_application():
+    """Return the QCoreApplication of the tests, which keeps its settings
+    and data in a temporary directory."""
+    global _application
+    if _application is None:
+        home = tempfile.mkdtemp(prefix='dojima-test-')
+        os.environ['HOME'] = home
+        os.environ['XDG_CONFIG_HOME'] = os.path.join(home, 'config')
+        os.environ['XDG_DATA_HOME'] = os.path.join(home, 'data')
+        _application = QtCore.QCoreApplication.instance()
+        if _application is None:
+            _application = QtCore.QCoreApplication([])
+        _application.setOrganizationName("dojima-test")
+        _application.setApplicationName("dojima")
+    return _application
+
+def spin(msecs):
+    """Run the event loop for msecs."""
+    loop = QtCore.QEventLoop()
+    QtCore.QTimer.singleShot(msecs, loop.quit)
+    loop.exec_()
+
+def wait_for(predicate, timeout=5):
+    """Run the event loop until predicate() is true, or timeout seconds
+    have passed, and return what predicate() last returned."""
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return predicate()
+        spin(10)
+    return True
+
+
+class ExchangeStandIn(object):
+    """Holds what requests need of the exchange object that makes them."""
+
+    def __init__(self, network_manager, hostname='127.0.0.1', wait=10, burst=1):
+        self.network_manager = network_manager
+        self.host_queue = network_manager.get_host_request_queue(
+            hostname, wait, burst)
+        self.replies = set()
+        self.market_stream = None
+
+class HTTPStandIn(QtCore.QObject):
+    """Answers HTTP requests on a local port.
+
+    handler is called with the path and query of each request, and returns
+    a (status, body) pair, or a (status, body, headers) triple with a dict
+    of extra headers, or None to close the connection without an answer
+    as a failing network would. The paths are kept in requests.
+    """
+
+    def __init__(self, handler, parent=None):
+        super(HTTPStandIn, self).__init__(parent)
+        self.handler = handler
+        self.requests = list()
+        self.server = QtNetwork.QTcpServer(self)
+        self.server.newConnection.connect(self._accept)
+        if not self.server.listen(QtNetwork.QHostAddress.LocalHost, 0):
+            raise RuntimeError(self.server.errorString())
+        self.url = 'http://127.0.0.1:{}/'.format(self.server.serverPort())
+
+    def close(self):
+        self.server.close()
+
+    def _accept(self):
+        while self.server.hasPendingConnections():
+            socket = self.server.nextPendingConnection()
+            buffer = bytearray()
+            socket.readyRead.connect(
+                lambda socket=socket, buffer=buffer: self._read(socket, buffer))
+
+    def _read(self, socket, buffer):
+        buffer.extend(socket.readAll().data())
+        while b'\r\n\r\n' in buffer:
+            head, rest = bytes(buffer).split(b'\r\n\r\n', 1)
+            lines = head.decode('latin-1').split('\r\n')
+            length = 0
+            for line in lines[1:]:
+                name, _, value = line.partition(':')
+                if name.strip().lower() == 'content-length':
+                    length = int(value)
+            if len(rest) < length:
+                return
+            del buffer[:len(head) + 4 + length]
+
+            method, path, version = lines[0].split(' ')
+            self.requests.append(path)
+            answer = self.handler(path)
+            if answer is None:
+                socket.abort()
+                return
+            status, body = answer[:2]
+            headers = answer[2] if len(answer) > 2 else dict()
+            if isinstance(body, str):
+                body = body.encode()
+            extra = ''.join('{}: {}\r\n'.format(name, value)
+                            for name, value in headers.items())
+            socket.write('HTTP/1.1 {} {}\r\n'
+                         'Content-Type: application/json\r\n'
+                         'Content-Length: {}\r\n'
+                         '{}'
+                         '\r\n'.format(status, 'OK' if status == 200 else 'Error',
+                                       len(body), extra).encode() + body)
+
+
+WEBSOCKET_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+def encode_frame(opcode, payload, final=True, key=None):
+    """Return a websocket frame, masked if a key of four bytes is given."""
+    length = len(payload)
+    first = (0x80 if final else 0) | opcode
+    mask_bit = 0x80 if key is not None else 0
+    if length < 126:
+        header = struct.pack('!BB', first, mask_bit | length)
+    elif length < 0x10000:
+        header = struct.pack('!BBH', first, mask_bit | 126, length)
+    else:
+        header = struct.pack('!BBQ', first, mask_bit | 127, length)
+    if key is None:
+        return header + payload
+    return header + key + bytes(b ^ key[i % 4] for i, b in enumerate(payload))
+
+
+class WebSocketStandIn(QtCore.QObject):
+    """Accepts websocket connections on a local port.
+
+    Each connection is kept in connections, in the order they were made.
+    If accept is false the handshake is answered with a wrong key.
+    """
+
+    def __init__(self, accept=True, parent=None):
+        super(WebSocketStandIn, self).__init__(parent)
+        self.accept = accept
+        self.connections = list()
+        self.server = QtNetwork.QTcpServer(self)
+        self.server.newConnection.connect(self._accept)
+        if not self.server.listen(QtNetwork.QHostAddress.LocalHost, 0):
+            raise RuntimeError(self.server.errorString())
+        self.url = 'ws://127.0.0.1:{}/'.format(self.server.serverPort())
+
+    def close(self):
+        self.server.close()
+        for connection in self.connections:
+            connection.socket.abort()
+
+    def _accept(self):
+        while self.server.hasPendingConnections():
+            socket = self.server.nextPendingConnection()
+            self.connections.append(WebSocketConnection(socket, self.accept))
+
+
+class WebSocketConnection(QtCore.QObject):
+    """The server end of one websocket connection.
+
+    The lines of the handshake request are kept in request, and the frames
+    the client sent, as (final, opcode, masked, payload) with the payload
+    unmasked, in frames.
+    """
+
+    def __init__(self, socket, accept=True):
+        super(WebSocketConnection, self).__init__(socket)
+        self.socket = socket
+        self.accept = accept
+        self.buffer = bytearray()
+        self.request = None
+        self.frames = list()
+        self.disconnected = False
+        socket.readyRead.connect(self._read)
+        socket.disconnected.connect(self._disconnected)
+
+    def send(self, opcode, payload, final=True, key=None):
+        self.write(encode_frame(opcode, payload, final, key))
+
+    def write(self, data):
+        self.socket.write(data)
+        self.socket.flush()
+
+    def drop(self):
+        """Close the connection without a close frame."""
+        self.socket.abort()
+
+    def _disconnected(self):
+        self.disconnected = True
+
+    def _read(self):
+        self.buffer.extend(self.socket.readAll().data())
+        if self.request is None:
+            end = self.buffer.find(b'\r\n\r\n')
+            if end < 0:
+                return
+            self.request = self.buffer[:end].decode('latin-1').split('\r\n')
+            del self.buffer[:end + 4]
+            self._answer()
+
+        while self._read_frame():
+            pass
+
+    def _answer(self):
+        key = b''
+        for line in self.request[1:]:
+            name, _, value = line.partition(':')
+            if name.strip().lower() == 'sec-websocket-key':
+                key = value.strip().encode()
+        if not self.accept:
+            key = b'refused'
+        accept = base64.b64encode(hashlib.sha1(key + WEBSOCKET_GUID).digest())
+        self.write(b'HTTP/1.1 101 Switching Protocols\r\n'
+                   b'Upgrade: websocket\r\n'
+                   b'Connection: Upgrade\r\n'
+                   b'Sec-WebSocket-Accept: ' + accept + b'\r\n\r\n')
+
+    def _read_frame(self):
+        buffer = self.buffer
+        if len(buffer) < 2:
+            return False
+        final = bool(buffer[0] & 0x80)
+        opcode = buffer[0] & 0x0f
+        masked = bool(buffer[1] & 0x80)
+        length = buffer[1] & 0x7f
+        offset = 2
+        if length == 126:
+            if len(buffer) < 4:
+                return False
+            length, = struct.unpack('!H', bytes(buffer[2:4]))
+            offset = 4
+        elif length == 127:
+            if len(buffer) < 10:
+                return False
+            length, = struct.unpack('!Q', bytes(buffer[2:10]))
+            offset = 10
+        key = None
+        if masked:
+            key = bytes(buffer[offset:offset + 4])
+            offset += 4
+        if len(buffer) < offset + length:
+            return False
+
+        payload = bytes(buffer[offset:offset + length])
+        del buffer[:offset + length]
+        if masked:
+            payload = bytes(b ^ key[i % 4] for i, b in enumerate(payload))
+        self.frames.append((final, opcode, masked, payload))
+        return True
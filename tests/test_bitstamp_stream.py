@@ -0,0 +1,103 @@
+# Dojima, a markets client.
+# Copyright (C) 2012-2013 Emery Hemingway
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import unittest
+
+from decimal import Decimal
+
+from PyQt4 import QtCore
+
+import standin
+
+standin.get_application()
+
+import dojima.data.market
+import dojima.network
+import dojima.network.websocket as websocket
+import dojima.exchange_modules.bitstamp as bitstamp
+
+
+class BitstampStreamTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = standin.WebSocketStandIn()
+        self.addCleanup(self.server.close)
+        self.exchange = bitstamp.BitstampExchange(
+            dojima.network.NetworkAccessManager())
+        self.stream = self.exchange.market_stream
+        self.stream.url = QtCore.QUrl(self.server.url)
+        self.addCleanup(self.stream.close)
+
+        self.last = list()
+        self.added = list()
+        self.exchange.ticker_proxy.last_signal.connect(self.last.append)
+        self.exchange.trades_proxy.added.connect(self.added.append)
+
+        self.stream.open()
+        self.assertTrue(standin.wait_for(
+            lambda: self.server.connections and
+                    self.server.connections[0].request is not None))
+        self.connection = self.server.connections[0]
+        self.push('pusher:connection_established', {'socket_id': '1.1'})
+        self.assertTrue(standin.wait_for(lambda: self.stream.live))
+
+    def push(self, event, data, channel=None):
+        message = {'event': event, 'data': json.dumps(data)}
+        if channel is not None:
+            message['channel'] = channel
+        self.connection.send(websocket.TEXT, json.dumps(message).encode())
+
+    def test_subscribes(self):
+        self.assertTrue(standin.wait_for(
+            lambda: len(self.connection.frames) == len(bitstamp.BitstampStream.channels)))
+        channels = [ json.loads(frame[3].decode())['data']['channel']
+                     for frame in self.connection.frames ]
+        self.assertEqual(channels, list(bitstamp.BitstampStream.channels))
+
+    def test_trade_keeps_the_time_of_the_exchange(self):
+        self.push('trade', {'id': 7, 'price': 101.5, 'amount': 0.5,
+                            'timestamp': '1370000000'}, 'live_trades')
+        self.assertTrue(standin.wait_for(lambda: self.added))
+        self.assertEqual(self.last, [Decimal('101.5')])
+        trades = self.added[0]
+        self.assertEqual(trades.shape, (4, 1))
+        self.assertAlmostEqual(
+            float(dojima.data.market.num2epoch(trades[dojima.data.market.DATE, 0])),
+            1370000000, places=3)
+        self.assertEqual(trades[dojima.data.market.ID, 0], 7)
+
+    def test_trade_without_a_time_is_left_to_the_poll(self):
+        self.push('trade', {'id': 8, 'price': 102, 'amount': 1}, 'live_trades')
+        self.assertTrue(standin.wait_for(lambda: self.last))
+        standin.spin(100)
+        self.assertEqual(self.added, [])
+        self.assertIsNone(self.exchange.trades_proxy.getCursor())
+
+    def test_book(self):
+        bids = list()
+        asks = list()
+        self.exchange.ticker_proxy.bid_signal.connect(bids.append)
+        self.exchange.ticker_proxy.ask_signal.connect(asks.append)
+        self.push('data', {'bids': [['100.5', '2']], 'asks': [['101', '1']]},
+                  'order_book')
+        self.assertTrue(standin.wait_for(lambda: bids and asks))
+        self.assertEqual(bids, [Decimal('100.5')])
+        self.assertEqual(asks, [Decimal('101')])
+
+
+if __name__ == '__main__':
+    unittest.main()
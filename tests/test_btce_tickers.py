@@ -0,0 +1,160 @@
+# Dojima, a markets client.
+# Copyright (C) 2012-2013 Emery Hemingway
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import importlib
+import json
+import unittest
+
+from decimal import Decimal
+
+from PyQt4 import QtCore
+
+import standin
+
+standin.get_application()
+
+import dojima.network
+
+btce = importlib.import_module('dojima.exchange_modules.btc-e')
+
+
+PAIRS = ['btc_usd', 'ltc_btc']
+TICKER = {'buy': 101.5, 'sell': 100.5, 'last': 101}
+BATCHED = '/api/3/ticker/btc_usd-ltc_btc?ignore_invalid=1'
+
+
+class BatchedTickerTest(unittest.TestCase):
+
+    def setUp(self):
+        settings = QtCore.QSettings()
+        settings.beginGroup(btce.PLAIN_NAME)
+        settings.setValue('API_key', 'key')
+        settings.setValue('API_secret', 'secret')
+
+        self.batched_answers = list()
+        self.server = standin.HTTPStandIn(self.answer)
+        self.addCleanup(self.server.close)
+        for name, path in (('URL_BASE', 'api/2/'), ('URL_BASE_3', 'api/3/')):
+            self.addCleanup(setattr, btce, name, getattr(btce, name))
+            setattr(btce, name, self.server.url + path)
+
+        self.exchange = btce.BtceExchange(dojima.network.NetworkAccessManager())
+        self.last = dict()
+        for pair in PAIRS:
+            self.exchange.getTickerProxy(pair).last_signal.connect(
+                lambda value, pair=pair: self.last.__setitem__(pair, value))
+
+    def answer(self, path):
+        if path == BATCHED:
+            return self.batched_answers.pop(0)
+        for pair in PAIRS:
+            if path == '/api/2/{}/ticker'.format(pair):
+                return 200, json.dumps({'ticker': TICKER})
+        return 404, '{}'
+
+    def batched_requests(self):
+        return [ path for path in self.server.requests if path == BATCHED ]
+
+    def single_requests(self):
+        return [ path for path in self.server.requests
+                 if path.startswith('/api/2/') ]
+
+    def refresh(self):
+        self.last.clear()
+        self.exchange.refreshTickers(PAIRS)
+        self.assertTrue(standin.wait_for(lambda: len(self.last) == len(PAIRS)))
+
+    def test_batched(self):
+        self.batched_answers.append(
+            (200, json.dumps(dict((pair, TICKER) for pair in PAIRS))))
+        self.refresh()
+        self.assertEqual(self.last, dict((pair, Decimal('101')) for pair in PAIRS))
+        self.assertEqual(len(self.batched_requests()), 1)
+        self.assertEqual(self.single_requests(), [])
+
+    def test_network_error_sends_batch_again(self):
+        self.batched_answers.append(None)
+        self.batched_answers.append(
+            (200, json.dumps(dict((pair, TICKER) for pair in PAIRS))))
+        self.refresh()
+        self.assertTrue(self.exchange._batch_tickers)
+        self.assertEqual(len(self.batched_requests()), 2)
+        self.assertEqual(self.single_requests(), [])
+
+    def test_network_errors_keep_batching(self):
+        for attempt in range(btce.BtceMultiTickerRequest.maximum_attempts):
+            self.batched_answers.append(None)
+        self.exchange.refreshTickers(PAIRS)
+        self.assertTrue(standin.wait_for(
+            lambda: len(self.batched_requests()) ==
+            btce.BtceMultiTickerRequest.maximum_attempts))
+        # no fallback requests follow the last failure
+        standin.spin(500)
+        self.assertTrue(self.exchange._batch_tickers)
+        self.assertEqual(self.single_requests(), [])
+
+        self.batched_answers.append(
+            (200, json.dumps(dict((pair, TICKER) for pair in PAIRS))))
+        self.refresh()
+        self.assertEqual(self.single_requests(), [])
+
+    def test_api_error_falls_back(self):
+        self.batched_answers.append(
+            (200, json.dumps({'success': 0, 'error': 'Invalid method'})))
+        self.refresh()
+        self.assertFalse(self.exchange._batch_tickers)
+        self.assertEqual(len(self.single_requests()), len(PAIRS))
+
+        self.refresh()
+        self.assertEqual(len(self.batched_requests()), 1)
+        self.assertEqual(len(self.single_requests()), 2 * len(PAIRS))
+
+    def test_other_api_error_sends_batch_again(self):
+        self.batched_answers.append(
+            (200, json.dumps({'success': 0, 'error': 'Requests too often'})))
+        self.batched_answers.append(
+            (200, json.dumps(dict((pair, TICKER) for pair in PAIRS))))
+        self.refresh()
+        self.assertTrue(self.exchange._batch_tickers)
+        self.assertEqual(len(self.batched_requests()), 2)
+        self.assertEqual(self.single_requests(), [])
+
+    def test_unreadable_reply_sends_batch_again(self):
+        self.batched_answers.append((200, '<html>maintenance</html>'))
+        self.batched_answers.append(
+            (200, json.dumps(dict((pair, TICKER) for pair in PAIRS))))
+        self.refresh()
+        self.assertTrue(self.exchange._batch_tickers)
+        self.assertEqual(len(self.batched_requests()), 2)
+        self.assertEqual(self.single_requests(), [])
+
+    def test_server_error_sends_batch_again(self):
+        self.batched_answers.append((503, 'Service Unavailable'))
+        self.batched_answers.append(
+            (200, json.dumps(dict((pair, TICKER) for pair in PAIRS))))
+        self.refresh()
+        self.assertTrue(self.exchange._batch_tickers)
+        self.assertEqual(self.single_requests(), [])
+
+    def test_missing_endpoint_falls_back(self):
+        self.batched_answers.append((404, 'Not Found'))
+        self.refresh()
+        self.assertFalse(self.exchange._batch_tickers)
+        self.assertEqual(len(self.single_requests()), len(PAIRS))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+# Dojima, a markets client.
+# Copyright (C) 2012-2013 Emery Hemingway
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from PyQt4 import QtCore
+
+import standin
+
+standin.get_application()
+
+import dojima.network
+
+
+class CachedRequest(dojima.network.ExchangeGETRequest):
+    cache_ttl = 60
+
+    def __init__(self, url, parent, log):
+        self.url = QtCore.QUrl(url)
+        self.log = log
+        super(CachedRequest, self).__init__(parent)
+
+    def _handle_reply(self, raw):
+        self.log.append((type(self), 'reply', raw))
+
+    def _handle_unchanged(self):
+        self.log.append((type(self), 'unchanged'))
+
+    def _handle_error(self, error):
+        self.log.append((type(self), 'error'))
+
+
+class OtherCachedRequest(CachedRequest):
+    pass
+
+
+class DiskCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.answers = list()
+        self.server = standin.HTTPStandIn(lambda path: self.answers.pop(0))
+        self.addCleanup(self.server.close)
+        self.network_manager = dojima.network.NetworkAccessManager()
+        self.cache = self.network_manager.disk_cache
+        self.exchange = standin.ExchangeStandIn(self.network_manager)
+        self.log = list()
+        # the cache directory is shared by the tests
+        self.url = self.server.url + self.id().rpartition('.')[2]
+
+    def fetch(self, url=None, request_class=CachedRequest):
+        count = len(self.log)
+        request_class(url or self.url, self.exchange, self.log)
+        self.assertTrue(standin.wait_for(lambda: len(self.log) > count))
+        return self.log[-1]
+
+    def test_cached_reply_is_unchanged(self):
+        self.answers.append((200, '{"last": 1}'))
+        self.assertEqual(self.fetch(), (CachedRequest, 'reply', '{"last": 1}'))
+        self.assertEqual(self.fetch(), (CachedRequest, 'unchanged'))
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_other_requester_gets_the_cached_reply(self):
+        self.answers.append((200, '{"last": 1}'))
+        self.fetch()
+        self.assertEqual(self.fetch(request_class=OtherCachedRequest),
+                         (OtherCachedRequest, 'reply', '{"last": 1}'))
+        self.assertEqual(self.fetch(request_class=OtherCachedRequest),
+                         (OtherCachedRequest, 'unchanged'))
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_state_is_kept_per_path(self):
+        for since in range(5):
+            self.answers.append((200, str(since)))
+            self.fetch('{}?since={}'.format(self.url, since))
+        self.assertEqual(len(self.cache.ttls), 1)
+        self.assertEqual(len(self.cache.handled), 1)
+
+    def test_no_store_is_respected(self):
+        self.answers.append((200, '1', {'Cache-Control': 'no-store'}))
+        self.answers.append((200, '2', {'Cache-Control': 'no-store'}))
+        self.assertEqual(self.fetch(), (CachedRequest, 'reply', '1'))
+        self.assertEqual(self.fetch(), (CachedRequest, 'reply', '2'))
+        self.assertEqual(len(self.server.requests), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
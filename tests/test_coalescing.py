@@ -0,0 +1,91 @@
+# Dojima, a markets client.
+# Copyright (C) 2012-2013 Emery Hemingway
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from PyQt4 import QtCore
+
+import standin
+
+standin.get_application()
+
+import dojima.network
+
+
+class LoggedRequest(dojima.network.ExchangeGETRequest):
+    cache_ttl = None
+    skip_unchanged = False
+
+    def __init__(self, url, parent, log):
+        self.url = QtCore.QUrl(url)
+        self.log = log
+        super(LoggedRequest, self).__init__(parent)
+
+    def _handle_reply(self, raw):
+        self.log.append((self, 'reply', raw))
+
+    def _handle_error(self, error):
+        self.log.append((self, 'error'))
+
+
+class CoalescingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.answers = list()
+        self.server = standin.HTTPStandIn(lambda path: self.answers.pop(0))
+        self.addCleanup(self.server.close)
+        self.exchange = standin.ExchangeStandIn(
+            dojima.network.NetworkAccessManager())
+        self.log = list()
+
+    def make_requests(self, count, path='ticker'):
+        return [ LoggedRequest(self.server.url + path, self.exchange, self.log)
+                 for i in range(count) ]
+
+    def test_followers_get_the_reply(self):
+        self.answers.append((200, '{"last": 1}'))
+        requests = self.make_requests(3)
+        self.assertTrue(standin.wait_for(lambda: len(self.log) == 3))
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(self.log, [ (request, 'reply', '{"last": 1}')
+                                     for request in requests ])
+        self.assertEqual(self.exchange.network_manager.coalescer.attached, 2)
+
+    def test_followers_get_the_error(self):
+        self.answers.append(None)
+        requests = self.make_requests(2)
+        self.assertTrue(standin.wait_for(lambda: len(self.log) == 2))
+        self.assertEqual(self.log, [ (request, 'error') for request in requests ])
+
+    def test_different_urls_are_not_coalesced(self):
+        self.answers.extend([(200, '1'), (200, '2')])
+        for path in ('a', 'b'):
+            LoggedRequest(self.server.url + path, self.exchange, self.log)
+        self.assertTrue(standin.wait_for(lambda: len(self.log) == 2))
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.exchange.network_manager.coalescer.attached, 0)
+
+    def test_later_request_is_sent_again(self):
+        self.answers.extend([(200, '1'), (200, '2')])
+        self.make_requests(1)
+        self.assertTrue(standin.wait_for(lambda: len(self.log) == 1))
+        self.make_requests(1)
+        self.assertTrue(standin.wait_for(lambda: len(self.log) == 2))
+        self.assertEqual([ entry[2] for entry in self.log ], ['1', '2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
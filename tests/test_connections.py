@@ -0,0 +1,111 @@
+# Dojima, a markets client.
+# Copyright (C) 2012-2013 Emery Hemingway
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+import unittest
+
+import standin
+
+standin.get_application()
+
+import dojima.network
+import dojima.network.metrics
+
+
+class ConnectionReuseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.hostname = self.id()
+        self.host_queue = dojima.network.HostRequestQueue(
+            10, hostname=self.hostname)
+
+    def stats(self):
+        return dojima.network.metrics.get_connection_stats()[self.hostname]
+
+    def test_first_request_opens_a_connection(self):
+        self.assertFalse(self.host_queue.begin_request())
+        self.assertEqual(self.stats()['opened'], 1)
+
+    def test_sequential_requests_reuse_the_connection(self):
+        for i in range(3):
+            self.host_queue.begin_request()
+            self.host_queue.end_request()
+        self.assertEqual(self.stats(), {'opened': 1, 'reused': 2,
+                                        'reuse_ratio': 2 / 3})
+
+    def test_concurrent_requests_open_connections(self):
+        results = [ self.host_queue.begin_request() for i in range(3) ]
+        self.assertEqual(results, [False, False, False])
+        self.assertEqual(self.host_queue.connections, 3)
+
+    def test_connections_are_limited(self):
+        count = dojima.network.MAXIMUM_CONNECTIONS + 2
+        results = [ self.host_queue.begin_request() for i in range(count) ]
+        self.assertEqual(results.count(False), dojima.network.MAXIMUM_CONNECTIONS)
+        self.assertEqual(self.host_queue.connections,
+                         dojima.network.MAXIMUM_CONNECTIONS)
+
+    def test_idle_connections_are_closed(self):
+        self.host_queue.begin_request()
+        self.host_queue.end_request()
+        self.host_queue.last_active -= dojima.network.CONNECTION_TIMEOUT + 1
+        self.assertFalse(self.host_queue.begin_request())
+        self.assertEqual(self.stats()['opened'], 2)
+
+    def test_idle(self):
+        self.assertEqual(self.host_queue.idle(), 0)
+        self.host_queue.begin_request()
+        self.assertEqual(self.host_queue.idle(), 0)
+        self.host_queue.end_request()
+        self.host_queue.last_active -= 5
+        self.assertGreaterEqual(self.host_queue.idle(), 5)
+
+
+class WarmUpTest(unittest.TestCase):
+
+    def setUp(self):
+        self.network_manager = dojima.network.NetworkAccessManager()
+        self.hostname = 'localhost'
+
+    def test_warm_hosts_are_counted(self):
+        self.network_manager.warm_up(self.hostname)
+        self.network_manager.warm_up(self.hostname)
+        self.assertTrue(self.network_manager.keep_alive_timer.isActive())
+        self.network_manager.cool_down(self.hostname)
+        self.assertTrue(self.network_manager.keep_alive_timer.isActive())
+        self.network_manager.cool_down(self.hostname)
+        self.assertFalse(self.network_manager.keep_alive_timer.isActive())
+        # more cooling than warming is ignored
+        self.network_manager.cool_down(self.hostname)
+
+    def test_idle_warm_host_is_kept_alive(self):
+        host_queue = self.network_manager.get_host_request_queue(
+            self.hostname, 10)
+        self.network_manager.warm_up(self.hostname)
+        self.addCleanup(self.network_manager.cool_down, self.hostname)
+        standin.wait_for(lambda: not host_queue.in_flight)
+        self.assertEqual(host_queue.in_flight, 0)
+
+        self.network_manager._keep_alive()
+        self.assertEqual(host_queue.in_flight, 0)
+
+        host_queue.last_active = time.monotonic() - dojima.network.KEEP_ALIVE_IDLE - 1
+        self.network_manager._keep_alive()
+        self.assertEqual(host_queue.in_flight, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+# Dojima, a markets client.
+# Copyright (C) 2012-2013 Emery Hemingway
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+import numpy as np
+from PyQt4 import QtCore
+
+import standin
+standin.get_application()
+
+import dojima.data.book
+import dojima.data.market
+
+
+class Exchange(QtCore.QObject):
+
+    def __init__(self, scale=1):
+        super(Exchange, self).__init__()
+        self.scale = scale
+        self.depth_proxies = dict()
+
+    def getDepthProxy(self, remote_market_id):
+        if remote_market_id not in self.depth_proxies:
+            self.depth_proxies[remote_market_id] = dojima.data.market.DepthProxy(
+                remote_market_id, self)
+        return self.depth_proxies[remote_market_id]
+
+    def getScale(self, remote_market_id):
+        return self.scale
+
+    def refreshDepth(self, remote_market_id):
+        pass
+
+
+class ExchangeProxy(object):
+
+    def __init__(self, pair, exchange=None):
+        self.pair = pair
+        self.exchange_object = exchange
+
+    def getRemoteMarketIDs(self, pair):
+        if pair == self.pair:
+            return [pair]
+        return []
+
+
+class MarketProxy(list):
+
+    def __init__(self, pair, exchange_proxies):
+        super(MarketProxy, self).__init__(exchange_proxies)
+        self.pair = pair
+
+
+def levels(*pairs):
+    return np.array(pairs, dtype=np.float64).T
+
+
+class ConsolidatedBookTest(unittest.TestCase):
+
+    def setUp(self):
+        self.plain = Exchange()
+        self.scaled = Exchange(scale=100)
+        self.inverse = Exchange()
+        self.closed = ExchangeProxy('btc_usd')
+        self.market = MarketProxy('btc_usd',
+                                  [ExchangeProxy('btc_usd', self.plain),
+                                   ExchangeProxy('btc_usd', self.scaled),
+                                   self.closed])
+        self.inverse_market = MarketProxy('usd_btc',
+                                          [ExchangeProxy('usd_btc', self.inverse)])
+
+    def test_starts_from_snapshots(self):
+        book = self.plain.getDepthProxy('btc_usd').book
+        book.replace('asks', levels((101, 1), (102, 2)))
+        book.replace('bids', levels((99, 3)))
+
+        consolidated = dojima.data.book.ConsolidatedBook(self.market)
+        self.assertEqual(consolidated.best_ask, 101)
+        self.assertEqual(consolidated.best_bid, 99)
+        self.assertEqual(consolidated.last_asks[dojima.data.book.PRICE].tolist(),
+                         [101, 102])
+
+    def test_best_across_venues(self):
+        consolidated = dojima.data.book.ConsolidatedBook(self.market)
+        best_asks = list()
+        consolidated.ask_signal.connect(best_asks.append)
+
+        self.plain.getDepthProxy('btc_usd').book.replace(
+            'asks', levels((101, 1), (103, 1)))
+        # integer prices at a scale of 100
+        self.scaled.getDepthProxy('btc_usd').book.replace(
+            'asks', levels((10050, 2)))
+        self.scaled.getDepthProxy('btc_usd').book.replace(
+            'bids', levels((9950, 1)))
+
+        self.assertEqual(best_asks, [101, 100.5])
+        self.assertEqual(consolidated.best_bid, 99.5)
+        asks = consolidated.last_asks
+        self.assertEqual(asks[dojima.data.book.PRICE].tolist(), [100.5, 101, 103])
+        self.assertEqual(asks[dojima.data.book.VENUE].tolist(), [1, 0, 0])
+
+        self.scaled.getDepthProxy('btc_usd').book.apply(
+            'asks', levels((10050, 0)))
+        self.assertEqual(best_asks, [101, 100.5, 101])
+
+    def test_inverted_venue(self):
+        consolidated = dojima.data.book.ConsolidatedBook(self.market,
+                                                         self.inverse_market)
+        # bids for dollars in bitcoins are asks for bitcoins in dollars
+        self.inverse.getDepthProxy('usd_btc').book.replace(
+            'bids', levels((0.01, 200)))
+        self.assertAlmostEqual(consolidated.best_ask, 100)
+        self.assertAlmostEqual(consolidated.last_asks[dojima.data.book.AMOUNT, 0], 2)
+        self.assertIsNone(consolidated.best_bid)
+
+    def test_attach_does_not_make_exchanges(self):
+        consolidated = dojima.data.book.ConsolidatedBook(self.market)
+        self.assertEqual(len(consolidated.venues), 2)
+
+        later = Exchange()
+        later.getDepthProxy('btc_usd').book.replace('bids', levels((100, 1)))
+        self.closed.exchange_object = later
+        consolidated.attach()
+        self.assertEqual(len(consolidated.venues), 3)
+        self.assertEqual(consolidated.best_bid, 100)
+        consolidated.attach()
+        self.assertEqual(len(consolidated.venues), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
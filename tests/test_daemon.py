@@ -0,0 +1,173 @@
+# Dojima, a markets client.
+# Copyright (C) 2012-2013 Emery Hemingway
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+import unittest
+from decimal import Decimal
+
+import numpy as np
+from PyQt4 import QtCore, QtNetwork
+
+import standin
+standin.get_application()
+
+import dojima.daemon
+import dojima.data.market
+import dojima.data.ticks
+
+
+class Exchange(QtCore.QObject):
+
+    def __init__(self):
+        super(Exchange, self).__init__()
+        self.ticker_proxy = dojima.data.market.TickerProxyDecimal(self)
+        self.depth_proxy = dojima.data.market.DepthProxy('btc_usd', self)
+        self.trades_proxy = dojima.data.market.TradesProxy('btc_usd', self)
+        self.streams = set()
+
+    def getTickerProxy(self, remote_market_id):
+        return self.ticker_proxy
+
+    def getDepthProxy(self, remote_market_id):
+        return self.depth_proxy
+
+    def getTradesProxy(self, remote_market_id):
+        return self.trades_proxy
+
+    def setTickerStreamState(self, state, remote_market_id=None):
+        self.setStreamState('ticker', state, remote_market_id)
+
+    def setStreamState(self, stream, state, remote_market_id=None):
+        if state:
+            self.streams.add(stream)
+        else:
+            self.streams.discard(stream)
+
+
+class ExchangeProxy(object):
+    id = 'standin'
+
+    def __init__(self, exchange):
+        self.exchange = exchange
+
+    def getExchangeObject(self):
+        return self.exchange
+
+
+class Client(object):
+    """Reads the lines of JSON a Publisher writes."""
+
+    def __init__(self, server_name):
+        self.socket = QtNetwork.QLocalSocket()
+        self.buffer = bytearray()
+        self.messages = list()
+        self.socket.readyRead.connect(self._read)
+        self.socket.connectToServer(server_name)
+
+    def _read(self):
+        self.buffer.extend(self.socket.readAll().data())
+        while b'\n' in self.buffer:
+            line, _, rest = bytes(self.buffer).partition(b'\n')
+            self.buffer[:] = rest
+            self.messages.append(json.loads(line.decode()))
+
+    def wait(self, count):
+        return standin.wait_for(lambda: len(self.messages) >= count)
+
+
+class DaemonTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server_name = 'dojima-test-{}-{}'.format(os.getpid(), id(self))
+        self.publisher = dojima.daemon.Publisher(self.server_name)
+        self.addCleanup(self.publisher.server.close)
+
+    def connect(self):
+        client = Client(self.server_name)
+        self.addCleanup(client.socket.abort)
+        self.assertTrue(standin.wait_for(lambda: self.publisher.clients))
+        return client
+
+    def test_publish_lines(self):
+        first = self.connect()
+        second = self.connect()
+        self.assertTrue(standin.wait_for(lambda: len(self.publisher.clients) == 2))
+        self.publisher.publish({'stream': 'ticker', 'last': '1.5'})
+        self.publisher.publish({'stream': 'ticker', 'last': '2'})
+        for client in (first, second):
+            self.assertTrue(client.wait(2))
+            self.assertEqual(client.messages, [{'stream': 'ticker', 'last': '1.5'},
+                                               {'stream': 'ticker', 'last': '2'}])
+            self.assertEqual(client.buffer, b'')
+
+    def test_client_dropped(self):
+        client = self.connect()
+        client.socket.disconnectFromServer()
+        self.assertTrue(standin.wait_for(lambda: not self.publisher.clients))
+        # nothing is written for a client that is gone
+        self.publisher.publish({'stream': 'ticker'})
+
+    def test_collector(self):
+        exchange = Exchange()
+        collector = dojima.daemon.Collector(self.publisher)
+        collector.addMarket(ExchangeProxy(exchange), 'btc_usd')
+        self.assertEqual(exchange.streams, set(('ticker', 'depth', 'trades')))
+        # market data is only kept on disk when asked for
+        self.assertNotIn(('standin', 'btc_usd'), dojima.data.ticks.recorders)
+
+        exchange.ticker_proxy.last_signal.emit(Decimal('101.5'))
+        exchange.depth_proxy.processAsks(np.array([[102.0, 101.0], [1.0, 2.0]]))
+
+        # a client is greeted with the state of each market
+        client = self.connect()
+        self.assertTrue(client.wait(2))
+        ticker, depth = client.messages
+        self.assertEqual(ticker, {'exchange': 'standin', 'market': 'btc_usd',
+                                  'stream': 'ticker', 'last': '101.5'})
+        self.assertTrue(depth['snapshot'])
+        self.assertEqual(depth['seq'], 1)
+        self.assertEqual(depth['asks'], [[101, 2], [102, 1]])
+
+        exchange.depth_proxy.processDiff(np.array([[101.0], [0.0]]),
+                                         np.empty((2, 0)))
+        exchange.trades_proxy.processTrades([(7, 1370000001, 101.5, 0.5),
+                                             (6, 1370000000, 101.0, 0.25)])
+        self.assertTrue(client.wait(4))
+        depth, trades = client.messages[2:]
+        self.assertEqual((depth['seq'], depth['side'], depth['levels']),
+                         (2, 'asks', [[101, 0]]))
+        # trades are sent oldest first with epochs
+        self.assertEqual(len(trades['trades']), 2)
+        self.assertEqual(trades['trades'][0][3], 6)
+        self.assertAlmostEqual(trades['trades'][0][0], 1370000000, places=3)
+        self.assertAlmostEqual(trades['trades'][1][0], 1370000001, places=3)
+
+
+class DatesTest(unittest.TestCase):
+
+    def test_matplotlib_dates(self):
+        # the first day of 1970 in the dates of matplotlib
+        self.assertEqual(dojima.data.market.epoch2num(0), 719163)
+        self.assertEqual(dojima.data.market.epoch2num(86400 * 2), 719165)
+        epochs = np.array([0, 1370000000.5])
+        self.assertTrue(np.allclose(
+            dojima.data.market.num2epoch(dojima.data.market.epoch2num(epochs)),
+            epochs))
+
+
+if __name__ == '__main__':
+    unittest.main()
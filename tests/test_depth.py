@@ -0,0 +1,66 @@
+# Dojima, a markets client.
+# Copyright (C) 2012-2013 Emery Hemingway
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+import dojima.network.depth
+
+
+def parse(chunks, entry=dojima.network.depth.PAIR):
+    parser = dojima.network.depth.DepthParser('test', entry)
+    for chunk in chunks:
+        parser.feed(chunk)
+    return parser.finish()
+
+
+class DepthParserTest(unittest.TestCase):
+
+    def test_pairs_split_over_chunks(self):
+        depth = parse([b'{"asks":[[101.5,0.5],[10', b'2,1.25]],"bi',
+                       b'ds":[["100","2"]]}'])
+        self.assertEqual(depth['asks'].tolist(), [[101.5, 102], [0.5, 1.25]])
+        self.assertEqual(depth['bids'].tolist(), [[100], [2]])
+
+    def test_objects(self):
+        depth = parse([b'{"data":{"asks":[{"price":101.5,"amount":0.5,'
+                       b'"stamp":"1"}],"bids":[]}}'],
+                      dojima.network.depth.OBJECT)
+        self.assertEqual(depth['asks'].tolist(), [[101.5], [0.5]])
+        self.assertEqual(depth['bids'].shape, (2, 0))
+
+    def test_empty_sides(self):
+        depth = parse([b'{"asks":[],"bids":[]}'])
+        self.assertEqual(depth['asks'].shape, (2, 0))
+        self.assertEqual(depth['bids'].shape, (2, 0))
+
+    def test_error_body(self):
+        # BTC-e sends errors with a 200 status
+        with self.assertRaises(ValueError) as context:
+            parse([b'{"success":0,', b'"error":"invalid pair"}'])
+        self.assertIn('invalid pair', str(context.exception))
+
+    def test_error_object(self):
+        with self.assertRaises(ValueError):
+            parse([b'{"result":"error","error":"Too many requests"}'],
+                  dojima.network.depth.OBJECT)
+
+    def test_truncated(self):
+        with self.assertRaises(ValueError):
+            parse([b'{"asks":[[101.5,0.5]'])
+
+
+if __name__ == '__main__':
+    unittest.main()
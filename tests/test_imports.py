@@ -0,0 +1,44 @@
+# Dojima, a markets client.
+# Copyright (C) 2012-2013 Emery Hemingway
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os.path
+import subprocess
+import sys
+import unittest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# print the heavy modules that importing the main window left loaded
+CHECK = """
+import sys
+import dojima.ui.mainwindow
+print(' '.join(name for name in sys.modules
+               if name.split('.')[0] in ('numpy', 'matplotlib')))
+"""
+
+
+class StartupImportTest(unittest.TestCase):
+
+    def test_mainwindow_leaves_out_numpy_and_matplotlib(self):
+        # a fresh interpreter, as other tests may have loaded them
+        output = subprocess.check_output([sys.executable, '-c', CHECK],
+                                         cwd=ROOT)
+        self.assertEqual(output.decode().split(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+# Dojima, a markets client.
+# Copyright (C) 2012-2013 Emery Hemingway
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import os.path
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import standin
+
+standin.get_application()
+
+import dojima.network.nonce
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# take count nonces from the file given and print them
+TAKE = """
+import sys
+import dojima.network.nonce
+sequencer = dojima.network.nonce.NonceSequencer(sys.argv[1], block=7)
+print(' '.join(str(sequencer.next()) for i in range(int(sys.argv[2]))))
+"""
+
+
+class NonceSequencerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.filename = os.path.join(tempfile.mkdtemp(), 'nonces', 'key')
+
+    def sequencer(self, block=10):
+        return dojima.network.nonce.NonceSequencer(self.filename, block)
+
+    def stored(self):
+        with open(self.filename) as f:
+            return int(f.read())
+
+    def assertIncreasing(self, nonces):
+        self.assertEqual(nonces, sorted(set(nonces)))
+
+    def test_increasing(self):
+        sequencer = self.sequencer()
+        self.assertIncreasing([ sequencer.next() for i in range(35) ])
+
+    def test_block_is_written_once(self):
+        sequencer = self.sequencer()
+        first = sequencer.next()
+        self.assertEqual(self.stored(), first + 9)
+        stamp = os.stat(self.filename).st_mtime_ns
+        for i in range(9):
+            sequencer.next()
+        self.assertEqual(os.stat(self.filename).st_mtime_ns, stamp)
+        self.assertEqual(sequencer.next(), first + 10)
+        self.assertEqual(self.stored(), first + 19)
+
+    def test_restart_continues_above_the_block(self):
+        first = self.sequencer()
+        taken = first.next()
+        self.assertGreater(self.sequencer().next(), taken + 9)
+
+    def test_interleaved_sequencers(self):
+        sequencers = (self.sequencer(), self.sequencer())
+        nonces = [ sequencers[i % 3 == 0].next() for i in range(40) ]
+        self.assertIncreasing(nonces)
+
+    def test_advance(self):
+        sequencer = self.sequencer()
+        nonce = sequencer.next()
+        sequencer.advance(nonce + 1000)
+        self.assertEqual(sequencer.next(), nonce + 1001)
+        self.assertGreaterEqual(self.stored(), nonce + 1001)
+
+    def test_processes(self):
+        def take(count):
+            return subprocess.Popen(
+                [sys.executable, '-c', TAKE, self.filename, str(count)],
+                cwd=ROOT, stdout=subprocess.PIPE)
+
+        # processes running together take nonces of their own
+        processes = [ take(50) for i in range(3) ]
+        taken = list()
+        for process in processes:
+            output, error = process.communicate()
+            nonces = [ int(nonce) for nonce in output.split() ]
+            self.assertEqual(len(nonces), 50)
+            self.assertIncreasing(nonces)
+            taken.extend(nonces)
+        self.assertEqual(len(set(taken)), len(taken))
+
+        # and a later process carries on above them
+        output, error = take(1).communicate()
+        self.assertGreater(int(output), max(taken))
+
+    def test_no_sequencer_without_a_key(self):
+        self.assertIsNone(dojima.network.nonce.get_sequencer('test', None))
+        self.assertIsNone(dojima.network.nonce.get_sequencer('test', ''))
+
+
+if __name__ == '__main__':
+    unittest.main()
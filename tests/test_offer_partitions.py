@@ -0,0 +1,83 @@
+# Dojima, a markets client.
+# Copyright (C) 2012-2013 Emery Hemingway
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+import standin
+standin.get_application()
+
+from dojima.data.offers import (Model, FilterAsksModel, FilterBidsModel,
+                                ASK, BID, ID)
+
+
+def shown(proxy):
+    return [ proxy.sourceModel().columns[ID][row] for row in proxy.source_rows ]
+
+
+class OfferPartitionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.model = Model()
+        self.model.setOffers([('1', 100, 1, ASK, 'btc', 'usd'),
+                              ('2', 99, 2, BID, 'btc', 'usd'),
+                              ('3', 0.1, 3, ASK, 'ltc', 'btc'),
+                              ('4', 101, 3, ASK, 'btc', 'usd')])
+        self.asks = FilterAsksModel(self.model, 'btc', 'usd')
+        self.bids = FilterBidsModel(self.model, 'btc', 'usd')
+        self.all_asks = FilterAsksModel(self.model)
+
+    def test_partitions(self):
+        self.assertEqual(shown(self.asks), ['1', '4'])
+        self.assertEqual(shown(self.bids), ['2'])
+        self.assertEqual(shown(self.all_asks), ['1', '3', '4'])
+
+    def test_mapping(self):
+        index = self.asks.index(1, ID)
+        source = self.asks.mapToSource(index)
+        self.assertEqual(source.row(), 3)
+        self.assertEqual(self.asks.mapFromSource(source).row(), 1)
+        # a bid is not shown by the asks
+        self.assertFalse(self.asks.mapFromSource(self.model.index(1, ID)).isValid())
+        self.assertFalse(self.asks.index(2, ID).isValid())
+
+    def test_rows_follow_source(self):
+        inserted = list()
+        self.asks.rowsInserted.connect(
+            lambda parent, first, last: inserted.append((first, last)))
+        self.model.setOffers([('2', 99, 2, BID, 'btc', 'usd'),
+                              ('4', 101, 3, ASK, 'btc', 'usd'),
+                              ('5', 102, 1, ASK, 'btc', 'usd'),
+                              ('6', 98, 1, BID, 'btc', 'usd')])
+        self.assertEqual(shown(self.asks), ['4', '5'])
+        self.assertEqual(shown(self.bids), ['2', '6'])
+        self.assertEqual(shown(self.all_asks), ['4', '5'])
+        self.assertEqual(self.asks.source_rows, [1, 2])
+        self.assertEqual(inserted, [(1, 1)])
+
+    def test_changed_side(self):
+        # an offer whose row now holds the other side moves across
+        self.model.addOffer('1', 100, 1, BID, 'btc', 'usd')
+        self.assertEqual(shown(self.asks), ['4'])
+        self.assertEqual(shown(self.bids), ['1', '2'])
+
+    def test_reset(self):
+        self.model.clear()
+        self.assertEqual(self.asks.rowCount(), 0)
+        self.assertEqual(self.bids.rowCount(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
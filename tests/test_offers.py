@@ -0,0 +1,99 @@
+# Dojima, a markets client.
+# Copyright (C) 2012-2013 Emery Hemingway
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+import standin
+standin.get_application()
+
+from dojima.data.offers import Model, ASK, BID, ID, PRICE, OUTSTANDING
+
+
+class OffersModelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.model = Model()
+        self.events = list()
+        self.model.rowsInserted.connect(
+            lambda parent, first, last: self.events.append(('insert', first, last)))
+        self.model.rowsRemoved.connect(
+            lambda parent, first, last: self.events.append(('remove', first, last)))
+        self.model.dataChanged.connect(
+            lambda top_left, bottom_right: self.events.append(
+                ('change', top_left.row(), top_left.column(),
+                 bottom_right.column())))
+        self.model.modelReset.connect(lambda: self.events.append(('reset',)))
+
+        self.model.setOffers([('1', 100, 1, ASK, 'btc', 'usd'),
+                              ('2', 99, 2, BID, 'btc', 'usd'),
+                              ('3', 101, 3, ASK, 'btc', 'usd')])
+        del self.events[:]
+
+    def test_rows_indexed_by_id(self):
+        self.assertEqual(self.model.rowCount(), 3)
+        self.assertEqual(self.model.findRow('3'), 2)
+        self.assertEqual(self.model.getOffer('2'),
+                         ('2', 99, 2, BID, 'btc', 'usd'))
+        self.assertIsNone(self.model.getOffer('4'))
+
+    def test_unchanged_refresh_emits_nothing(self):
+        self.model.setOffers([('1', 100, 1, ASK, 'btc', 'usd'),
+                              ('2', 99, 2, BID, 'btc', 'usd'),
+                              ('3', 101, 3, ASK, 'btc', 'usd')])
+        self.assertEqual(self.events, [])
+
+    def test_refresh_applies_differences(self):
+        self.model.setOffers([('3', 101, 2.5, ASK, 'btc', 'usd'),
+                              ('1', 100, 1, ASK, 'btc', 'usd'),
+                              ('4', 98, 1, BID, 'btc', 'usd')])
+        self.assertEqual(self.events,
+                         [('remove', 1, 1),
+                          ('change', 1, OUTSTANDING, OUTSTANDING),
+                          ('insert', 2, 2)])
+        self.assertEqual(self.model.columns[ID], ['1', '3', '4'])
+        self.assertEqual(self.model.rows, {'1': 0, '3': 1, '4': 2})
+
+    def test_update_by_id(self):
+        self.model.addOffer('2', 99.5, 2, BID, 'btc', 'usd')
+        self.assertEqual(self.events, [('change', 1, PRICE, PRICE)])
+        self.assertEqual(self.model.rowCount(), 3)
+
+    def test_remove_reindexes(self):
+        self.assertTrue(self.model.removeOffer('1'))
+        self.assertFalse(self.model.removeOffer('1'))
+        self.assertEqual(self.model.rows, {'2': 0, '3': 1})
+
+    def test_offers_without_ids(self):
+        # offers placed but not yet acknowledged have no id
+        self.model.addOffer(None, 102, 1, ASK)
+        self.model.addOffer(None, 103, 1, ASK)
+        self.assertEqual(self.model.rowCount(), 5)
+        self.assertNotIn(None, self.model.rows)
+        # a refresh replaces them with the offers the exchange knows
+        self.model.setOffers([('1', 100, 1, ASK, 'btc', 'usd'),
+                              ('2', 99, 2, BID, 'btc', 'usd'),
+                              ('3', 101, 3, ASK, 'btc', 'usd')])
+        self.assertEqual(self.model.rowCount(), 3)
+
+    def test_clear(self):
+        self.model.clear()
+        self.assertEqual(self.events, [('reset',)])
+        self.assertEqual(self.model.rowCount(), 0)
+        self.assertIsNone(self.model.findRow('1'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+# Dojima, a markets client.
+# Copyright (C) 2012-2013 Emery Hemingway
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+import numpy as np
+
+import standin
+standin.get_application()
+
+import dojima.data.book
+import dojima.data.market
+
+
+def levels(*pairs):
+    return np.array(pairs, dtype=np.float64).reshape(-1, 2).T
+
+
+class OrderBookTest(unittest.TestCase):
+
+    def setUp(self):
+        self.book = dojima.data.book.OrderBook()
+        self.changes = list()
+        self.book.changed.connect(
+            lambda sequence, side, diff: self.changes.append(
+                (sequence, side, diff.T.tolist())))
+
+    def test_replace_reports_changes(self):
+        self.book.replace('asks', levels((102, 1), (101, 2), (101, 1)))
+        self.assertEqual(self.book.asks.T.tolist(), [[101, 3], [102, 1]])
+
+        diff = self.book.replace('asks', levels((101, 3), (103, 1)))
+        self.assertEqual(diff.T.tolist(), [[102, 0], [103, 1]])
+        self.assertEqual(self.changes[-1], (2, 'asks', [[102, 0], [103, 1]]))
+
+        # an unchanged snapshot emits nothing
+        self.book.replace('asks', levels((101, 3), (103, 1)))
+        self.assertEqual(len(self.changes), 2)
+
+    def test_replace_top(self):
+        self.book.replace('bids', levels((100, 1), (99.75, 1), (99, 1)))
+        # only levels as good as the worst of the top are replaced
+        self.book.replace('bids', levels((100, 2), (99.5, 1)), top=True)
+        self.assertEqual(self.book.bids.T.tolist(),
+                         [[100, 2], [99.5, 1], [99, 1]])
+
+    def test_apply_diff(self):
+        self.book.replace('bids', levels((100, 1), (99, 1)))
+        self.book.apply('bids', levels((99, 0), (100.5, 2), (100, 3)))
+        self.assertEqual(self.book.bids.T.tolist(), [[100.5, 2], [100, 3]])
+        self.assertEqual(self.changes[-1][:2], (2, 'bids'))
+
+        sequence, asks, bids = self.book.snapshot()
+        self.assertEqual(sequence, 2)
+        self.assertEqual(asks.shape, (2, 0))
+
+    def test_apply_empty_diff(self):
+        self.book.apply('asks', levels())
+        self.assertEqual(self.changes, [])
+
+
+class DepthProxyTest(unittest.TestCase):
+
+    def test_cumulative_depth(self):
+        proxy = dojima.data.market.DepthProxy('btc_usd')
+        emitted = list()
+        proxy.asks.connect(lambda asks: emitted.append(asks.tolist()))
+        proxy.processAsks(levels((101, 1), (102, 2), (103, 3), (200, 1)))
+        # offers far from the best are left out and the first step is empty
+        self.assertEqual(emitted[-1], [[101, 102, 103], [0, 3, 6]])
+
+        proxy.processDiff(levels((102, 0)), levels())
+        self.assertEqual(emitted[-1], [[101, 103], [0, 4]])
+        # the book itself keeps plain amounts
+        self.assertEqual(proxy.book.asks[1].tolist(), [1, 3, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
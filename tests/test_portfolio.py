@@ -0,0 +1,141 @@
+# Dojima, a markets client.
+# Copyright (C) 2012-2013 Emery Hemingway
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+from decimal import Decimal
+
+from PyQt4 import QtCore
+
+import standin
+standin.get_application()
+
+import dojima.data.balance
+import dojima.data.market
+import dojima.data.portfolio
+
+
+class Exchange(QtCore.QObject):
+    valueType = Decimal
+
+    def __init__(self):
+        super(Exchange, self).__init__()
+        self.balance_proxies = dict()
+        self.ticker_proxies = dict()
+
+    def _getBalanceProxy(self, commodity):
+        if commodity not in self.balance_proxies:
+            self.balance_proxies[commodity] = dojima.data.balance.BalanceProxyDecimal(self)
+        return self.balance_proxies[commodity]
+
+    def getBalanceBaseProxy(self, remote_market_id):
+        return self._getBalanceProxy(remote_market_id.split('_')[0])
+
+    def getBalanceCounterProxy(self, remote_market_id):
+        return self._getBalanceProxy(remote_market_id.split('_')[1])
+
+    def getTickerProxy(self, remote_market_id):
+        if remote_market_id not in self.ticker_proxies:
+            self.ticker_proxies[remote_market_id] = dojima.data.market.TickerProxyDecimal(self)
+        return self.ticker_proxies[remote_market_id]
+
+    def setBalance(self, commodity, total, liquid=None):
+        proxy = self._getBalanceProxy(commodity)
+        proxy.balance_total.emit(Decimal(total))
+        proxy.balance_liquid.emit(Decimal(total if liquid is None else liquid))
+
+    def setLast(self, remote_market_id, price):
+        self.getTickerProxy(remote_market_id).last_signal.emit(Decimal(price))
+
+
+class PortfolioTest(unittest.TestCase):
+
+    def setUp(self):
+        self.portfolio = dojima.data.portfolio.Portfolio('usd')
+        self.totals = list()
+        self.portfolio.total_signal.connect(self.totals.append)
+        self.unpriced = list()
+        self.portfolio.unpriced_signal.connect(self.unpriced.append)
+        self.exchange = Exchange()
+        self.other = Exchange()
+
+    def test_direct_market(self):
+        self.portfolio.addMarket('x', self.exchange, 'btc_usd', 'btc', 'usd')
+        self.exchange.setBalance('btc', 2, 1.5)
+        self.exchange.setBalance('usd', 100)
+        self.assertEqual(self.portfolio.getTotals(), (100, 100))
+        self.assertEqual(self.unpriced[-1], ['btc'])
+
+        self.exchange.setLast('btc_usd', 50)
+        self.assertEqual(self.portfolio.getTotals(), (200, 175))
+        self.assertEqual(self.unpriced[-1], [])
+
+        self.exchange.getBalanceBaseProxy('btc_usd').balance_total_changed.emit(
+            Decimal(-1))
+        self.assertEqual(self.totals[-1], 150)
+
+    def test_inverse_market(self):
+        self.portfolio.addMarket('x', self.exchange, 'usd_eur', 'usd', 'eur')
+        self.exchange.setBalance('eur', 10)
+        self.exchange.setLast('usd_eur', 0.8)
+        self.assertEqual(self.portfolio.getTotals(), (12.5, 12.5))
+
+    def test_intermediate_market(self):
+        # litecoins only trade against bitcoins, which trade against dollars
+        self.portfolio.addMarket('x', self.exchange, 'ltc_btc', 'ltc', 'btc')
+        self.portfolio.addMarket('y', self.other, 'btc_usd', 'btc', 'usd')
+        self.exchange.setBalance('ltc', 10)
+        self.exchange.setLast('ltc_btc', 0.02)
+        self.assertEqual(self.portfolio.getTotals(), (0, 0))
+        self.assertEqual(self.unpriced[-1], ['ltc'])
+
+        self.other.setLast('btc_usd', 100)
+        self.assertAlmostEqual(self.portfolio.getTotals()[0], 20)
+        self.assertEqual(self.unpriced[-1], [])
+
+    def test_reference(self):
+        self.portfolio.addMarket('x', self.exchange, 'btc_usd', 'btc', 'usd')
+        self.exchange.setBalance('btc', 1)
+        self.exchange.setBalance('usd', 100)
+        self.exchange.setLast('btc_usd', 50)
+        self.portfolio.setReference('btc')
+        self.assertEqual(self.portfolio.getTotals(), (3, 3))
+        self.assertEqual(QtCore.QSettings().value('portfolio/reference'), 'btc')
+
+    def test_remove_market(self):
+        self.portfolio.addMarket('x', self.exchange, 'btc_usd', 'btc', 'usd')
+        self.portfolio.addMarket('x', self.exchange, 'btc_eur', 'btc', 'eur')
+        self.exchange.setBalance('btc', 1)
+        self.exchange.setBalance('usd', 10)
+        self.exchange.setLast('btc_usd', 50)
+        self.assertEqual(self.portfolio.getTotals(), (60, 60))
+
+        # the bitcoin balance is still held through the other market
+        self.portfolio.removeMarket('x', 'btc_usd')
+        self.assertEqual(self.portfolio.getTotals(), (0, 0))
+        self.assertEqual(self.unpriced[-1], ['btc'])
+        self.exchange.setBalance('btc', 2)
+        self.assertEqual(self.portfolio.balances[('x', 'btc')], [2, 2])
+        self.assertNotIn(('x', 'usd'), self.portfolio.balances)
+
+        self.portfolio.removeMarket('x', 'btc_eur')
+        self.exchange.setBalance('btc', 3)
+        self.exchange.setLast('btc_usd', 60)
+        self.assertEqual(self.portfolio.balances, {})
+        self.assertEqual(self.portfolio.getTotals(), (0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
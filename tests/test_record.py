@@ -0,0 +1,109 @@
+# Dojima, a markets client.
+# Copyright (C) 2012-2013 Emery Hemingway
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os.path
+import tempfile
+import unittest
+
+from PyQt4 import QtCore
+
+import standin
+
+standin.get_application()
+
+import dojima.network
+import dojima.network.record
+import dojima.network.replay
+
+
+class LoggedRequest(dojima.network.ExchangeGETRequest):
+    cache_ttl = None
+    skip_unchanged = False
+
+    def __init__(self, url, parent, log):
+        self.url = QtCore.QUrl(url)
+        self.log = log
+        super(LoggedRequest, self).__init__(parent)
+
+    def _handle_reply(self, raw):
+        self.log.append(raw)
+
+    def _handle_error(self, error):
+        self.log.append(None)
+
+
+class StripBodyTest(unittest.TestCase):
+
+    def test_signed_parameters_are_left_out(self):
+        body = b'nonce=5&method=getInfo&key=abc&pair=btc_usd'
+        self.assertEqual(dojima.network.record.strip_body(body),
+                         'method=getInfo&pair=btc_usd')
+
+    def test_no_body(self):
+        self.assertEqual(dojima.network.record.strip_body(None), '')
+
+
+class RecordReplayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.answers = list()
+        self.server = standin.HTTPStandIn(lambda path: self.answers.pop(0))
+        self.addCleanup(self.server.close)
+        self.filename = os.path.join(tempfile.mkdtemp(), 'traffic.log.gz')
+        self.log = list()
+
+    def fetch(self, exchange, path):
+        count = len(self.log)
+        LoggedRequest(self.server.url + path, exchange, self.log)
+        self.assertTrue(standin.wait_for(lambda: len(self.log) > count))
+        return self.log[-1]
+
+    def record(self, replies):
+        recorder = dojima.network.record.start_recording(self.filename)
+        try:
+            exchange = standin.ExchangeStandIn(
+                dojima.network.NetworkAccessManager())
+            for path, reply in replies:
+                self.answers.append((200, reply))
+                self.assertEqual(self.fetch(exchange, path), reply)
+        finally:
+            dojima.network.record.recorder = None
+            recorder.close()
+
+    def replay(self):
+        return standin.ExchangeStandIn(
+            dojima.network.replay.ReplayNetworkAccessManager(self.filename, 0))
+
+    def test_replay_serves_recorded_replies(self):
+        self.record([('ticker', '{"last": 1}'), ('depth', '{"asks": []}')])
+        exchange = self.replay()
+        self.assertEqual(self.fetch(exchange, 'depth'), '{"asks": []}')
+        self.assertEqual(self.fetch(exchange, 'ticker'), '{"last": 1}')
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_replies_are_served_in_order_and_again(self):
+        self.record([('ticker', '1'), ('ticker', '2')])
+        exchange = self.replay()
+        self.assertEqual([ self.fetch(exchange, 'ticker') for i in range(3) ],
+                         ['1', '2', '1'])
+
+    def test_unrecorded_request_fails(self):
+        self.record([('ticker', '1')])
+        self.assertIsNone(self.fetch(self.replay(), 'trades'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,182 @@
+# Dojima, a markets client.
+# Copyright (C) 2012-2013 Emery Hemingway
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+import unittest
+
+from PyQt4 import QtCore
+
+import standin
+
+standin.get_application()
+
+import dojima.network
+
+
+class ScheduledRequest(dojima.network.ExchangeRequest):
+    """A request that is only noted as sent."""
+
+    def __init__(self, parent, sent, latency_class=dojima.network.TICKER,
+                 endpoint=dojima.network.PUBLIC, stream=None, pair=None):
+        self.latency_class = latency_class
+        self.endpoint = endpoint
+        self.stream = stream
+        self.pair = pair
+        self.sent = sent
+        self.url = QtCore.QUrl('http://127.0.0.1/')
+        super(ScheduledRequest, self).__init__(parent)
+
+    def send(self):
+        self.sent.append(self)
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_burst(self):
+        bucket = dojima.network.TokenBucket(10, burst=3)
+        for i in range(3):
+            self.assertEqual(bucket.delay(), 0)
+            bucket.consume()
+        self.assertAlmostEqual(bucket.delay(), 0.1, delta=0.02)
+
+    def test_refill(self):
+        bucket = dojima.network.TokenBucket(20)
+        bucket.consume()
+        self.assertGreater(bucket.delay(), 0)
+        time.sleep(0.06)
+        self.assertEqual(bucket.delay(), 0)
+
+    def test_refill_stops_at_burst(self):
+        bucket = dojima.network.TokenBucket(1000, burst=2)
+        time.sleep(0.05)
+        bucket.consume()
+        bucket.consume()
+        self.assertGreater(bucket.delay(), 0)
+
+    def test_endpoint_budget(self):
+        host_queue = dojima.network.HostRequestQueue(1, burst=10)
+        host_queue.set_budget(dojima.network.PRIVATE, 10)
+        host_queue.consume(dojima.network.PRIVATE)
+        self.assertGreater(host_queue.delay(dojima.network.PRIVATE), 0)
+        self.assertEqual(host_queue.delay(dojima.network.PUBLIC), 0)
+
+
+class SchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        network_manager = dojima.network.NetworkAccessManager()
+        self.scheduler = network_manager.scheduler
+        # ten requests a second, one at a time
+        self.exchange = standin.ExchangeStandIn(network_manager, wait=100)
+        self.sent = list()
+
+    def request(self, **kwargs):
+        return ScheduledRequest(self.exchange, self.sent, **kwargs)
+
+    def test_idle_host_sends_at_once(self):
+        request = self.request()
+        self.assertEqual(self.sent, [request])
+        self.assertEqual(self.scheduler.pending, [])
+
+    def test_spent_host_waits_for_a_token(self):
+        first = self.request()
+        second = self.request()
+        self.assertEqual(self.sent, [first])
+        self.assertTrue(standin.wait_for(lambda: len(self.sent) == 2))
+        self.assertEqual(self.sent, [first, second])
+
+    def test_earliest_deadline_first(self):
+        self.request()
+        history = self.request(latency_class=dojima.network.HISTORY)
+        ticker = self.request(latency_class=dojima.network.TICKER)
+        order = self.request(latency_class=dojima.network.ORDER)
+        book = self.request(latency_class=dojima.network.BOOK)
+        self.assertTrue(standin.wait_for(lambda: len(self.sent) == 5))
+        self.assertEqual(self.sent[1:], [order, book, ticker, history])
+
+    def test_same_class_keeps_its_order(self):
+        self.request()
+        requests = [ self.request() for i in range(3) ]
+        self.assertTrue(standin.wait_for(lambda: len(self.sent) == 4))
+        self.assertEqual(self.sent[1:], requests)
+
+    def test_spent_endpoint_does_not_hold_others(self):
+        self.exchange = standin.ExchangeStandIn(
+            self.exchange.network_manager, hostname='burst', wait=100, burst=10)
+        self.exchange.host_queue.set_budget(dojima.network.PRIVATE, 1)
+        self.request(endpoint=dojima.network.PRIVATE)
+        private = self.request(endpoint=dojima.network.PRIVATE,
+                               latency_class=dojima.network.ORDER)
+        public = self.request()
+        self.assertNotIn(private, self.sent)
+        self.assertIn(public, self.sent)
+
+
+class SupersedeTest(unittest.TestCase):
+
+    def setUp(self):
+        network_manager = dojima.network.NetworkAccessManager()
+        self.scheduler = network_manager.scheduler
+        self.exchange = standin.ExchangeStandIn(network_manager, wait=100)
+        self.sent = list()
+        # spend the token so that the next requests are queued
+        ScheduledRequest(self.exchange, self.sent)
+
+    def poll(self, stream='ticker', pair='btc_usd'):
+        return ScheduledRequest(self.exchange, self.sent, stream=stream,
+                                pair=pair)
+
+    def test_newer_poll_drops_queued_one(self):
+        older = self.poll()
+        newer = self.poll()
+        self.assertTrue(older.superseded)
+        self.assertEqual(self.scheduler.dropped, 1)
+        self.assertTrue(standin.wait_for(lambda: newer in self.sent))
+        standin.spin(300)
+        self.assertNotIn(older, self.sent)
+        self.assertEqual(self.scheduler.pending, [])
+
+    def test_every_drop_is_counted(self):
+        polls = [ self.poll() for i in range(4) ]
+        self.assertEqual(self.scheduler.dropped, 3)
+        self.assertTrue(standin.wait_for(lambda: polls[-1] in self.sent))
+        self.assertEqual(len(self.sent), 2)
+
+    def test_other_streams_and_markets_are_kept(self):
+        polls = [ self.poll(), self.poll(pair='ltc_btc'),
+                  self.poll(stream='depth') ]
+        self.assertEqual(self.scheduler.dropped, 0)
+        self.assertTrue(standin.wait_for(lambda: len(self.sent) == 4))
+        self.assertEqual(set(self.sent[1:]), set(polls))
+
+    def test_sent_poll_is_not_superseded(self):
+        first = self.poll()
+        self.assertTrue(standin.wait_for(lambda: first in self.sent))
+        second = self.poll()
+        self.assertFalse(first.superseded)
+        self.assertEqual(self.scheduler.dropped, 0)
+        self.assertTrue(standin.wait_for(lambda: second in self.sent))
+
+    def test_requests_without_a_stream_are_kept(self):
+        requests = [ ScheduledRequest(self.exchange, self.sent)
+                     for i in range(2) ]
+        self.assertEqual(self.scheduler.dropped, 0)
+        self.assertTrue(standin.wait_for(lambda: len(self.sent) == 3))
+        self.assertEqual(self.sent[1:], requests)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+# Dojima, a markets client.
+# Copyright (C) 2012-2013 Emery Hemingway
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import builtins
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+import dojima.startup
+
+
+@dojima.startup.timed('phase')
+def phase(value):
+    return value * 2
+
+
+class StartupProfilerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='dojima-test-')
+        self.filename = os.path.join(self.directory, 'startup.json')
+        sys.path.insert(0, self.directory)
+        self.addCleanup(sys.path.remove, self.directory)
+        self.addCleanup(dojima.startup.finish)
+
+    def write_module(self, name):
+        with open(os.path.join(self.directory, name + '.py'), 'w') as f:
+            f.write('VALUE = 1\n')
+        self.addCleanup(sys.modules.pop, name, None)
+
+    def read_events(self):
+        with open(self.filename) as f:
+            trace = json.load(f)
+        return trace['traceEvents']
+
+    def test_not_recording(self):
+        self.assertIsNone(dojima.startup.profiler)
+        self.assertEqual(phase(2), 4)
+        self.assertFalse(os.path.exists(self.filename))
+
+    def test_timeline(self):
+        original_import = builtins.__import__
+        self.write_module('startup_fresh')
+        dojima.startup.start(self.filename)
+        import startup_fresh
+        # only the first import is recorded
+        import startup_fresh
+        self.assertEqual(phase(3), 6)
+        dojima.startup.finish()
+
+        self.assertIs(builtins.__import__, original_import)
+        self.assertIsNone(dojima.startup.profiler)
+
+        events = self.read_events()
+        imports = [ event for event in events
+                    if event['cat'] == 'import' and event['name'] == 'startup_fresh' ]
+        self.assertEqual(len(imports), 1)
+        self.assertEqual(imports[0]['ph'], 'X')
+        self.assertGreaterEqual(imports[0]['dur'], 0)
+
+        phases = [ event for event in events if event['name'] == 'phase' ]
+        self.assertEqual(len(phases), 1)
+        self.assertEqual(phases[0]['cat'], 'startup')
+        self.assertGreaterEqual(phases[0]['ts'], imports[0]['ts'])
+        self.assertEqual(events[-1]['name'], 'first idle')
+        self.assertEqual(events[-1]['ph'], 'i')
+
+    def test_failed_phase_is_recorded(self):
+        @dojima.startup.timed('failing')
+        def failing():
+            raise RuntimeError
+
+        dojima.startup.start(self.filename)
+        self.assertRaises(RuntimeError, failing)
+        dojima.startup.finish()
+        self.assertIn('failing', [ event['name'] for event in self.read_events() ])
+
+
+if __name__ == '__main__':
+    unittest.main()
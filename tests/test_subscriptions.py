@@ -0,0 +1,162 @@
+# Dojima, a markets client.
+# Copyright (C) 2012-2013 Emery Hemingway
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from decimal import Decimal
+
+import standin
+
+standin.get_application()
+
+import dojima.data.market
+import dojima.network
+
+
+class PolledExchange(standin.ExchangeStandIn):
+    """Notes the refreshes the subscription manager asks for."""
+
+    def __init__(self, network_manager, account=True):
+        super(PolledExchange, self).__init__(network_manager, burst=100)
+        self.account = account
+        self.refreshed = list()
+        self.ticker_proxies = dict()
+
+    def getTickerProxy(self, market):
+        if market not in self.ticker_proxies:
+            self.ticker_proxies[market] = dojima.data.market.TickerProxyDecimal()
+        return self.ticker_proxies[market]
+
+    def hasAccount(self, market):
+        return self.account
+
+    def __getattr__(self, name):
+        if not name.startswith('refresh'):
+            raise AttributeError(name)
+        return lambda market: self.refreshed.append((name, market))
+
+
+class MarketStreamStandIn(object):
+    live = True
+
+
+class SubscriptionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.subscription = dojima.network.Subscription(None, 'btc_usd',
+                                                        'depth', 40)
+
+    def test_changed_replies_shorten_the_interval(self):
+        self.subscription.changed()
+        self.assertAlmostEqual(self.subscription.interval,
+                               40 * dojima.network.CHANGED_FACTOR)
+        for i in range(20):
+            self.subscription.changed()
+        self.assertAlmostEqual(self.subscription.interval,
+                               40 * dojima.network.FASTEST)
+
+    def test_repeated_replies_lengthen_the_interval(self):
+        self.subscription.repeated()
+        self.assertAlmostEqual(self.subscription.interval,
+                               40 * dojima.network.REPEATED_FACTOR)
+        for i in range(20):
+            self.subscription.repeated()
+        self.assertAlmostEqual(self.subscription.interval,
+                               40 * dojima.network.SLOWEST)
+
+    def test_interval_has_a_floor(self):
+        subscription = dojima.network.Subscription(None, 'btc_usd', 'ticker', 8)
+        for i in range(20):
+            subscription.changed()
+        self.assertEqual(subscription.interval, dojima.network.MINIMUM_INTERVAL)
+
+    def test_price_move(self):
+        self.subscription.moved(Decimal('100'))
+        self.assertEqual(self.subscription.interval, 40)
+        self.subscription.moved(Decimal('100.1'))
+        self.assertEqual(self.subscription.interval, 40)
+        self.subscription.moved(Decimal('101'))
+        self.assertAlmostEqual(self.subscription.interval,
+                               40 * dojima.network.MOVED_FACTOR)
+
+
+class SubscriptionManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        network_manager = dojima.network.NetworkAccessManager()
+        self.manager = network_manager.subscriptions
+        self.exchange = PolledExchange(network_manager)
+
+    def test_subscriptions_are_counted(self):
+        self.manager.subscribe(self.exchange, 'btc_usd', 'depth')
+        self.manager.subscribe(self.exchange, 'btc_usd', 'depth')
+        self.manager.unsubscribe(self.exchange, 'btc_usd', 'depth')
+        self.assertTrue(self.manager.is_subscribed(self.exchange, 'depth'))
+        self.manager.unsubscribe(self.exchange, 'btc_usd', 'depth')
+        self.assertFalse(self.manager.is_subscribed(self.exchange, 'depth'))
+        self.assertFalse(self.manager.timer.isActive())
+
+    def test_new_subscription_is_polled_at_once(self):
+        self.manager.subscribe(self.exchange, 'btc_usd', 'depth')
+        self.manager.subscribe(self.exchange, 'btc_usd', 'trades')
+        self.assertTrue(standin.wait_for(lambda: len(self.exchange.refreshed) == 2))
+        self.assertEqual(sorted(self.exchange.refreshed),
+                         [('refreshDepth', 'btc_usd'), ('refreshTrades', 'btc_usd')])
+
+    def test_observe(self):
+        self.manager.subscribe(self.exchange, 'btc_usd', 'depth')
+        subscription = self.manager.subscriptions[
+            (self.exchange, 'btc_usd', 'depth')]
+        base = subscription.interval
+        self.manager.observe(self.exchange, 'depth', 'btc_usd', 1)
+        self.assertLess(subscription.interval, base)
+        interval = subscription.interval
+        self.manager.observe(self.exchange, 'depth', 'btc_usd', 1)
+        self.assertGreater(subscription.interval, interval)
+        interval = subscription.interval
+        # a reply the cache found unchanged
+        self.manager.observe(self.exchange, 'depth', 'btc_usd', None)
+        self.assertGreater(subscription.interval, interval)
+
+    def test_tickers_wait_while_the_stream_is_live(self):
+        self.exchange.market_stream = MarketStreamStandIn()
+        self.manager.subscribe(self.exchange, 'btc_usd', 'ticker')
+        self.manager.subscribe(self.exchange, 'btc_usd', 'depth')
+        self.assertTrue(standin.wait_for(lambda: self.exchange.refreshed))
+        standin.spin(50)
+        self.assertEqual(self.exchange.refreshed, [('refreshDepth', 'btc_usd')])
+
+    def test_private_streams_need_an_account(self):
+        self.exchange.account = False
+        self.manager.subscribe(self.exchange, 'btc_usd', 'balance')
+        self.manager.subscribe(self.exchange, 'btc_usd', 'depth')
+        self.assertTrue(standin.wait_for(lambda: self.exchange.refreshed))
+        standin.spin(50)
+        self.assertEqual(self.exchange.refreshed, [('refreshDepth', 'btc_usd')])
+
+    def test_tickers_are_batched(self):
+        self.exchange.refreshTickers = (
+            lambda markets: self.exchange.refreshed.append(('refreshTickers', markets)))
+        for market in ('ltc_btc', 'btc_usd'):
+            self.manager.subscribe(self.exchange, market, 'ticker')
+        self.assertTrue(standin.wait_for(lambda: self.exchange.refreshed))
+        standin.spin(50)
+        self.assertEqual(self.exchange.refreshed,
+                         [('refreshTickers', ['btc_usd', 'ltc_btc'])])
+
+
+if __name__ == '__main__':
+    unittest.main()
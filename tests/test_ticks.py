@@ -0,0 +1,144 @@
+# Dojima, a markets client.
+# Copyright (C) 2012-2013 Emery Hemingway
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import standin
+standin.get_application()
+
+import dojima.data.market
+import dojima.data.ticks
+
+
+def ticker(epochs):
+    records = np.zeros(len(epochs), dtype=dojima.data.ticks.DTYPES['ticker'])
+    records['epoch'] = epochs
+    records['last'] = np.arange(len(epochs))
+    return records
+
+
+class TickStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        # small chunks, so that a few records cross chunk boundaries
+        chunk_rows = dojima.data.ticks.CHUNK_ROWS
+        dojima.data.ticks.CHUNK_ROWS = 4
+        self.addCleanup(setattr, dojima.data.ticks, 'CHUNK_ROWS', chunk_rows)
+        self.directory = tempfile.mkdtemp(prefix='dojima-test-')
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def open(self, kind='ticker'):
+        return dojima.data.ticks.TickStore(self.directory, kind)
+
+    def chunk_files(self):
+        return sorted(os.listdir(self.directory))
+
+    def test_append_across_chunks(self):
+        store = self.open()
+        store.append(ticker(range(0, 60, 10)))
+        store.append(ticker(range(60, 100, 10)))
+        self.assertEqual(len(store), 10)
+        self.assertEqual(store.firsts, [0, 40, 80])
+        self.assertEqual(len(self.chunk_files()), 3)
+
+        self.assertEqual(store.read()['epoch'].tolist(), list(range(0, 100, 10)))
+        self.assertEqual(store.read(25, 75)['epoch'].tolist(), [30, 40, 50, 60, 70])
+        self.assertEqual(store.read(40, 40).size, 0)
+        self.assertEqual(store.read(None, 20)['epoch'].tolist(), [0, 10])
+        self.assertEqual(store.tail(6)['epoch'].tolist(), [40, 50, 60, 70, 80, 90])
+        self.assertEqual(store.tail(20).size, 10)
+
+    def test_reopen(self):
+        self.open().append(ticker([1, 2, 3, 4, 5]))
+        store = self.open()
+        self.assertEqual(store.last_epoch, 5)
+        self.assertEqual(len(store), 5)
+        store.append(ticker([6, 7, 8, 9]))
+        self.assertEqual(store.read()['epoch'].tolist(), list(range(1, 10)))
+        self.assertEqual(store.firsts, [1, 5, 9])
+
+    def test_late_records(self):
+        store = self.open()
+        store.append(ticker(range(10, 110, 10)))
+        # late records are merged in order, the ones in time appended
+        store.append(ticker([120, 35, 5, 110]))
+        epochs = store.read()['epoch'].tolist()
+        self.assertEqual(epochs, sorted(epochs))
+        self.assertEqual(epochs[:5], [5, 10, 20, 30, 35])
+        self.assertEqual(epochs[-2:], [110, 120])
+        self.assertEqual(len(store), 14)
+        # the first chunk is named by its new first epoch
+        self.assertEqual(store.firsts[0], 5)
+        self.assertEqual(self.chunk_files()[0], '{:020d}.ticks'.format(5))
+        self.assertEqual(self.open().read()['epoch'].tolist(), epochs)
+
+    def test_late_record_in_full_chunk(self):
+        store = self.open()
+        store.append(ticker(range(0, 120, 10)))
+        # the full first chunk is mapped and kept before the merge
+        self.assertEqual(store.read(0, 40).size, 4)
+        store.append(ticker([15]))
+        self.assertEqual(store.read(0, 40)['epoch'].tolist(), [0, 10, 15, 20, 30])
+
+    def test_prune(self):
+        store = self.open()
+        store.append(ticker(range(0, 120, 10)))
+        store.prune(65)
+        self.assertEqual(store.firsts, [40, 80])
+        self.assertEqual(len(self.chunk_files()), 2)
+        # the last chunk is kept however old
+        store.prune(1000)
+        self.assertEqual(store.firsts, [80])
+        self.assertEqual(store.read()['epoch'].tolist(), [80, 90, 100, 110])
+
+    def test_retention(self):
+        now = dojima.data.ticks.now()
+        day = 24 * 60 * 60 * 1000
+        store = dojima.data.ticks.TickStore(self.directory, 'ticker', 2 * day)
+        store.append(ticker([now - 5 * day + i for i in range(4)]))
+        self.assertEqual(len(store), 4)
+        # starting a chunk removes those past the retention
+        store.append(ticker([now - day + i for i in range(4)]))
+        self.assertEqual(store.firsts, [now - day])
+        store.append(ticker([now]))
+        self.assertEqual(store.firsts, [now - day, now])
+        # as does opening the store
+        self.assertEqual(dojima.data.ticks.TickStore(
+            self.directory, 'ticker', day // 2).firsts, [now])
+
+    def test_read_trades(self):
+        store = self.open('trades')
+        records = np.zeros(5, dtype=dojima.data.ticks.DTYPES['trades'])
+        records['epoch'] = np.arange(5) * 1000
+        records['price'] = dojima.data.ticks.to_fixed(np.arange(5) + 100.5)
+        records['id'] = np.arange(5) + 1
+        store.append(records)
+        trades = store.readTrades(3)
+        self.assertEqual(trades[dojima.data.market.ID].tolist(), [5, 4, 3])
+        self.assertEqual(trades[dojima.data.market.PRICE].tolist(),
+                         [104.5, 103.5, 102.5])
+        self.assertTrue(np.allclose(
+            dojima.data.market.num2epoch(trades[dojima.data.market.DATE]),
+            [4, 3, 2]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,235 @@
+# Dojima, a markets client.
+# Copyright (C) 2012-2013 Emery Hemingway
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import base64
+import struct
+import time
+import unittest
+
+from PyQt4 import QtCore
+
+import standin
+
+standin.get_application()
+
+import dojima.network.stream
+import dojima.network.websocket as websocket
+
+
+class WebSocketTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = standin.WebSocketStandIn()
+        self.addCleanup(self.server.close)
+        self.socket = self.open(self.server)
+
+    def open(self, server):
+        socket = websocket.WebSocket()
+        self.messages = list()
+        self.errors = list()
+        self.events = list()
+        socket.message.connect(self.messages.append)
+        socket.error.connect(self.errors.append)
+        socket.opened.connect(lambda: self.events.append('opened'))
+        socket.closed.connect(lambda: self.events.append('closed'))
+        socket.open(QtCore.QUrl(server.url + 'stream?channel=ticker'))
+        return socket
+
+    def connection(self):
+        self.assertTrue(standin.wait_for(lambda: 'opened' in self.events))
+        return self.server.connections[0]
+
+    def frames(self, connection, count):
+        self.assertTrue(standin.wait_for(lambda: len(connection.frames) >= count))
+        return connection.frames
+
+    def test_handshake(self):
+        connection = self.connection()
+        request = connection.request
+        self.assertEqual(request[0], 'GET /stream?channel=ticker HTTP/1.1')
+        headers = dict((name.lower(), value.strip()) for name, _, value in
+                       (line.partition(':') for line in request[1:]))
+        port = self.server.server.serverPort()
+        self.assertEqual(headers['host'], '127.0.0.1:{}'.format(port))
+        self.assertEqual(headers['upgrade'], 'websocket')
+        self.assertEqual(headers['connection'], 'Upgrade')
+        self.assertEqual(headers['sec-websocket-version'], '13')
+        self.assertEqual(len(base64.b64decode(headers['sec-websocket-key'])), 16)
+        self.assertEqual(self.errors, [])
+
+    def test_refused_handshake(self):
+        server = standin.WebSocketStandIn(accept=False)
+        self.addCleanup(server.close)
+        self.open(server)
+        self.assertTrue(standin.wait_for(lambda: self.errors))
+        self.assertNotIn('opened', self.events)
+
+    def test_sent_frames_are_masked(self):
+        connection = self.connection()
+        for text in ('hello', 'x' * 300, 'y' * 70000):
+            self.socket.send(text)
+        frames = self.frames(connection, 3)
+        for frame, text in zip(frames, ('hello', 'x' * 300, 'y' * 70000)):
+            self.assertEqual(frame, (True, websocket.TEXT, True, text.encode()))
+
+    def test_message(self):
+        connection = self.connection()
+        connection.send(websocket.TEXT, b'{"last": 101.5}')
+        connection.send(websocket.TEXT, 'z'.encode() * 300)
+        self.assertTrue(standin.wait_for(lambda: len(self.messages) == 2))
+        self.assertEqual(self.messages, ['{"last": 101.5}', 'z' * 300])
+
+    def test_masked_message(self):
+        connection = self.connection()
+        connection.send(websocket.TEXT, b'masked', key=b'\x01\x02\x03\x04')
+        self.assertTrue(standin.wait_for(lambda: self.messages))
+        self.assertEqual(self.messages, ['masked'])
+
+    def test_frame_split_across_reads(self):
+        connection = self.connection()
+        frame = standin.encode_frame(websocket.TEXT, b'a' * 200)
+        for start in range(0, len(frame), 3):
+            connection.write(frame[start:start + 3])
+            standin.spin(1)
+        self.assertTrue(standin.wait_for(lambda: self.messages))
+        self.assertEqual(self.messages, ['a' * 200])
+
+    def test_fragmented_message(self):
+        connection = self.connection()
+        connection.send(websocket.TEXT, b'hel', final=False)
+        connection.send(websocket.CONTINUATION, b'lo ', final=False)
+        # control frames may come between the fragments of a message
+        connection.send(websocket.PING, b'')
+        connection.send(websocket.CONTINUATION, b'world')
+        self.assertTrue(standin.wait_for(lambda: self.messages))
+        self.assertEqual(self.messages, ['hello world'])
+
+    def test_ping(self):
+        connection = self.connection()
+        connection.send(websocket.PING, b'are you there')
+        frames = self.frames(connection, 1)
+        self.assertEqual(frames[0], (True, websocket.PONG, True, b'are you there'))
+        self.assertEqual(self.messages, [])
+
+    def test_closed_by_server(self):
+        connection = self.connection()
+        connection.send(websocket.CLOSE, struct.pack('!H', 1001))
+        self.assertTrue(standin.wait_for(lambda: 'closed' in self.events))
+        frames = self.frames(connection, 1)
+        self.assertEqual(frames[0][1], websocket.CLOSE)
+        self.assertEqual(frames[0][3], struct.pack('!H', 1001))
+
+    def test_close(self):
+        connection = self.connection()
+        self.socket.close()
+        frames = self.frames(connection, 1)
+        self.assertEqual(frames[0], (True, websocket.CLOSE, True,
+                                     struct.pack('!H', 1000)))
+        self.assertTrue(standin.wait_for(lambda: connection.disconnected))
+
+
+class ChannelStream(dojima.network.stream.MarketStream):
+    channels = ('ticker', 'trades')
+
+    def __init__(self, url):
+        super(ChannelStream, self).__init__(url=url)
+        self.messages = list()
+
+    def _subscribe(self, channel):
+        self.send('subscribe ' + channel)
+
+    def _handle_message(self, message):
+        if message == 'ready':
+            self._ready()
+        else:
+            self.messages.append(message)
+
+
+class MarketStreamTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = standin.WebSocketStandIn()
+        self.addCleanup(self.server.close)
+        self.stream = ChannelStream(QtCore.QUrl(self.server.url))
+        self.addCleanup(self.stream.close)
+        self.live = list()
+        self.stream.liveChanged.connect(self.live.append)
+        self.stream.open()
+
+    def connection(self, count):
+        """Wait for the count-th connection and return it and when it was
+        made."""
+        self.assertTrue(standin.wait_for(
+            lambda: len(self.server.connections) >= count and
+                    self.server.connections[count - 1].request is not None,
+            timeout=10))
+        return self.server.connections[count - 1], time.monotonic()
+
+    def subscribe(self, connection):
+        connection.send(websocket.TEXT, b'ready')
+        self.assertTrue(standin.wait_for(lambda: len(connection.frames) >= 2))
+        self.assertEqual([ frame[3] for frame in connection.frames ],
+                         [b'subscribe ticker', b'subscribe trades'])
+        self.assertTrue(self.stream.live)
+
+    def test_messages(self):
+        connection, opened = self.connection(1)
+        self.subscribe(connection)
+        connection.send(websocket.TEXT, b'tick')
+        self.assertTrue(standin.wait_for(lambda: self.stream.messages))
+        self.assertEqual(self.stream.messages, ['tick'])
+        self.assertEqual(self.live, [True])
+
+    def test_reconnect_with_backoff(self):
+        connection, opened = self.connection(1)
+        self.subscribe(connection)
+
+        connection.drop()
+        self.assertTrue(standin.wait_for(lambda: not self.stream.live))
+        dropped = time.monotonic()
+        self.assertEqual(self.stream.retry_timer.interval(),
+                         dojima.network.stream.MINIMUM_RETRY * 1000)
+        connection, opened = self.connection(2)
+        self.assertGreaterEqual(opened - dropped, 0.9)
+
+        # dropped again before it was subscribed, so the wait doubles
+        connection.drop()
+        self.assertTrue(standin.wait_for(
+            lambda: self.stream.retry_timer.isActive()))
+        dropped = time.monotonic()
+        self.assertEqual(self.stream.retry_timer.interval(),
+                         dojima.network.stream.MINIMUM_RETRY * 2000)
+        connection, opened = self.connection(3)
+        self.assertGreaterEqual(opened - dropped, 1.9)
+
+        # and once subscribed again the wait starts over
+        self.subscribe(connection)
+        self.assertEqual(self.stream.retry, dojima.network.stream.MINIMUM_RETRY)
+        self.assertEqual(self.live, [True, False, True])
+
+    def test_close_stops_reconnecting(self):
+        connection, opened = self.connection(1)
+        self.subscribe(connection)
+        self.stream.close()
+        self.assertTrue(standin.wait_for(lambda: connection.disconnected))
+        self.assertFalse(self.stream.retry_timer.isActive())
+        standin.spin(1500)
+        self.assertEqual(len(self.server.connections), 1)
+        self.assertEqual(self.live, [True, False])
+
+
+if __name__ == '__main__':
+    unittest.main()